@@ -0,0 +1,253 @@
+# encoding: utf-8
+
+"""Prueba de carga de la descarga de archivos TMY contra un servidor simulado
+
+Arranca el servidor local que simula PV-GIS (pvgis_stub.py), con límite de
+peticiones por segundo e inyección de latencia, errores 5xx y respuestas
+truncadas, y descarga los archivos TMY de un conjunto de localizaciones
+aleatorias en España peninsular:
+
+- modo "direct": con `download_file` desde varios hilos
+- modo "snakemake": con las reglas de descarga del Snakefile
+  (download_tmy_all), en una carpeta de trabajo temporal y con
+  `--max-jobs-per-second`
+
+Informa del número de archivos descargados por segundo, de las respuestas de
+cada tipo del servidor, de los reintentos necesarios y de la corrección de las
+descargas, leyendo cada archivo con `read_tmy_data` y comparándolo con el
+contenido esperado.
+"""
+
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from compute_indicators import read_tmy_data
+from download_file import download_file
+from pvgis_stub import PVGIS_RATE_LIMIT, PVGISStub, synthetic_tmy
+
+URL = "{}/api/v5_2/tmy?lat={}&lon={}&outputformat=csv&startyear=2005&endyear=2020"
+
+
+def sample_locations(size, seed=0):
+    """Genera localizaciones aleatorias con el formato de data/output/Municipios.csv"""
+    rng = np.random.default_rng(seed)
+    cod_ine = ["99{:03d}000000".format(i) for i in range(size)]
+    return pd.DataFrame(
+        {
+            "COD_INE": cod_ine,
+            "COD_PROV": "99",
+            "PROVINCIA": "Prueba",
+            "NOMBRE_ACTUAL": ["Municipio {}".format(i) for i in range(size)],
+            "POBLACION_MUNI": 1000,
+            "LONGITUD_ETRS89": np.round(rng.uniform(-8.5, 3.0, size), 6),
+            "LATITUD_ETRS89": np.round(rng.uniform(37.0, 43.5, size), 6),
+            "ALTITUD": 500.0,
+            "ARCHIVO_TMY": [
+                "{}_Municipio {}.csv".format(c, i) for i, c in enumerate(cod_ine)
+            ],
+        }
+    )
+
+
+def check_downloads(df, tmy_dir):
+    """Comprueba los archivos TMY descargados en tmy_dir
+
+    Devuelve el número de archivos que faltan y de archivos incorrectos.
+    """
+    missing = 0
+    wrong = 0
+    for loc in df.to_dict("records"):
+        filename = os.path.join(tmy_dir, loc["ARCHIVO_TMY"])
+        if not os.path.exists(filename):
+            missing += 1
+            continue
+        data = read_tmy_data(filename)
+        with open(filename, "rb") as f:
+            content = f.read()
+        if (
+            len(data["data"]) != 8760
+            or data["lat"] != round(loc["LATITUD_ETRS89"], 3)
+            or data["long"] != round(loc["LONGITUD_ETRS89"], 3)
+            or content != synthetic_tmy(loc["LATITUD_ETRS89"], loc["LONGITUD_ETRS89"])
+        ):
+            wrong += 1
+    return missing, wrong
+
+
+def run_direct(server, df, tmy_dir, jobs, retries, backoff):
+    """Descarga los archivos TMY de df con download_file desde jobs hilos"""
+
+    def download(loc):
+        link = URL.format(server.url, loc["LATITUD_ETRS89"], loc["LONGITUD_ETRS89"])
+        try:
+            download_file(
+                link,
+                os.path.join(tmy_dir, loc["ARCHIVO_TMY"]),
+                retries=retries,
+                backoff=backoff,
+            )
+        except IOError as e:
+            print(e)
+
+    with ThreadPoolExecutor(jobs) as executor:
+        list(executor.map(download, df.to_dict("records")))
+
+
+def run_snakemake(server, df, workdir, jobs, max_jobs_per_second):
+    """Descarga los archivos TMY de df con las reglas de descarga del Snakefile"""
+    basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    snakefile = os.path.join(basedir, "Snakefile")
+    os.makedirs(os.path.join(workdir, "data/ign"))
+    os.makedirs(os.path.join(workdir, "data/output"))
+    # El archivo del IGN y la copia de la versión anterior (vacía) solo son
+    # necesarios para que existan las entradas de select_input, más antiguas
+    # que el archivo de municipios
+    open(os.path.join(workdir, "data/ign/MUNICIPIOS.csv"), "w").close()
+    time.sleep(0.01)
+    open(os.path.join(workdir, "data/output/MunicipiosAnterior.csv"), "w").close()
+    time.sleep(0.01)
+    df.to_csv(os.path.join(workdir, "data/output/Municipios.csv"), index=False)
+    subprocess.run(
+        [
+            "snakemake",
+            "-s",
+            snakefile,
+            "--cores",
+            str(jobs),
+            "--max-jobs-per-second",
+            str(max_jobs_per_second),
+            "--keep-going",
+            "--quiet",
+            "--config",
+            "pvgis_url={}".format(server.url),
+            "--",
+            "data/output/tmy/downloads.done",
+        ],
+        cwd=workdir,
+        check=False,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="bench_downloads",
+        description="Prueba de carga de la descarga de archivos TMY contra un servidor PV-GIS simulado",
+    )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        choices=["direct", "snakemake"],
+        help="Descarga con download_file (direct) o con las reglas de Snakemake (snakemake). Valor por defecto direct",
+        default="direct",
+    )
+    parser.add_argument(
+        "-n",
+        "--size",
+        type=int,
+        help="Número de archivos. Valor por defecto 300",
+        default=300,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Número de descargas simultáneas. Valor por defecto 16",
+        default=16,
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        help="Límite de peticiones por segundo del servidor. Valor por defecto {}".format(
+            PVGIS_RATE_LIMIT
+        ),
+        default=PVGIS_RATE_LIMIT,
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        type=float,
+        help="Latencia máxima (s) de cada respuesta. Valor por defecto 0.2",
+        default=0.2,
+    )
+    parser.add_argument(
+        "-e",
+        "--error_rate",
+        type=float,
+        help="Probabilidad de error 5xx. Valor por defecto 0.05",
+        default=0.05,
+    )
+    parser.add_argument(
+        "-t",
+        "--truncate_rate",
+        type=float,
+        help="Probabilidad de respuesta truncada. Valor por defecto 0.02",
+        default=0.02,
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help="Número máximo de reintentos de cada descarga (modo direct). Valor por defecto 5",
+        default=5,
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        help="Espera (s) antes del primer reintento (modo direct). Valor por defecto 0.2",
+        default=0.2,
+    )
+    parser.add_argument(
+        "--max_jobs_per_second",
+        type=float,
+        help="Valor de --max-jobs-per-second de Snakemake (modo snakemake). Valor por defecto 29",
+        default=29,
+    )
+    args = parser.parse_args()
+
+    df = sample_locations(args.size)
+    # Genera previamente el contenido de los archivos para no medir su coste
+    for loc in df.to_dict("records"):
+        synthetic_tmy(loc["LATITUD_ETRS89"], loc["LONGITUD_ETRS89"])
+    server = PVGISStub(
+        rate=args.rate,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate,
+        seed=0,
+    ).start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        tmy_dir = os.path.join(workdir, "data/output/tmy")
+        start = time.perf_counter()
+        if args.mode == "direct":
+            os.makedirs(tmy_dir)
+            run_direct(server, df, tmy_dir, args.jobs, args.retries, args.backoff)
+        else:
+            run_snakemake(server, df, workdir, args.jobs, args.max_jobs_per_second)
+        elapsed = time.perf_counter() - start
+        missing, wrong = check_downloads(df, tmy_dir)
+    server.shutdown()
+
+    stats = server.stats
+    downloaded = args.size - missing
+    retries = stats["requests"] - downloaded
+    print(
+        "Modo {}: {} archivos en {:.1f} s ({:.1f} archivos/s)".format(
+            args.mode, downloaded, elapsed, downloaded / elapsed
+        )
+    )
+    print("Respuestas del servidor: {}".format(stats))
+    print(
+        "Reintentos: {} ({:.2f} por archivo)".format(
+            retries, retries / max(downloaded, 1)
+        )
+    )
+    print("Archivos que faltan: {}, archivos incorrectos: {}".format(missing, wrong))
@@ -0,0 +1,250 @@
+# encoding: utf-8
+
+"""Compara dos archivos de resultados de zonificación climática
+
+Compara dos archivos `Results.csv` (por ejemplo, antes y después de un cambio
+en las fórmulas, los datos de entrada o el periodo de datos de PV-GIS),
+emparejando los municipios por su COD_INE, e informa de:
+
+- municipios presentes solo en uno de los archivos
+- indicadores (GD_I, GD_V, n_N, SCI, SCV) con diferencias mayores que la
+  tolerancia de cada columna
+- cambios de zona climática de invierno (ZCI_TMY) y de verano (ZCV_TMY) por
+  provincia, en número de municipios y en población (POBLACION_MUNI)
+- municipios con mayores cambios (de nivel de zona y de severidad)
+
+Solo se leen las columnas necesarias para la comparación.
+"""
+
+import numpy as np
+import pandas as pd
+
+from compute_indicators import zci_level_array
+
+# Tolerancias por defecto (diferencia absoluta admisible) de los indicadores
+DEFAULT_TOLERANCES = {
+    "GD_I": 0.1,
+    "GD_V": 0.1,
+    "n_N": 0.001,
+    "SCI": 0.0,
+    "SCV": 0.0,
+}
+
+KEY_COLUMNS = ["COD_INE", "COD_PROV", "PROVINCIA", "NOMBRE_ACTUAL", "POBLACION_MUNI"]
+ZONE_COLUMNS = ["ZCI_TMY", "ZCV_TMY"]
+
+
+def load_results(results_filename, indicators=DEFAULT_TOLERANCES):
+    """Lee las columnas necesarias para la comparación de un archivo de resultados"""
+    return pd.read_csv(
+        results_filename,
+        usecols=KEY_COLUMNS + list(indicators) + ZONE_COLUMNS,
+        dtype={
+            "COD_INE": str,
+            "COD_PROV": str,
+            "PROVINCIA": str,
+            "NOMBRE_ACTUAL": str,
+            "POBLACION_MUNI": int,
+            "ZCI_TMY": str,
+            "ZCV_TMY": int,
+            **{col: float for col in indicators},
+        },
+    )
+
+
+def compare_results(old, new, tolerances=DEFAULT_TOLERANCES):
+    """Compara dos dataframes de resultados
+
+    Devuelve una tupla con:
+
+    - dataframe de municipios comunes, con los valores de cada indicador en
+      ambos resultados (sufijos _OLD y _NEW), su diferencia (sufijo _DELTA),
+      si la diferencia supera la tolerancia (sufijo _CAMBIA) y las diferencias
+      de nivel de zona climática ZCI_DELTA y ZCV_DELTA
+    - dataframe de municipios que solo están en old
+    - dataframe de municipios que solo están en new
+    """
+    merged = old.merge(
+        new.drop(columns=KEY_COLUMNS[1:]),
+        on="COD_INE",
+        how="outer",
+        suffixes=("_OLD", "_NEW"),
+        indicator=True,
+    )
+    only_old = merged.loc[merged["_merge"] == "left_only", ["COD_INE"]]
+    only_old = only_old.merge(old, on="COD_INE")
+    only_new = merged.loc[merged["_merge"] == "right_only", ["COD_INE"]]
+    only_new = only_new.merge(new, on="COD_INE")
+    diff = merged[merged["_merge"] == "both"].drop(columns="_merge")
+    diff = diff.reset_index(drop=True)
+    # La unión externa convierte en float las columnas enteras
+    int_columns = ["POBLACION_MUNI", "ZCV_TMY_OLD", "ZCV_TMY_NEW"]
+    diff[int_columns] = diff[int_columns].astype(int)
+
+    for col, tol in tolerances.items():
+        delta = diff[col + "_NEW"] - diff[col + "_OLD"]
+        diff[col + "_DELTA"] = delta
+        # Se usa una pequeña holgura para evitar falsos cambios por redondeo
+        diff[col + "_CAMBIA"] = np.abs(delta) > tol + 1e-9
+
+    diff["ZCI_DELTA"] = zci_level_array(diff["ZCI_TMY_NEW"]) - zci_level_array(
+        diff["ZCI_TMY_OLD"]
+    )
+    diff["ZCV_DELTA"] = diff["ZCV_TMY_NEW"] - diff["ZCV_TMY_OLD"]
+    return diff, only_old, only_new
+
+
+def province_report(diff):
+    """Resumen por provincia de los cambios de zona climática
+
+    Incluye número de municipios y población totales y con cambio de ZCI, de
+    ZCV o de ambas, además del porcentaje de población afectada.
+    """
+    pop = diff["POBLACION_MUNI"]
+    zci = diff["ZCI_DELTA"] != 0
+    zcv = diff["ZCV_DELTA"] != 0
+    any_change = zci | zcv
+    report = (
+        pd.DataFrame(
+            {
+                "COD_PROV": diff["COD_PROV"],
+                "PROVINCIA": diff["PROVINCIA"],
+                "MUNICIPIOS": 1,
+                "POBLACION": pop,
+                "CAMBIOS_ZCI": zci.astype(int),
+                "CAMBIOS_ZCV": zcv.astype(int),
+                "CAMBIOS_ZC": any_change.astype(int),
+                "POBLACION_ZCI": pop * zci,
+                "POBLACION_ZCV": pop * zcv,
+                "POBLACION_ZC": pop * any_change,
+            }
+        )
+        .groupby(["COD_PROV", "PROVINCIA"], sort=True)
+        .sum()
+        .reset_index()
+    )
+    report["PCT_POBLACION_ZC"] = (
+        100.0 * report["POBLACION_ZC"] / report["POBLACION"].where(report["POBLACION"] > 0)
+    ).round(2)
+    return report
+
+
+def top_movers(diff, n=20):
+    """Municipios con mayores cambios
+
+    Se ordenan por magnitud del cambio de nivel de zona (ZCI + ZCV) y, a
+    igualdad de este, por magnitud del cambio de severidades (SCI + SCV).
+    """
+    zone_change = diff["ZCI_DELTA"].abs() + diff["ZCV_DELTA"].abs()
+    sev_change = diff["SCI_DELTA"].abs() + diff["SCV_DELTA"].abs()
+    order = np.lexsort((-sev_change.to_numpy(), -zone_change.to_numpy()))[:n]
+    columns = [
+        "COD_INE",
+        "PROVINCIA",
+        "NOMBRE_ACTUAL",
+        "POBLACION_MUNI",
+        "ZCI_TMY_OLD",
+        "ZCI_TMY_NEW",
+        "ZCV_TMY_OLD",
+        "ZCV_TMY_NEW",
+        "SCI_DELTA",
+        "SCV_DELTA",
+    ]
+    return diff.iloc[order][columns].reset_index(drop=True)
+
+
+def parse_tolerances(items):
+    """Convierte una lista de cadenas COLUMNA=TOLERANCIA en diccionario de tolerancias"""
+    tolerances = dict(DEFAULT_TOLERANCES)
+    for item in items or []:
+        col, _, value = item.partition("=")
+        if col not in tolerances:
+            raise ValueError(
+                "Columna '{}' no válida. Columnas admitidas: {}".format(
+                    col, ", ".join(tolerances)
+                )
+            )
+        tolerances[col] = float(value)
+    return tolerances
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(
+        prog="compare_results",
+        description="Compara dos archivos de resultados de zonificación climática",
+    )
+    parser.add_argument("old", type=str, help="Archivo de resultados de referencia")
+    parser.add_argument("new", type=str, help="Archivo de resultados a comparar")
+    parser.add_argument(
+        "-t",
+        "--tol",
+        type=str,
+        nargs="*",
+        help="Tolerancias por columna, como COLUMNA=VALOR (p.e. SCI=0.01 GD_I=1)",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        help="Número de municipios con mayores cambios a mostrar. Valor por defecto 20",
+        default=20,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        help="Carpeta opcional en la que guardar los informes en formato .csv",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    tolerances = parse_tolerances(args.tol)
+    diff, only_old, only_new = compare_results(
+        load_results(args.old, tolerances), load_results(args.new, tolerances), tolerances
+    )
+    report = province_report(diff)
+    movers = top_movers(diff, args.top)
+
+    print("Municipios comparados: {}".format(len(diff)))
+    print("Municipios solo en {}: {}".format(args.old, len(only_old)))
+    print("Municipios solo en {}: {}".format(args.new, len(only_new)))
+    print("\nIndicadores con diferencias mayores que la tolerancia:")
+    for col, tol in tolerances.items():
+        print(
+            "\t{}: {} municipios (tolerancia {}, diferencia máxima {:.3f})".format(
+                col,
+                int(diff[col + "_CAMBIA"].sum()),
+                tol,
+                diff[col + "_DELTA"].abs().max(),
+            )
+        )
+    total_pop = diff["POBLACION_MUNI"].sum()
+    for zone in ["ZCI", "ZCV"]:
+        changed = diff[zone + "_DELTA"] != 0
+        print(
+            "\nCambios de {}: {} municipios, {} habitantes ({:.2f}% de la población)".format(
+                zone,
+                int(changed.sum()),
+                int(diff.loc[changed, "POBLACION_MUNI"].sum()),
+                100.0 * diff.loc[changed, "POBLACION_MUNI"].sum() / total_pop,
+            )
+        )
+        if changed.any():
+            counts = diff.loc[changed, zone + "_DELTA"].value_counts().sort_index()
+            print(counts.to_string())
+
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print("\nCambios por provincia:")
+        print(report[report["CAMBIOS_ZC"] > 0].to_string(index=False))
+        print("\nMunicipios con mayores cambios:")
+        print(movers.to_string(index=False))
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+        report.to_csv(os.path.join(args.output_dir, "Cambios_provincias.csv"), index=False)
+        movers.to_csv(os.path.join(args.output_dir, "Cambios_municipios.csv"), index=False)
+        changed = diff[(diff["ZCI_DELTA"] != 0) | (diff["ZCV_DELTA"] != 0)]
+        changed.to_csv(os.path.join(args.output_dir, "Cambios_zonas.csv"), index=False)
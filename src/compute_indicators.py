@@ -15,6 +15,15 @@ Para cada municipio, lee el archivo `data/output/tmy/$[COD_INE}.tmy` y calcula:
     - ZCI_TMY: zona climática de invierno (a, A, B, C, D, E) obtenida de datos TMY
     - ZCV_TMY: zona climática de verano (1, 2, 3, 4) obtenida de datos TMY
 
+- Indicadores de humedad de verano (meses de junio a septiembre), obtenidos a
+  partir de la temperatura, humedad relativa y presión de los archivos TMY:
+
+    - GHL_V: grados-hora latentes, suma de los excesos de humedad específica
+      sobre HUMID_RATIO_LIMIT (12 g/kg), en g/kg·h
+    - H_HUM_V: horas con humedad específica superior a HUMID_RATIO_LIMIT
+    - H_ENT_V: horas con entalpía superior a ENTHALPY_LIMIT (55 kJ/kg)
+    - TH_V: temperatura húmeda media, ºC
+
 - Indicadores obtenidos a partir del CTE DB-HE:
 
     - ZCI_CTE_2019: zona climática de invierno (a, A, B, C, D, E) obtenida de datos CTE DB-HE 2019
@@ -29,6 +38,22 @@ Para cada municipio, lee el archivo `data/output/tmy/$[COD_INE}.tmy` y calcula:
 Genera un archivo que incluye, además de las columnas del archivo de municipios
 de entrada, los anteriores indicadores y lo guarda en `data/output/Results.csv`.
 
+Los archivos TMY se revisan antes del cálculo (tamaño y cabecera, ver
+scan_tmy_files) y los errores de lectura o cálculo de cada municipio no
+interrumpen el de los demás: los municipios con archivos erróneos (p.e.
+respuestas de error de PV-GIS para puntos sobre el mar, o archivos vacíos o
+incompletos) se excluyen de los resultados y se guardan, con el motivo, en un
+informe de cuarentena (`<archivo de resultados>.quarantine.csv`).
+
+Con --prefetch, los archivos TMY se leen por adelantado en el proceso
+principal, con varios hilos, mientras los procesos de cálculo interpretan y
+procesan los ya leídos (ver prefetch_indicators), de modo que el cálculo no
+espera a las lecturas (p.e. con almacenamiento en red).
+
+Opcionalmente (--monthly_output), genera también una tabla en formato largo
+(COD_INE, MES, INDICADOR, VALOR) con los indicadores mensuales de cada
+municipio (ver MONTHLY_INDICATORS), calculados con los mismos datos horarios.
+
 Cálculos en base a:
 
 - [CTE DB-HE - Documento de climas de referencia](https://www.codigotecnico.org/pdf/Documentos/HE/20170202-DOC-DB-HE-0-Climas%20de%20referencia.pdf)
@@ -36,12 +61,64 @@ Cálculos en base a:
 - Archivos TMY (.csv) obtenidos de [PV-GIS](https://re.jrc.ec.europa.eu/pvg_tools/en/)
 """
 
+import functools
+import io
+import json
 import math
 import multiprocessing as mp
+import os
+import queue
+import resource
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 import numpy as np
 import pandas as pd
 
+from epw_to_ddy.psychrometrics import (
+    enthalpy_from_db_hr_array,
+    humid_ratio_from_db_rh_array,
+    wet_bulb_from_db_hr_array,
+)
+from solar import (
+    SUNSHINE_LIMIT,
+    day_length,
+    day_months,
+    hour_months,
+    monthly_n_N,
+    sun_up_hours,
+    warm_cache,
+)
+from tmy_archive import open_archive, read_member
+
+MUNICIPIOS_FILE = "data/output/Municipios.csv"
+RESULTS_FILE = "data/output/Results.csv"
+MONTHLY_FILE = "data/output/ResultsMonthly.csv"
+TMY_DIR = "data/output/tmy"
+
+# Periodos de cálculo, como (mes inicial, mes final), ambos incluidos
+# El periodo puede pasar de diciembre a enero (p.e. de octubre a mayo)
+WINTER_MONTHS = (10, 5)
+SUMMER_MONTHS = (6, 9)
+
+# Indicadores mensuales:
+# - GD_I: grados día en base 20 de calefacción (T2m < 20)
+# - GD_V: grados día en base 20 de refrigeración (T2m > 20)
+# - n: horas de sol (radiación directa > 120 W/m²)
+# - N: horas máximas de sol (duración de los días)
+# - T2m: temperatura media
+MONTHLY_INDICATORS = ["GD_I", "GD_V", "n", "N", "T2m"]
+
+# Límites de los indicadores de humedad de verano
+# Humedad específica máxima de la zona de confort de ASHRAE 55 (kg agua / kg aire seco)
+HUMID_RATIO_LIMIT = 0.012
+# Entalpía del aire (kJ/kg aire seco), aprox. la de 24ºC y 12 g/kg
+ENTHALPY_LIMIT = 55.0
+
 # Tabla de altitudes del CTE HE 2019
 # provincia, capital de provincia, altitud de referencia, zc de referencia y rangos de altitud
 TABLA_HE2019 = [
@@ -464,7 +541,36 @@ def findzcalt(alt, provincia):
     return findzc(alt, prov_index[provincia]["alt_ranges"])
 
 
-ZCI_LEVELS = {"a": 1, "A": 2, "B": 3, "C": 4, "D": 5, "E": 6}
+def findzcalt_array(alts, provincias):
+    """Devuelve array de zonas climáticas para arrays de altitudes y provincias
+
+    Para cada provincia localiza las altitudes en los límites de sus rangos de
+    altitud, en lugar de recorrer los rangos para cada localidad.
+    Devuelve None para altitudes fuera de los rangos de su provincia.
+    """
+    alts = np.asarray(alts, dtype=float)
+    provincias = np.asarray(provincias, dtype=object)
+    zcs = np.full(len(alts), None, dtype=object)
+    for provincia in pd.unique(provincias):
+        rows = np.flatnonzero(provincias == provincia)
+        # Los rangos son consecutivos, aunque algunas tablas incluyen tuplas vacías
+        ranges = [r for r in prov_index[provincia]["alt_ranges"] if r]
+        maxvs = np.array([maxv for (_, maxv, _) in ranges])
+        names = np.array([zc for (_, _, zc) in ranges] + [None], dtype=object)
+        idx = np.searchsorted(maxvs, alts[rows], side="right")
+        idx[alts[rows] < ranges[0][0]] = len(ranges)
+        zcs[rows] = names[idx]
+    return zcs
+
+
+# Zonas climáticas y límites superiores de severidad (incluidos) de cada zona
+# salvo la última, que no tiene límite superior
+ZCI_NAMES = ["a", "A", "B", "C", "D", "E"]
+ZCI_BINS = [0.0, 0.23, 0.5, 0.93, 1.51]
+ZCV_NAMES = [1, 2, 3, 4]
+ZCV_BINS = [0.5, 0.83, 1.38]
+
+ZCI_LEVELS = {zci: level for (level, zci) in enumerate(ZCI_NAMES, 1)}
 
 
 def zci_level(zci):
@@ -472,65 +578,152 @@ def zci_level(zci):
     return ZCI_LEVELS[zci]
 
 
+def zci_level_array(zcis):
+    """Array de niveles numéricos de un array de zonas climáticas de invierno"""
+    codes = pd.Categorical(zcis, categories=ZCI_NAMES, ordered=True).codes
+    if (codes < 0).any():
+        raise ValueError("Zonas climáticas de invierno no válidas")
+    return codes.astype(int) + 1
+
+
 def get_zci(sci):
     """Zona climática de invierno a partir de severidad climática de invierno"""
-    if sci <= 0.0:
-        return "a"
-    elif sci <= 0.23:
-        return "A"
-    elif sci <= 0.5:
-        return "B"
-    elif sci <= 0.93:
-        return "C"
-    elif sci <= 1.51:
-        return "D"
-    else:
-        return "E"
+    return ZCI_NAMES[bisect_left(ZCI_BINS, sci)]
 
 
 def get_zcv(scv):
     """Zona climática de verano a partir de severidad climática de verano"""
-    if scv <= 0.5:
-        return 1
-    elif scv <= 0.83:
-        return 2
-    elif scv <= 1.38:
-        return 3
+    return ZCV_NAMES[bisect_left(ZCV_BINS, scv)]
+
+
+def get_zci_array(scis):
+    """Zonas climáticas de invierno (categorías ordenadas) a partir de un array de SCI
+
+    Los valores no definidos (NaN) dan lugar a valores no definidos.
+    """
+    return _classify(scis, ZCI_BINS, ZCI_NAMES)
+
+
+def get_zcv_array(scvs):
+    """Zonas climáticas de verano (categorías ordenadas) a partir de un array de SCV
+
+    Los valores no definidos (NaN) dan lugar a valores no definidos.
+    """
+    return _classify(scvs, ZCV_BINS, ZCV_NAMES)
+
+
+def _classify(values, bins, names):
+    """Clasifica valores en categorías ordenadas según límites superiores bins"""
+    values = np.asarray(values, dtype=float)
+    codes = np.searchsorted(bins, values, side="left")
+    codes[np.isnan(values)] = -1
+    return pd.Categorical.from_codes(codes, categories=names, ordered=True)
+
+
+def cte_indicators(df):
+    """Añade a df las zonas climáticas del CTE DB-HE 2019
+
+    Los valores se obtienen de la tabla del Apéndice B del CTE DB-HE 2019
+    a partir de la capital de provincia de la localidad y su altitud
+    """
+    df["ZC_CTE_2019"] = findzcalt_array(df["ALTITUD"], df["PROVINCIA"])
+    df["ZCI_CTE_2019"] = df["ZC_CTE_2019"].str[0]
+    df["ZCV_CTE_2019"] = df["ZC_CTE_2019"].str[1].astype(int)
+    return df
+
+
+def zone_diffs(df):
+    """Añade a df la diferencia de niveles de zonas climáticas entre TMY y CTE"""
+    df["ZCI_DIFF"] = zci_level_array(df["ZCI_TMY"]) - zci_level_array(
+        df["ZCI_CTE_2019"]
+    )
+    df["ZCV_DIFF"] = df["ZCV_TMY"] - df["ZCV_CTE_2019"]
+    return df
+
+
+@functools.lru_cache(maxsize=None)
+def season_days(months, year=None):
+    """Máscara booleana de los días del año del periodo months = (mes inicial, mes final)"""
+    first, last = months
+    day_month = day_months(year)
+    if first <= last:
+        mask = (day_month >= first) & (day_month <= last)
     else:
-        return 4
+        mask = (day_month >= first) | (day_month <= last)
+    mask.setflags(write=False)
+    return mask
 
 
-def winter_total_duration_of_days(latitude):
+@functools.lru_cache(maxsize=None)
+def season_hours(months, year=None):
+    """Máscara booleana de las horas del año del periodo months = (mes inicial, mes final)
+
+    Sin year, tiene 8760 valores, como los datos horarios de los archivos TMY.
+    Las máscaras se calculan una vez por proceso y se comparten en todos los cálculos.
+    """
+    mask = np.repeat(season_days(months, year), 24)
+    mask.setflags(write=False)
+    return mask
+
+
+def winter_total_duration_of_days(latitude, months=WINTER_MONTHS, year=None):
     """Calcula total para el periodo de invierno de la duración del día, en base a la latitud (en grados)
 
-    El periodo de invierno dura de octubre a mayo (dias 1 a 150 y de 274 a 365, horas 1 a 3600 y de 6552 a 8760)
+    El periodo de invierno dura por defecto de octubre a mayo (ver WINTER_MONTHS)
 
     N = 2/15. cos^-1(-tan(lat)tan(delta))
     delta = declinación (grados) = 23.45 · sin(360/365 · (284 + día_del_año)))
     días_del_año = [1, 365]
+
+    La duración de cada día del año se calcula una vez por latitud (ver solar.py)
     """
-    lat = math.radians(latitude)
+    # Duración de los días del periodo
+    N = day_length(latitude, year)[season_days(months, year)].sum()
 
-    def declination(nday):
-        return 23.45 * np.sin(np.radians(360.0 / 365.0 * (284.0 + nday.astype(float))))
+    return N
 
-    def day_duration_N(nday):
-        return np.degrees(
-            2.0 / 15.0 * np.arccos(-np.tan(lat) * np.tan(np.radians(declination(nday))))
-        )
 
-    # Duración de los dias 1 a 150 y de 274 a 365
-    N = (
-        day_duration_N(np.arange(1.0, 151.0, 1.0)).sum()
-        + day_duration_N(np.arange(274.0, 366.0, 1.0)).sum()
-    )
+# Número de horas (filas de datos) de los archivos TMY
+TMY_HOURS = 8760
+# Tipos de las columnas de datos horarios de los archivos TMY
+TMY_DTYPES = {
+    # No interpretamos columna de tiempo
+    "time(UTC)": str,
+    "T2m": np.float64,
+    "RH": np.float64,
+    "G(h)": np.float64,
+    "Gb(n)": np.float64,
+    "Gd(h)": np.float64,
+    "IR(h)": np.float64,
+    "WS10m": np.float64,
+    "WD10m": np.float64,
+    "SP": np.float64,
+}
+# Tipos compactos (float32) de las columnas numéricas. Los datos de PV-GIS
+# tienen como mucho 2 decimales y 6 cifras significativas, que float32 representa
+TMY_COMPACT_DTYPES = {
+    col: (np.float32 if dtype is np.float64 else dtype)
+    for col, dtype in TMY_DTYPES.items()
+}
 
-    return N
 
+def read_tmy_data(tmy_filename, archive=None, compact=False, content=None):
+    """Lee datos de archivo o buffer TMY
 
-def read_tmy_data(tmy_filename):
-    """Lee datos de archivo o buffer TMY"""
-    with open(tmy_filename, "r") as tmy_file:
+    Si se indica archive, tmy_filename es el nombre del miembro del archivo
+    comprimido archive (ver tmy_archive.py) del que se leen los datos.
+    Si se indica content (bytes), los datos se leen de ese contenido ya leído
+    del archivo tmy_filename.
+    Si compact es True, los datos numéricos se guardan como float32 (ver
+    TMY_COMPACT_DTYPES), con la mitad de memoria.
+    """
+    if content is not None:
+        tmy_file = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8")
+    elif archive is not None:
+        tmy_file = io.StringIO(read_member(archive, tmy_filename).decode("utf-8"))
+    else:
+        tmy_file = open(tmy_filename, "r")
+    with tmy_file:
         f_lat = float(tmy_file.readline().split(":")[1].strip())
         f_long = float(tmy_file.readline().split(":")[1].strip())
         f_elev = float(tmy_file.readline().split(":")[1].strip())
@@ -539,42 +732,61 @@ def read_tmy_data(tmy_filename):
             sep=",",
             decimal=".",
             skiprows=13,
-            nrows=8760,
-            dtype={
-                # No interpretamos columna de tiempo
-                "time(UTC)": str,
-                "T2m": float,
-                "RH": float,
-                "G(h)": float,
-                "Gb(n)": float,
-                "Gd(h)": float,
-                "IR(h)": float,
-                "WS10m": float,
-                "WD10m": float,
-                "SP": float,
-            },
+            nrows=TMY_HOURS,
+            dtype=TMY_COMPACT_DTYPES if compact else TMY_DTYPES,
         )
+    if len(df) != TMY_HOURS:
+        raise ValueError(
+            "'{}' tiene {} filas de datos en lugar de {}".format(
+                tmy_filename, len(df), TMY_HOURS
+            )
+        )
+    if df.drop(columns="time(UTC)").isna().values.any():
+        raise ValueError("'{}' tiene datos horarios vacíos".format(tmy_filename))
     return {"lat": f_lat, "long": f_long, "elev": f_elev, "data": df}
 
-def compute_ind(df, lat):
-    """Calcula indicadores a partir de dataframe con datos horarios de TMY"""
-    
+
+def compute_ind(
+    df,
+    lat,
+    long,
+    winter_months=WINTER_MONTHS,
+    summer_months=SUMMER_MONTHS,
+    year=None,
+    monthly=False,
+):
+    """Calcula indicadores a partir de dataframe con datos horarios de TMY
+
+    Los periodos de invierno y verano se indican como (mes inicial, mes final).
+    lat y long (grados) son las coordenadas del municipio, con las que se
+    obtienen la duración de los días y las horas con el sol sobre el horizonte
+    (ver solar.py).
+    Los datos horarios pueden ser float32 (ver read_tmy_data), pero las sumas
+    se acumulan siempre como float64.
+    Con year, df contiene los datos horarios de ese año (8784 horas si es bisiesto)
+    en lugar de los de un TMY.
+    Con monthly, se incluyen en la clave MENSUAL los indicadores mensuales
+    (ver monthly_ind).
+    """
+    winter = season_hours(winter_months, year)
+    summer = season_hours(summer_months, year)
+    t2m = df["T2m"].to_numpy()
+    gbn = df["Gb(n)"].to_numpy()
+
     # Severidad y zona climática de invierno ========
-    # Se calcula con indicadores de los meses de octubre a mayo
-    # (dias 1 a 150 y de 274 a 365, horas 1 a 3600 y de 6552 a 8760)
+    # Se calcula con indicadores de los meses de invierno (por defecto, de octubre a mayo)
     # Grados día de invierno en base 20  (grados sobre 20 en cada día / 24)
     # \sum {{T_b - T_{ah}} \over 24} \cdot \left\lfloor T_b > T_{ah} \right\rfloor
-    gd_inv_tot = (20.0 - df["T2m"]) / 24.0 * (20.0 > df["T2m"]).astype(int)
-    # GD_inv: grados día base 20, para los meses de octubre a mayo
-    gd_inv = round(gd_inv_tot[1:3600].sum() + gd_inv_tot[6552:8760].sum(), 1)
+    gd_inv_tot = (20.0 - t2m) / 24.0 * (20.0 > t2m)
+    # GD_inv: grados día base 20, para los meses de invierno
+    gd_inv = round(gd_inv_tot[winter].sum(dtype=np.float64), 1)
     # n (duration of sunshine): horas con radiación directa (beam solar irradiance) > 120 W/m² (World Meteorological Organization)
-    n = float(
-        (df["Gb(n)"][1:3600] > 120.0).astype(int).sum()
-        + (df["Gb(n)"][6552:8760] > 120.0).astype(int).sum()
-    )
-    # N (número teórico máximo de horas de luz) en invierno, de octubre a mayo (ambos incluidos):
-    N = round(winter_total_duration_of_days(lat), 1)
-    # n/N: Horas de sol / duración del día, en los meses de octubre a mayo
+    # y con el sol sobre el horizonte en algún momento de la hora (se excluyen solo las horas nocturnas)
+    sunshine = (gbn > SUNSHINE_LIMIT) & sun_up_hours(lat, long, year)
+    n = float(np.count_nonzero(sunshine[winter]))
+    # N (número teórico máximo de horas de luz) en invierno (meses de invierno incluidos):
+    N = round(winter_total_duration_of_days(lat, winter_months, year), 1)
+    # n/N: Horas de sol / duración del día, en los meses de invierno
     n_N = round(float(n) / float(N), 3)
 
     sci = round(
@@ -588,22 +800,20 @@ def compute_ind(df, lat):
     zci = get_zci(sci)
 
     # Severidad y zona climática de verano ========
-    # (día 151 a día 273, horas de 3601 a 6551)
+    # Se calcula con indicadores de los meses de verano (por defecto, de junio a septiembre)
     # Grados día de verano en base 20 (grados sobre 20 en cada día / 24)
     # \sum {{T_{ah} - T_b} \over 24} \cdot \left\lfloor T_b < T_{ah} \right\rfloor
-    gd_ver_tot = (df["T2m"] - 20.0) / 24.0 * (20.0 < df["T2m"]).astype(int)
+    gd_ver_tot = (t2m - 20.0) / 24.0 * (20.0 < t2m)
 
-    # GD_ver: grados día base 20, para los meses de junio a septiembre
-    gd_ver = round(gd_ver_tot[3601:6551].sum(), 1)
+    # GD_ver: grados día base 20, para los meses de verano
+    # Antes se usaban las horas 3601 a 6550, que incluían 23 horas del 31 de mayo
+    # (y omitían la última hora de septiembre, nocturna en UTC). Sin ellas, GD_ver
+    # baja hasta unos 5 °C·día y SCV hasta 0.015, que con el redondeo a dos
+    # decimales de SCV puede llegar a 0.02
+    gd_ver = round(gd_ver_tot[summer].sum(dtype=np.float64), 1)
 
     scv = round(2.990e-3 * gd_ver - 1.1597e-7 * gd_ver * gd_ver - 1.713e-1, 2)
     zcv = get_zcv(scv)
-    
-    if TEST_MODE:
-        print("\tGD_inv: ", gd_inv, ", GD_ver: ", gd_ver)
-        print("\tn: ", n, ", N: ", N, ", n/N: ", n_N)
-        print("\tSCI: ", sci, " SCV: ", scv)
-        print("\tZCI: ", zci, " ZCV: ", zcv)
 
     indicators = {
         "GD_I": gd_inv,
@@ -615,12 +825,210 @@ def compute_ind(df, lat):
         "ZCV_TMY": zcv,
     }
 
+    # Indicadores de humedad de verano ========
+    # Solo si hay datos de humedad relativa y presión (no los hay en las series horarias)
+    if "RH" in df.columns and "SP" in df.columns:
+        indicators.update(humidity_ind(df, summer))
+
+    if monthly:
+        indicators["MENSUAL"] = monthly_ind(
+            t2m, gbn, gd_inv_tot, gd_ver_tot, lat, long, year
+        )
+    
+    if TEST_MODE:
+        print("\tGD_inv: ", gd_inv, ", GD_ver: ", gd_ver)
+        print("\tn: ", n, ", N: ", N, ", n/N: ", n_N)
+        print("\tSCI: ", sci, " SCV: ", scv)
+        print("\tZCI: ", zci, " ZCV: ", zcv)
+
     return indicators
 
-def tmy_indicators(cod, long, lat, alt, tmy_filename):
-    """Calcula indicadores a partir de datos de archivo TMY"""
-    if TEST_MODE and tmy_filename not in TEST_FILES:
+
+def monthly_ind(t2m, gbn, gd_inv_tot, gd_ver_tot, lat, long, year=None):
+    """Calcula los indicadores mensuales MONTHLY_INDICATORS a partir de los datos horarios
+
+    Usa los grados día horarios ya calculados en compute_ind y agrega por meses
+    con el índice del mes de cada hora (solar.hour_months), compartido por todos
+    los cálculos. Las horas de sol n y la duración de los días N de cada mes
+    se obtienen con solar.monthly_n_N.
+
+    Devuelve un array con una fila por indicador y una columna por mes.
+    """
+    month = hour_months(year) - 1
+    hours = np.bincount(month, minlength=12)
+    n, N, _ = monthly_n_N(gbn, lat, long, year)
+    return np.vstack(
+        [
+            np.bincount(month, weights=gd_inv_tot, minlength=12).round(1),
+            np.bincount(month, weights=gd_ver_tot, minlength=12).round(1),
+            n,
+            N.round(1),
+            (np.bincount(month, weights=t2m, minlength=12) / hours).round(2),
+        ]
+    )
+
+
+def monthly_table(cods, values):
+    """Tabla en formato largo (COD_INE, MES, INDICADOR, VALOR) de indicadores mensuales
+
+    values es la lista de arrays de indicadores mensuales (ver monthly_ind) de
+    los municipios de códigos cods
+    """
+    n_ind = len(MONTHLY_INDICATORS)
+    data = np.stack(values).transpose(0, 2, 1).ravel() if len(values) else []
+    return pd.DataFrame(
+        {
+            "COD_INE": np.repeat(np.asarray(cods), 12 * n_ind),
+            "MES": np.tile(np.repeat(np.arange(1, 13), n_ind), len(values)),
+            "INDICADOR": np.tile(MONTHLY_INDICATORS, 12 * len(values)),
+            "VALOR": data,
+        }
+    )
+
+
+def humidity_ind(df, summer):
+    """Calcula indicadores de humedad de verano a partir de dataframe con datos horarios
+
+    summer es la máscara de las horas de verano. Las propiedades psicrométricas
+    se calculan a la vez para todas las horas del periodo, interpolando la
+    presión de saturación en las tablas de psychrometrics.py.
+    """
+    t2m = df["T2m"].to_numpy()[summer]
+    rh = df["RH"].to_numpy()[summer]
+    sp = df["SP"].to_numpy()[summer]
+
+    # Humedad específica (kg agua / kg aire seco) y entalpía (kJ/kg aire seco)
+    w = humid_ratio_from_db_rh_array(t2m, rh, sp, method="table")
+    h = enthalpy_from_db_hr_array(t2m, w)
+    # Temperatura húmeda
+    th = wet_bulb_from_db_hr_array(t2m, w, sp, method="table")
+
+    # GHL_V: grados-hora latentes, en g/kg·h
+    # \sum {W - W_b} \cdot \left\lfloor W > W_b \right\rfloor
+    ghl_ver = round(1000.0 * np.maximum(w - HUMID_RATIO_LIMIT, 0.0).sum(), 1)
+
+    return {
+        "GHL_V": ghl_ver,
+        "H_HUM_V": int(np.count_nonzero(w > HUMID_RATIO_LIMIT)),
+        "H_ENT_V": int(np.count_nonzero(h > ENTHALPY_LIMIT)),
+        "TH_V": round(float(th.mean()), 2),
+    }
+
+def read_municipio_tmy(tmy_filename, archive=None, compact=False, content=None):
+    """Lee datos del archivo TMY de un municipio, de TMY_DIR o del archivo comprimido archive
+
+    Si se indica content, los datos se leen de ese contenido ya leído (ver read_tmy_bytes).
+    """
+    if archive is not None or content is not None:
+        return read_tmy_data(tmy_filename, archive, compact, content)
+    return read_tmy_data(os.path.join(TMY_DIR, tmy_filename), compact=compact)
+
+
+def read_tmy_bytes(tmy_filename, archive=None):
+    """Lee el contenido (bytes) del archivo TMY de un municipio, de TMY_DIR o del archivo comprimido archive"""
+    if archive is not None:
+        return read_member(archive, tmy_filename)
+    with open(os.path.join(TMY_DIR, tmy_filename), "rb") as f:
+        return f.read()
+
+
+# Tamaño mínimo (bytes) de un archivo TMY completo (8760 filas de unos 60 caracteres)
+TMY_MIN_SIZE = TMY_HOURS * 40
+# Comienzo de las tres líneas de cabecera de los archivos TMY de PV-GIS
+TMY_HEADER = ("Latitude", "Longitude", "Elevation")
+# Número de hilos de la revisión previa de archivos TMY
+SCAN_THREADS = 16
+# Indicadores obtenidos de los archivos TMY (ver compute_ind)
+TMY_COLUMNS = [
+    "GD_I",
+    "GD_V",
+    "n_N",
+    "SCI",
+    "SCV",
+    "ZCI_TMY",
+    "ZCV_TMY",
+    "GHL_V",
+    "H_HUM_V",
+    "H_ENT_V",
+    "TH_V",
+]
+# Columnas del informe de municipios en cuarentena
+QUARANTINE_COLUMNS = ["COD_INE", "NOMBRE_ACTUAL", "ARCHIVO_TMY", "ETAPA", "MOTIVO"]
+
+
+def scan_tmy_file(tmy_filename, archive=None):
+    """Revisa el tamaño y la cabecera de un archivo TMY, sin leer sus datos
+
+    El archivo se busca en TMY_DIR o, si se indica, en el archivo comprimido archive.
+
+    Devuelve el motivo por el que el archivo no es válido, o None si lo es.
+    """
+    try:
+        if archive is not None:
+            size = open_archive(archive).getinfo(tmy_filename).file_size
+            with open_archive(archive).open(tmy_filename) as f:
+                head = f.read(512)
+        else:
+            path = os.path.join(TMY_DIR, tmy_filename)
+            size = os.path.getsize(path)
+            with open(path, "rb") as f:
+                head = f.read(512)
+    except (OSError, KeyError) as e:
+        return "archivo no disponible ({})".format(e)
+    if size == 0:
+        return "archivo vacío"
+    lines = head.decode("utf-8", errors="replace").splitlines()
+    if len(lines) < len(TMY_HEADER) or not all(
+        line.startswith(start) for line, start in zip(lines, TMY_HEADER)
+    ):
+        # Las respuestas de error de PV-GIS son mensajes JSON o de texto
+        return "cabecera no válida: '{}'".format(lines[0][:80] if lines else "")
+    if size < TMY_MIN_SIZE:
+        return "archivo incompleto ({} bytes)".format(size)
+    return None
+
+
+def scan_tmy_files(tmy_filenames, archive=None, threads=SCAN_THREADS):
+    """Revisa en paralelo (con threads hilos) los archivos TMY tmy_filenames
+
+    Ver scan_tmy_file. Devuelve un diccionario {archivo: motivo} con los
+    archivos no válidos.
+    """
+    tmy_filenames = list(dict.fromkeys(tmy_filenames))
+    with ThreadPoolExecutor(threads) as executor:
+        reasons = executor.map(
+            functools.partial(scan_tmy_file, archive=archive), tmy_filenames
+        )
         return {
+            filename: reason
+            for filename, reason in zip(tmy_filenames, reasons)
+            if reason is not None
+        }
+
+
+def tmy_indicators(
+    cod,
+    long,
+    lat,
+    alt,
+    tmy_filename,
+    archive=None,
+    coord_tol=0.0,
+    compact=False,
+    monthly=False,
+    content=None,
+):
+    """Calcula indicadores a partir de datos de archivo TMY
+
+    Los datos se leen de TMY_DIR o, si se indica, del archivo comprimido archive
+    o del contenido ya leído del archivo content (ver prefetch_indicators).
+    Se avisa si las coordenadas del archivo difieren de las del municipio más
+    de coord_tol grados (p.e. al usar archivos por celdas, ver plan_cells.py).
+    Si compact es True, los datos horarios se procesan como float32.
+    Si monthly es True, se incluyen los indicadores mensuales (clave MENSUAL).
+    """
+    if TEST_MODE and tmy_filename not in TEST_FILES:
+        dummy = {
             "COD_INE": cod,
             "GD": 0.0,
             "GD_I": 0.0,
@@ -630,10 +1038,16 @@ def tmy_indicators(cod, long, lat, alt, tmy_filename):
             "SCV": 0.0,
             "ZCI_TMY": "A",
             "ZCV_TMY": 1,
+            "GHL_V": 0.0,
+            "H_HUM_V": 0,
+            "H_ENT_V": 0,
+            "TH_V": 0.0,
         }
+        if monthly:
+            dummy["MENSUAL"] = np.zeros((len(MONTHLY_INDICATORS), 12))
+        return dummy
 
-    filename = "data/output/tmy/{}".format(tmy_filename)
-    data = read_tmy_data(filename)
+    data = read_municipio_tmy(tmy_filename, archive, compact, content)
 
     df = data["data"]
     f_lat = data["lat"]
@@ -642,8 +1056,8 @@ def tmy_indicators(cod, long, lat, alt, tmy_filename):
 
     # Check básico de consistencia entre datos de BBDD y TMY
     if (
-        f_lat != round(lat, 3)
-        or f_long != round(long, 3)
+        abs(f_lat - round(lat, 3)) > coord_tol
+        or abs(f_long - round(long, 3)) > coord_tol
         or abs(f_elev - round(alt, 1) > 30)
     ):
         # TODO: Guardar en archivo de log
@@ -657,7 +1071,7 @@ def tmy_indicators(cod, long, lat, alt, tmy_filename):
             round(alt, 1),
         )
         print(msg)
-    ind = compute_ind(df, lat)
+    ind = compute_ind(df, lat, long, monthly=monthly)
     
     return {
         "COD_INE": cod,
@@ -665,39 +1079,331 @@ def tmy_indicators(cod, long, lat, alt, tmy_filename):
     }
 
 
+def isolated_tmy_indicators(*args):
+    """Calcula indicadores con tmy_indicators, devolviendo los errores en lugar de lanzarlos
+
+    Así, un archivo TMY erróneo no interrumpe el cálculo de los demás
+    municipios. En caso de error, devuelve un diccionario con COD_INE y ERROR
+    (descripción del error).
+    """
+    try:
+        return tmy_indicators(*args)
+    except Exception as e:
+        return {"COD_INE": args[0], "ERROR": "{}: {}".format(type(e).__name__, e)}
+
+
+def _timed_indicators(value):
+    """Calcula isolated_tmy_indicators(*value), devolviendo también el tiempo de cálculo (s)"""
+    start = time.perf_counter()
+    ind = isolated_tmy_indicators(*value)
+    return ind, time.perf_counter() - start
+
+
+# Número de archivos TMY leídos por adelantado por cada hilo de lectura (tamaño de la cola)
+PREFETCH_DEPTH = 4
+# Número de tareas enviadas a cada proceso de cálculo (una en cálculo y otra en espera)
+PREFETCH_TASKS = 2
+
+
+def _timed_read(tmy_filename, archive=None):
+    """Lee el contenido de un archivo TMY, devolviendo también el tiempo de lectura (s)
+
+    Si falla la lectura el contenido es None, y el archivo se lee de nuevo en
+    el proceso de cálculo, donde el error se aísla (ver isolated_tmy_indicators).
+    """
+    start = time.perf_counter()
+    try:
+        content = read_tmy_bytes(tmy_filename, archive)
+    except Exception:
+        content = None
+    return content, time.perf_counter() - start
+
+
+def _read_into(read_queue, stop, i, value):
+    """Lee el archivo TMY del municipio i (argumentos value) y lo añade a la cola read_queue
+
+    Espera mientras la cola está llena, salvo que se active stop.
+    """
+    content, read_time = _timed_read(value[4], value[5])
+    while not stop.is_set():
+        try:
+            read_queue.put((i, value, content, read_time), timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def prefetch_indicators(pool, values, threads, processes, depth=None, stats=None):
+    """Calcula tmy_indicators en pool para values leyendo los archivos TMY por adelantado
+
+    values son los argumentos de tmy_indicators de cada municipio. threads
+    hilos leen el contenido de los archivos en una cola de depth archivos (por
+    defecto PREFETCH_DEPTH por hilo), y cada archivo de la cola se envía
+    a pool en cuanto hay sitio en uno de sus processes procesos de cálculo
+    (PREFETCH_TASKS tareas por proceso). Así, como máximo hay en memoria
+    depth + threads + PREFETCH_TASKS * processes archivos.
+
+    Si se indica el diccionario stats, se acumulan en él el número de
+    archivos y de bytes leídos, el tiempo de lectura (s), el tiempo de espera
+    a las lecturas para enviar archivos al cálculo (s), el tiempo de cálculo
+    (s), y la suma y el máximo de archivos ya leídos en la cola al enviar cada
+    uno al cálculo (ver prefetch_summary).
+
+    Devuelve la lista de resultados de isolated_tmy_indicators, en el orden de values.
+    """
+    depth = threads * PREFETCH_DEPTH if depth is None else depth
+    stats = {} if stats is None else stats
+    for key in ["archivos", "bytes", "lectura", "espera", "calculo", "cola", "cola_max"]:
+        stats.setdefault(key, 0)
+    read_queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    slots = threading.Semaphore(PREFETCH_TASKS * processes)
+    results = [None] * len(values)
+
+    def done(i, result):
+        ind, compute_time = result
+        results[i] = ind
+        stats["calculo"] += compute_time
+        slots.release()
+
+    def failed(i, value, error):
+        results[i] = {
+            "COD_INE": value[0],
+            "ERROR": "{}: {}".format(type(error).__name__, error),
+        }
+        slots.release()
+
+    with ThreadPoolExecutor(threads) as executor:
+        try:
+            for i, value in enumerate(values):
+                executor.submit(_read_into, read_queue, stop, i, value)
+            for _ in range(len(values)):
+                slots.acquire()
+                ready = read_queue.qsize()
+                start = time.perf_counter()
+                i, value, content, read_time = read_queue.get()
+                stats["espera"] += time.perf_counter() - start
+                stats["archivos"] += 1
+                stats["bytes"] += len(content or b"")
+                stats["lectura"] += read_time
+                stats["cola"] += ready
+                stats["cola_max"] = max(stats["cola_max"], ready)
+                pool.apply_async(
+                    _timed_indicators,
+                    (tuple(value) + (content,),),
+                    callback=functools.partial(done, i),
+                    error_callback=functools.partial(failed, i, value),
+                )
+            # Espera a que terminen las tareas pendientes
+            for _ in range(PREFETCH_TASKS * processes):
+                slots.acquire()
+        finally:
+            stop.set()
+            executor.shutdown(cancel_futures=True)
+    return results
+
+
+def prefetch_summary(stats):
+    """Resumen de la lectura anticipada a partir de las estadísticas acumuladas
+
+    stats incluye, además de las de prefetch_indicators, el tiempo total (s) y
+    el número de hilos de lectura y procesos de cálculo.
+    Devuelve un diccionario con la profundidad media y máxima de la cola de
+    archivos leídos a la espera de cálculo y la utilización (%) de los hilos
+    de lectura y de los procesos de cálculo.
+    """
+    files = max(stats["archivos"], 1)
+    total = max(stats["total"], 1e-9)
+    return {
+        "archivos": stats["archivos"],
+        "MB": round(stats["bytes"] / 1024 / 1024, 1),
+        "cola_media": round(stats["cola"] / files, 2),
+        "cola_max": stats["cola_max"],
+        "espera_s": round(stats["espera"], 2),
+        "lectura_pct": round(100.0 * stats["lectura"] / (total * stats["hilos"]), 1),
+        "calculo_pct": round(100.0 * stats["calculo"] / (total * stats["procesos"]), 1),
+    }
+
+
+def compare_compact(cod, long, lat, tmy_filename, archive=None):
+    """Calcula indicadores con datos horarios float64 y float32 (compactos)
+
+    Devuelve un diccionario con los indicadores de cada caso, con sufijos _64 y _32
+    """
+    ind_64 = compute_ind(read_municipio_tmy(tmy_filename, archive)["data"], lat, long)
+    ind_32 = compute_ind(
+        read_municipio_tmy(tmy_filename, archive, True)["data"], lat, long
+    )
+    return {
+        "COD_INE": cod,
+        **{key + "_64": value for key, value in ind_64.items()},
+        **{key + "_32": value for key, value in ind_32.items()},
+    }
+
+
+def isolated_compare_compact(*args):
+    """Compara el modo compacto con compare_compact, devolviendo los errores en lugar de lanzarlos
+
+    Ver isolated_tmy_indicators.
+    """
+    try:
+        return compare_compact(*args)
+    except Exception as e:
+        return {"COD_INE": args[0], "ERROR": "{}: {}".format(type(e).__name__, e)}
+
+
+# Indicadores que deben coincidir al procesar datos en modo compacto
+COMPACT_CHECK_COLUMNS = ["SCI", "SCV", "ZCI_TMY", "ZCV_TMY"]
+
+
+def check_compact(df, processes=None, archive=None):
+    """Compara los indicadores TMY calculados con datos float64 y float32
+
+    Como en compute_results, los archivos TMY se revisan antes del cálculo y
+    los municipios con archivos no válidos o con errores de cálculo se
+    excluyen de la comparación.
+
+    Devuelve una tupla con un dataframe con los indicadores de ambos casos, un
+    diccionario con el número de municipios con diferencias en cada indicador
+    y un diccionario {COD_INE: motivo} con los municipios excluidos
+    """
+    season_hours(WINTER_MONTHS)
+    season_hours(SUMMER_MONTHS)
+    warm_cache(df["LATITUD_ETRS89"], df["LONGITUD_ETRS89"])
+    scan_errors = scan_tmy_files(df["ARCHIVO_TMY"], archive)
+    failed = df["ARCHIVO_TMY"].isin(scan_errors)
+    excluded = {
+        data["COD_INE"]: scan_errors[data["ARCHIVO_TMY"]]
+        for data in df[failed].to_dict("records")
+    }
+    with mp.Pool(processes) as pool:
+        values = [
+            (
+                data["COD_INE"],
+                data["LONGITUD_ETRS89"],
+                data["LATITUD_ETRS89"],
+                data["ARCHIVO_TMY"],
+                archive,
+            )
+            for data in df[~failed].to_dict("records")
+        ]
+        results = pool.starmap(isolated_compare_compact, values, chunksize=100)
+    excluded.update({res["COD_INE"]: res["ERROR"] for res in results if "ERROR" in res})
+    # Indicadores de compute_ind
+    columns = ["GD_I", "GD_V", "n_N"] + COMPACT_CHECK_COLUMNS
+    comparison = pd.DataFrame(
+        [res for res in results if "ERROR" not in res],
+        columns=["COD_INE"]
+        + [col + "_64" for col in columns]
+        + [col + "_32" for col in columns],
+    )
+    differences = {
+        col: int((comparison[col + "_64"] != comparison[col + "_32"]).sum())
+        for col in columns
+    }
+    return comparison, differences, excluded
+
+
 TEST_MODE = False
 TEST_FILES = [
     "01001000000_Alegría-Dulantzi.csv",
 ]
 
-if __name__ == "__main__":
 
-    print("Cargando datos de municipios...")
-    df = pd.read_csv(
-        "data/output/Municipios.csv",
-        dtype={
-            "COD_INE": str,
-            "COD_PROV": str,
-            "PROVINCIA": str,
-            "NOMBRE_ACTUAL": str,
-            "LONGITUD_ETRS89": float,
-            "LATITUD_ETRS89": float,
-            "ALTITUD": float,
-            "ARCHIVO_TMY": str,
-        },
-    )
-    print("Calculando indicadores CTE...")
+MUNICIPIOS_DTYPES = {
+    "COD_INE": str,
+    "COD_PROV": str,
+    "PROVINCIA": str,
+    "NOMBRE_ACTUAL": str,
+    "LONGITUD_ETRS89": float,
+    "LATITUD_ETRS89": float,
+    "ALTITUD": float,
+    "ARCHIVO_TMY": str,
+}
+
+
+def load_municipios(municipios_filename=MUNICIPIOS_FILE, cod_prov=None):
+    """Carga datos de municipios, opcionalmente solo los de la provincia cod_prov"""
+    df = pd.read_csv(municipios_filename, dtype=MUNICIPIOS_DTYPES)
+    if cod_prov is not None:
+        df = df[df["COD_PROV"] == cod_prov].reset_index(drop=True)
+    return df
+
+
+def iter_municipios(municipios_filename=MUNICIPIOS_FILE, chunk_size=10000, cod_prov=None):
+    """Lee datos de municipios en bloques de chunk_size filas
+
+    Opcionalmente solo devuelve los de la provincia cod_prov (omitiendo los
+    bloques que no tienen ninguno).
+    """
+    with pd.read_csv(
+        municipios_filename, dtype=MUNICIPIOS_DTYPES, chunksize=chunk_size
+    ) as reader:
+        for df in reader:
+            if cod_prov is not None:
+                df = df[df["COD_PROV"] == cod_prov]
+            if len(df) > 0:
+                yield df.reset_index(drop=True)
+
+
+def compute_results(
+    df,
+    processes=None,
+    archive=None,
+    coord_tol=0.0,
+    compact=False,
+    pool=None,
+    verbose=True,
+    monthly=False,
+    chunksize=100,
+    quarantine=None,
+    prefetch=None,
+    stats=None,
+):
+    """Calcula indicadores CTE, TMY y sus diferencias para los municipios de df
+
+    Los archivos TMY se leen de TMY_DIR o, si se indica, del archivo comprimido
+    archive. coord_tol es la diferencia de coordenadas admitida sin aviso entre
+    archivo TMY y municipio. Con compact, los datos horarios se procesan como float32.
+    Si se indica pool, se usa ese conjunto de procesos en lugar de crear uno nuevo,
+    al que se envían los municipios en grupos de chunksize.
+
+    Los municipios cuyos archivos TMY no superan la revisión previa (ver
+    scan_tmy_files) o fallan en el cálculo se excluyen de los resultados y,
+    si se indica la lista quarantine, se añaden a ella como diccionarios con
+    las claves de QUARANTINE_COLUMNS.
+
+    Si se indica prefetch, los archivos TMY se leen por adelantado con ese
+    número de hilos (ver prefetch_indicators) y, si se indica el diccionario
+    stats, se acumulan en él las estadísticas de lectura y cálculo (ver
+    prefetch_summary).
+
+    Con monthly, devuelve una tupla con los resultados y la tabla de indicadores
+    mensuales (ver monthly_table), calculados en la misma pasada.
+    """
+    if verbose:
+        print("Calculando indicadores CTE...")
 
     # Calcula indicadores de CTE DB-HE 2019
-    # los valores se obtienen de la tabla del Apéndice B del CTE DB-HE 2019
-    # a partir de la capital de provincia de la localidad y su altitud
-    df["ZC_CTE_2019"] = df.apply(lambda x: findzcalt(x["ALTITUD"], x["PROVINCIA"]), 1)
-    df["ZCI_CTE_2019"] = df.apply(lambda x: x["ZC_CTE_2019"][0], 1)
-    df["ZCV_CTE_2019"] = df.apply(lambda x: int(x["ZC_CTE_2019"][1]), 1)
-
-    # Calcula indicadores a partir de archivos TMY en data/output/tmy
-    print("Calculando indicadores TMY...")
-    with mp.Pool() as pool:
+    df = cte_indicators(df)
+
+    # Calcula las máscaras de los periodos y la duración de los días antes de
+    # crear los procesos de cálculo
+    season_hours(WINTER_MONTHS)
+    season_hours(SUMMER_MONTHS)
+    if pool is None:
+        warm_cache(df["LATITUD_ETRS89"], df["LONGITUD_ETRS89"])
+
+    # Revisa los archivos TMY antes de repartir el cálculo
+    if verbose:
+        print("Revisando archivos TMY...")
+    scan_errors = {} if TEST_MODE else scan_tmy_files(df["ARCHIVO_TMY"], archive)
+    failed = df["ARCHIVO_TMY"].isin(scan_errors)
+
+    # Calcula indicadores a partir de archivos TMY en data/output/tmy o en archive
+    if verbose:
+        print("Calculando indicadores TMY...")
+    with nullcontext(pool) if pool is not None else mp.Pool(processes) as pool:
         values = [
             (
                 data["COD_INE"],
@@ -705,19 +1411,544 @@ if __name__ == "__main__":
                 data["LATITUD_ETRS89"],
                 data["ALTITUD"],
                 data["ARCHIVO_TMY"],
+                archive,
+                coord_tol,
+                compact,
+                monthly,
             )
-            for data in df.to_dict("records")
+            for data in df[~failed].to_dict("records")
         ]
-        indicators = pool.starmap(tmy_indicators, values, chunksize=100)
-        indicators_df = pd.DataFrame(indicators).set_index("COD_INE")
+        if prefetch:
+            stats = {} if stats is None else stats
+            stats.setdefault("total", 0.0)
+            stats["hilos"] = prefetch
+            stats["procesos"] = processes or mp.cpu_count()
+            start = time.perf_counter()
+            indicators = prefetch_indicators(
+                pool, values, prefetch, stats["procesos"], stats=stats
+            )
+            stats["total"] += time.perf_counter() - start
+        else:
+            indicators = pool.starmap(
+                isolated_tmy_indicators, values, chunksize=chunksize
+            )
+        errors = {ind["COD_INE"]: ind["ERROR"] for ind in indicators if "ERROR" in ind}
+        indicators = [ind for ind in indicators if "ERROR" not in ind]
+
+        # Excluye los municipios con errores, guardando el motivo
+        rejected = []
+        for data in df[failed | df["COD_INE"].isin(errors)].to_dict("records"):
+            if data["COD_INE"] in errors:
+                stage, reason = "calculo", errors[data["COD_INE"]]
+            else:
+                stage, reason = "revision", scan_errors[data["ARCHIVO_TMY"]]
+            print(
+                "AVISO: municipio {} ({}) en cuarentena: {}".format(
+                    data["COD_INE"], data["ARCHIVO_TMY"], reason
+                )
+            )
+            rejected.append(
+                {
+                    "COD_INE": data["COD_INE"],
+                    "NOMBRE_ACTUAL": data["NOMBRE_ACTUAL"],
+                    "ARCHIVO_TMY": data["ARCHIVO_TMY"],
+                    "ETAPA": stage,
+                    "MOTIVO": reason,
+                }
+            )
+        if quarantine is not None:
+            quarantine.extend(rejected)
+        if rejected:
+            df = df[~df["COD_INE"].isin([r["COD_INE"] for r in rejected])].reset_index(
+                drop=True
+            )
+
+        if monthly:
+            monthly_df = monthly_table(
+                [ind["COD_INE"] for ind in indicators],
+                [ind.pop("MENSUAL") for ind in indicators],
+            )
+        # Si todos los municipios están en cuarentena el resultado está vacío,
+        # pero con todas las columnas, para poder unirlo al de otros bloques
+        indicators_df = pd.DataFrame(
+            indicators, columns=None if indicators else ["COD_INE"] + TMY_COLUMNS
+        ).set_index("COD_INE")
         df = df.join(indicators_df, on="COD_INE")
 
     # Calcula diferencia de resultados entre indicadores CTE y TMY
-    print("Calculando diferencias...")
-    df["ZCI_DIFF"] = df.apply(
-        lambda x: zci_level(x["ZCI_TMY"]) - zci_level(x["ZCI_CTE_2019"]), 1
+    if verbose:
+        print("Calculando diferencias...")
+    df = zone_diffs(df)
+    if monthly:
+        return df, monthly_df
+    return df
+
+
+def compute_results_chunked(
+    municipios_filename,
+    output_file,
+    chunk_size=10000,
+    cod_prov=None,
+    processes=None,
+    archive=None,
+    coord_tol=0.0,
+    compact=False,
+    monthly_file=None,
+    chunksize=100,
+    quarantine=None,
+    prefetch=None,
+    stats=None,
+):
+    """Calcula los resultados de los municipios por bloques de chunk_size filas
+
+    Cada bloque se lee, se calcula y se añade a output_file antes de leer el
+    siguiente, de modo que la memoria necesaria depende del tamaño del bloque
+    y no del número de municipios. El resultado es el mismo que el de
+    compute_results con todos los municipios.
+    Si se indica monthly_file, se añaden a ese archivo los indicadores mensuales.
+    Los municipios excluidos se añaden a la lista quarantine y, con prefetch,
+    las estadísticas de lectura y cálculo al diccionario stats (ver compute_results).
+
+    Los bloques sin municipios calculados (todos en cuarentena) no añaden
+    filas, pero el primero escribe igualmente la cabecera de los archivos.
+
+    Devuelve el número de municipios calculados.
+    """
+    season_hours(WINTER_MONTHS)
+    season_hours(SUMMER_MONTHS)
+    count = 0
+    with mp.Pool(processes) as pool:
+        for i, df in enumerate(
+            iter_municipios(municipios_filename, chunk_size, cod_prov)
+        ):
+            df = compute_results(
+                df,
+                processes,
+                archive,
+                coord_tol,
+                compact,
+                pool=pool,
+                verbose=False,
+                monthly=monthly_file is not None,
+                chunksize=chunksize,
+                quarantine=quarantine,
+                prefetch=prefetch,
+                stats=stats,
+            )
+            if monthly_file is not None:
+                df, monthly_df = df
+                monthly_df.to_csv(
+                    monthly_file,
+                    mode="w" if i == 0 else "a",
+                    header=i == 0,
+                    index=False,
+                )
+            df.to_csv(
+                output_file,
+                mode="w" if i == 0 else "a",
+                header=i == 0,
+                index=False,
+            )
+            count += len(df)
+            print("\t{} municipios calculados...".format(count))
+    return count
+
+
+# Número de archivos TMY que se procesan para medir su coste en el ajuste automático
+AUTOTUNE_SAMPLE = 8
+# Duración objetivo (s) de cada grupo de municipios enviado a un proceso de cálculo
+AUTOTUNE_TASK_SECONDS = 0.5
+# Margen de seguridad sobre la memoria medida
+AUTOTUNE_MEMORY_FACTOR = 1.5
+
+
+def private_memory():
+    """Memoria (bytes) propia del proceso actual
+
+    En Linux, la memoria privada (no compartida con otros procesos, como el
+    proceso principal del que se crean los procesos de cálculo). En otros
+    sistemas, la memoria residente máxima.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            return 1024 * sum(
+                int(line.split()[1]) for line in f if line.startswith("Private_")
+            )
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def autotune_sample(
+    municipios_filename=MUNICIPIOS_FILE, archive=None, cod_prov=None, size=AUTOTUNE_SAMPLE
+):
+    """Toma los primeros size municipios con archivos TMY válidos para el ajuste automático
+
+    Recorre todo el archivo de municipios por bloques, revisando los archivos
+    TMY (ver scan_tmy_files) solo hasta reunir la muestra, de modo que unos
+    primeros municipios con archivos erróneos no dejan la muestra vacía.
+
+    Devuelve una tupla con la muestra (que puede tener menos de size
+    municipios, o ninguno) y el número total de municipios.
+    """
+    samples = []
+    found = 0
+    total = 0
+    for chunk in iter_municipios(municipios_filename, SCAN_THREADS * size, cod_prov):
+        total += len(chunk)
+        if found < size:
+            chunk = chunk[
+                ~chunk["ARCHIVO_TMY"].isin(scan_tmy_files(chunk["ARCHIVO_TMY"], archive))
+            ].head(size - found)
+            found += len(chunk)
+            samples.append(chunk)
+    sample = pd.concat(samples, ignore_index=True) if samples else pd.DataFrame()
+    return sample, total
+
+
+def _warmup_files(values):
+    """Procesa los municipios de values (argumentos de tmy_indicators) midiendo su coste
+
+    Se ejecuta en un proceso de cálculo. Devuelve una tupla con el tiempo
+    medio por archivo (s), el pico de memoria por archivo (bytes) y la memoria
+    privada del proceso (bytes) tras procesarlos.
+    """
+    # El primer archivo no se mide, para no contar la carga inicial
+    tmy_indicators(*values[0])
+    start = time.perf_counter()
+    for value in values:
+        tmy_indicators(*value)
+    file_time = (time.perf_counter() - start) / len(values)
+    tracemalloc.start()
+    tmy_indicators(*values[-1])
+    _, file_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return file_time, file_memory, private_memory()
+
+
+def autotune(
+    df,
+    max_memory,
+    archive=None,
+    coord_tol=0.0,
+    compact=False,
+    monthly=False,
+    total=None,
+    processes=None,
+    batch_size=None,
+):
+    """Elige número de procesos, tamaño de grupo y tamaño de bloque para memoria max_memory (MB)
+
+    Procesa, en un proceso de cálculo, hasta AUTOTUNE_SAMPLE municipios de df
+    (con archivos TMY válidos, ver scan_tmy_files y autotune_sample) para
+    medir el tiempo y la memoria por archivo y la memoria de cada proceso de
+    cálculo, y mide la memoria por municipio del proceso principal (datos de
+    municipios, resultados y tareas) con los resultados de la muestra. Con
+    ello elige:
+
+    - processes: número de procesos de cálculo, el máximo (hasta el número de
+      CPUs) que cabe en la memoria disponible dejando sitio para un bloque de
+      municipios de al menos processes * chunksize filas
+    - batch_size: municipios por bloque (ver compute_results_chunked), el
+      máximo que cabe en la memoria restante, o None si caben todos (total)
+    - chunksize: municipios por grupo enviado a cada proceso, para que cada
+      grupo tarde unos AUTOTUNE_TASK_SECONDS sin dejar procesos sin trabajo
+
+    Se respetan los valores de processes y batch_size indicados.
+
+    Devuelve un diccionario con los valores elegidos y las medidas, o None si
+    ningún municipio de df tiene un archivo TMY válido con el que medir.
+    """
+    sample = df[
+        ~df["ARCHIVO_TMY"].isin(scan_tmy_files(df["ARCHIVO_TMY"], archive))
+    ].head(AUTOTUNE_SAMPLE)
+    if len(sample) == 0:
+        return None
+    values = [
+        (
+            data["COD_INE"],
+            data["LONGITUD_ETRS89"],
+            data["LATITUD_ETRS89"],
+            data["ALTITUD"],
+            data["ARCHIVO_TMY"],
+            archive,
+            coord_tol,
+            compact,
+            monthly,
+        )
+        for data in sample.to_dict("records")
+    ]
+    with mp.Pool(1) as pool:
+        file_time, file_memory, worker_memory = pool.apply(_warmup_files, (values,))
+
+    # Memoria del proceso principal por municipio
+    indicators = [tmy_indicators(*value) for value in values]
+    tracemalloc.start()
+    if monthly:
+        monthly_table(
+            [ind["COD_INE"] for ind in indicators],
+            [ind.pop("MENSUAL") for ind in indicators],
+        )
+    zone_diffs(
+        cte_indicators(sample.copy()).join(
+            pd.DataFrame(indicators).set_index("COD_INE"), on="COD_INE"
+        )
     )
-    df["ZCV_DIFF"] = df["ZCV_TMY"] - df["ZCV_CTE_2019"]
+    _, row_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    row_memory = AUTOTUNE_MEMORY_FACTOR * (
+        row_memory / len(values) + sample.memory_usage(deep=True).sum() / len(sample)
+    )
+
+    available = max_memory * 1024 * 1024 - private_memory()
+    process_memory = AUTOTUNE_MEMORY_FACTOR * (worker_memory + file_memory)
+    total = len(df) if total is None else total
+    chunksize = max(1, math.ceil(AUTOTUNE_TASK_SECONDS / max(file_time, 1e-6)))
+    if processes is None:
+        processes = max(
+            1,
+            min(
+                mp.cpu_count(),
+                int(available // (process_memory + row_memory * chunksize)),
+            ),
+        )
+    if batch_size is None:
+        batch_size = int((available - processes * process_memory) // row_memory)
+        batch_size = max(batch_size, processes)
+        if batch_size >= total:
+            batch_size = None
+    rows = total if batch_size is None else batch_size
+    # Al menos 4 grupos por proceso en cada bloque, para repartir el trabajo
+    chunksize = max(1, min(chunksize, math.ceil(rows / (4 * processes))))
+
+    return {
+        "max_memory": max_memory,
+        "fits": bool(available >= processes * process_memory + rows * row_memory),
+        "processes": processes,
+        "chunksize": chunksize,
+        "batch_size": batch_size,
+        "file_time": round(file_time, 5),
+        "file_memory": int(file_memory),
+        "worker_memory": int(worker_memory),
+        "row_memory": int(row_memory),
+        "municipios": total,
+    }
+
 
-    df.to_csv("data/output/Results.csv", index=False)
-    print("Indicadores de {} municipios calculados".format(len(df)))
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="compute_indicators",
+        description="Calcula indicadores de zonificación climática de los municipios",
+    )
+    parser.add_argument(
+        "-m",
+        "--municipios_file",
+        type=str,
+        help="Archivo de datos de municipios. Valor por defecto {}".format(
+            MUNICIPIOS_FILE
+        ),
+        default=MUNICIPIOS_FILE,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="Archivo de resultados. Valor por defecto {}".format(RESULTS_FILE),
+        default=RESULTS_FILE,
+    )
+    parser.add_argument(
+        "-p",
+        "--cod_prov",
+        type=str,
+        help="Código de provincia (COD_PROV) de los municipios a calcular. Por defecto se calculan todos",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        help="Número de procesos de cálculo. Por defecto, el número de CPUs",
+        default=None,
+    )
+    parser.add_argument(
+        "-a",
+        "--tmy_archive",
+        type=str,
+        help="Archivo comprimido con los archivos TMY (ver tmy_archive.py). Por defecto se leen de {}".format(
+            TMY_DIR
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "-t",
+        "--coord_tolerance",
+        type=float,
+        help="Diferencia de coordenadas (grados) entre archivo TMY y municipio admitida sin aviso. Valor por defecto 0",
+        default=0.0,
+    )
+    parser.add_argument(
+        "-c",
+        "--compact",
+        action="store_true",
+        help="Procesa los datos horarios como float32, con la mitad de memoria",
+    )
+    parser.add_argument(
+        "--check_compact",
+        action="store_true",
+        help="Comprueba que el modo compacto obtiene las mismas severidades y zonas que el normal, sin guardar resultados",
+    )
+    parser.add_argument(
+        "-k",
+        "--chunk_size",
+        type=int,
+        help="Procesa los municipios por bloques de este número de filas, con memoria acotada. Por defecto se procesan todos a la vez",
+        default=None,
+    )
+    parser.add_argument(
+        "--max_memory",
+        type=float,
+        help="Memoria máxima (MB). Ajusta número de procesos, bloques de municipios y grupos de cálculo tras medir el coste de algunos archivos. Por defecto no se ajustan",
+        default=None,
+    )
+    parser.add_argument(
+        "--monthly_output",
+        type=str,
+        help="Archivo de indicadores mensuales en formato largo (p.e. {}). Por defecto no se genera".format(
+            MONTHLY_FILE
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "-q",
+        "--quarantine_file",
+        type=str,
+        help="Informe de municipios excluidos por errores en sus archivos TMY. Por defecto, el archivo de resultados con la extensión .quarantine.csv",
+        default=None,
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        help="Número de hilos que leen los archivos TMY por adelantado, mientras se calcula con los ya leídos. Por defecto cada proceso de cálculo lee sus archivos",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    if args.check_compact:
+        print("Cargando datos de municipios...")
+        df = load_municipios(args.municipios_file, args.cod_prov)
+        print("Comprobando modo compacto (float32)...")
+        comparison, differences, excluded = check_compact(
+            df, args.processes, args.tmy_archive
+        )
+        for cod, reason in excluded.items():
+            print("AVISO: municipio {} excluido de la comprobación: {}".format(cod, reason))
+        for col, count in differences.items():
+            print("\t{}: {} municipios con diferencias".format(col, count))
+        if any(differences[col] for col in COMPACT_CHECK_COLUMNS):
+            raise SystemExit(
+                "ERROR: el modo compacto cambia las severidades o zonas de algunos municipios"
+            )
+        print("Modo compacto correcto en {} municipios".format(len(comparison)))
+    else:
+        for filename in [args.output_file, args.monthly_output]:
+            output_dir = os.path.dirname(filename or "")
+            if output_dir and not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+
+        quarantine = []
+        stats = {}
+        chunksize = 100
+        if args.max_memory is not None:
+            print("Ajustando procesos y bloques a {} MB...".format(args.max_memory))
+            sample, total = autotune_sample(
+                args.municipios_file, args.tmy_archive, args.cod_prov
+            )
+            settings = autotune(
+                sample,
+                args.max_memory,
+                args.tmy_archive,
+                args.coord_tolerance,
+                args.compact,
+                args.monthly_output is not None,
+                total,
+                args.processes,
+                args.chunk_size,
+            )
+            if settings is None:
+                print(
+                    "AVISO: ningún municipio tiene un archivo TMY válido para el ajuste, se usan los valores por defecto"
+                )
+            else:
+                for key, value in settings.items():
+                    print("\t{}: {}".format(key, value))
+                if not settings["fits"]:
+                    print(
+                        "AVISO: la memoria indicada no es suficiente ni para un proceso y un municipio por bloque"
+                    )
+                with open(args.output_file + ".autotune.json", "w") as f:
+                    json.dump(settings, f, indent=2)
+                args.processes = settings["processes"]
+                args.chunk_size = settings["batch_size"]
+                chunksize = settings["chunksize"]
+
+        if args.chunk_size is not None:
+            print(
+                "Calculando indicadores por bloques de {} municipios...".format(
+                    args.chunk_size
+                )
+            )
+            count = compute_results_chunked(
+                args.municipios_file,
+                args.output_file,
+                args.chunk_size,
+                args.cod_prov,
+                args.processes,
+                args.tmy_archive,
+                args.coord_tolerance,
+                args.compact,
+                args.monthly_output,
+                chunksize,
+                quarantine,
+                args.prefetch,
+                stats,
+            )
+        else:
+            print("Cargando datos de municipios...")
+            df = load_municipios(args.municipios_file, args.cod_prov)
+            df = compute_results(
+                df,
+                args.processes,
+                args.tmy_archive,
+                args.coord_tolerance,
+                args.compact,
+                monthly=args.monthly_output is not None,
+                chunksize=chunksize,
+                quarantine=quarantine,
+                prefetch=args.prefetch,
+                stats=stats,
+            )
+            if args.monthly_output is not None:
+                df, monthly_df = df
+                monthly_df.to_csv(args.monthly_output, index=False)
+            df.to_csv(args.output_file, index=False)
+            count = len(df)
+
+        # El informe se escribe siempre, para no dejar el de un cálculo anterior
+        quarantine_file = args.quarantine_file
+        if quarantine_file is None:
+            quarantine_file = os.path.splitext(args.output_file)[0] + ".quarantine.csv"
+        pd.DataFrame(quarantine, columns=QUARANTINE_COLUMNS).to_csv(
+            quarantine_file, index=False
+        )
+        print("Indicadores de {} municipios calculados".format(count))
+        if args.prefetch:
+            print("Lectura anticipada de archivos TMY:")
+            for key, value in prefetch_summary(stats).items():
+                print("\t{}: {}".format(key, value))
+        if quarantine:
+            print(
+                "AVISO: {} municipios en cuarentena (ver {})".format(
+                    len(quarantine), quarantine_file
+                )
+            )
@@ -0,0 +1,64 @@
+# encoding: utf-8
+
+"""Une archivos de resultados parciales
+
+Une los archivos de resultados parciales (p.e. por provincias) generados por
+`compute_indicators.py` en un único archivo de resultados, ordenado por
+COD_INE. Los valores se copian como texto, sin reinterpretarlos, de modo que
+el resultado es idéntico al del cálculo de todos los municipios a la vez.
+"""
+
+import os
+
+import pandas as pd
+
+
+def read_partial(input_file):
+    """Lee un archivo de resultados parciales como texto
+
+    Los archivos sin municipios (p.e. de provincias con todos los municipios
+    en cuarentena, ver compute_indicators.py) pueden tener solo la cabecera o
+    estar vacíos, y en ese caso se devuelve None.
+    """
+    try:
+        return pd.read_csv(input_file, dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return None
+
+
+def concat_results(input_files, output_file):
+    """Une los archivos de resultados input_files en output_file"""
+    partials = [read_partial(f) for f in input_files]
+    df = pd.concat(
+        [partial for partial in partials if partial is not None],
+        ignore_index=True,
+    )
+    df = df.sort_values("COD_INE", kind="stable")
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    df.to_csv(output_file, index=False)
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="concat_results",
+        description="Une archivos de resultados parciales en un único archivo",
+    )
+    parser.add_argument(
+        "input_files", type=str, nargs="+", help="Archivos de resultados parciales"
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="Archivo de resultados de destino",
+        required=True,
+    )
+    args = parser.parse_args()
+
+    df = concat_results(args.input_files, args.output_file)
+    print("Resultados de {} municipios unidos".format(len(df)))
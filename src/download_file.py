@@ -1,17 +1,94 @@
 import os
+import random
+import time
 
 import requests
 
-def download_file(link, output_file):
+from tmy_archive import append_member, has_member
+
+# Códigos HTTP de respuestas que se reintentan (límite de peticiones y errores del servidor)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def fetch(link, retries=5, backoff=1.0, timeout=60):
+    """Descarga el contenido de un enlace, reintentando en caso de fallo
+
+    Se reintentan las respuestas con código en RETRY_STATUS, los errores de
+    conexión y las respuestas incompletas (con menos bytes que los indicados
+    en Content-Length), esperando entre intentos un tiempo creciente
+    exponencialmente (backoff, 2 * backoff, 4 * backoff...) o el indicado por
+    el servidor en la cabecera Retry-After.
+
+    Devuelve una tupla con el contenido (bytes) y el número de reintentos.
+    """
+    for attempt in range(retries + 1):
+        wait = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        try:
+            r = requests.get(link, timeout=timeout)
+            if r.status_code in RETRY_STATUS:
+                error = "HTTP {}".format(r.status_code)
+                retry_after = r.headers.get("Retry-After")
+                if retry_after is not None and retry_after.isdigit():
+                    wait = float(retry_after) * random.uniform(1.0, 1.5)
+            else:
+                r.raise_for_status()
+                expected = r.headers.get("Content-Length")
+                if (
+                    expected is not None
+                    and "Content-Encoding" not in r.headers
+                    and len(r.content) != int(expected)
+                ):
+                    error = "respuesta incompleta ({} de {} bytes)".format(
+                        len(r.content), expected
+                    )
+                else:
+                    return r.content, attempt
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            error = str(e)
+        if attempt == retries:
+            break
+        print(
+            "AVISO: fallo en la descarga de '{}' ({}). Reintento {} de {} en {:.1f} s".format(
+                link, error, attempt + 1, retries, wait
+            )
+        )
+        time.sleep(wait)
+    raise IOError(
+        "Error en la descarga de '{}' tras {} intentos: {}".format(
+            link, retries + 1, error
+        )
+    )
+
+
+def download_file(link, output_file, archive=None, retries=5, backoff=1.0):
     """Descarga archivo, comprobando si ya existe
 
     :param link: URL de descarga
     :param output_file: archivo de destino de la descarga
+    :param archive: archivo comprimido (ver tmy_archive.py) al que añadir la
+        descarga, como miembro con el nombre de output_file, en lugar de
+        guardarla como archivo independiente
+    :param retries: número máximo de reintentos en caso de fallo (ver fetch)
+    :param backoff: tiempo de espera (s) antes del primer reintento
+
+    El archivo de destino se escribe solo cuando la descarga ha terminado
+    correctamente, de modo que no quedan archivos incompletos.
     """
-    if not os.path.exists(output_file):
-        r = requests.get(link)
-        with open(output_file, "wb") as f:
-            f.write(r.content)
+    if archive is not None:
+        name = os.path.basename(output_file)
+        if not has_member(archive, name):
+            content, _ = fetch(link, retries, backoff)
+            append_member(archive, name, content)
+    elif not os.path.exists(output_file):
+        content, _ = fetch(link, retries, backoff)
+        tmp_file = "{}.{}.tmp".format(output_file, os.getpid())
+        with open(tmp_file, "wb") as f:
+            f.write(content)
+        os.replace(tmp_file, output_file)
     return output_file
 
 
@@ -32,6 +109,33 @@ if __name__ == "__main__":
         help="Archivo de destino de la descarga",
         required=True,
     )
+    parser.add_argument(
+        "-a",
+        "--archive",
+        type=str,
+        help="Archivo comprimido al que añadir la descarga (ver tmy_archive.py). Por defecto se guarda como archivo independiente",
+        default=None,
+    )
+    parser.add_argument(
+        "-r",
+        "--retries",
+        type=int,
+        help="Número máximo de reintentos en caso de fallo. Valor por defecto 5",
+        default=5,
+    )
+    parser.add_argument(
+        "-b",
+        "--backoff",
+        type=float,
+        help="Espera (s) antes del primer reintento, que se duplica en los siguientes. Valor por defecto 1",
+        default=1.0,
+    )
     args = parser.parse_args()
 
-    download_file(link=args.link, output_file=args.output_file)
+    download_file(
+        link=args.link,
+        output_file=args.output_file,
+        archive=args.archive,
+        retries=args.retries,
+        backoff=args.backoff,
+    )
@@ -0,0 +1,271 @@
+# coding=utf-8
+"""
+Compara los métodos de cálculo de funciones psicrométricas
+
+Para una muestra aleatoria de condiciones (temperatura seca, humedad relativa y
+presión atmosférica) calcula las funciones vectorizadas con el método exacto
+("exact") y con tablas precalculadas ("table") e informa del error máximo
+respecto al método exacto y del tiempo de cálculo de cada uno.
+
+Además, recorre una malla regular de condiciones en el rango FAST_ENVELOPE de
+psychrometrics.py y compara las funciones exactas con sus variantes rápidas
+(`dew_point_from_db_rh_fast`, `wet_bulb_from_db_rh_fast`), informando del
+error máximo, de las condiciones en las que se produce y del número de
+valores calculados por segundo de las versiones escalares y vectorizadas.
+Los errores máximos obtenidos son los de FAST_ERROR_BOUNDS, que se usan para
+elegir la variante rápida cuando su error es admisible (ver `select_variant`).
+"""
+
+import time
+
+import numpy as np
+
+from psychrometrics import (
+    FAST_ENVELOPE,
+    FAST_ERROR_BOUNDS,
+    FAST_SMALL_SIZE,
+    FAST_THROUGHPUT,
+    _d_ln_p_ws_array,
+    dew_point_from_db_rh,
+    dew_point_from_db_rh_array,
+    dew_point_from_db_rh_fast,
+    dew_point_from_db_rh_fast_array,
+    saturated_vapor_pressure_array,
+    wet_bulb_from_db_rh,
+    wet_bulb_from_db_rh_array,
+    wet_bulb_from_db_rh_fast,
+    wet_bulb_from_db_rh_fast_array,
+)
+
+
+def sample_conditions(size, seed=0):
+    """Genera condiciones aleatorias (temperatura seca, humedad relativa, presión)"""
+    rng = np.random.default_rng(seed)
+    db_temp = rng.uniform(-30.0, 50.0, size)
+    rel_humid = rng.uniform(1.0, 100.0, size)
+    b_press = rng.uniform(60000.0, 105000.0, size)
+    return db_temp, rel_humid, b_press
+
+
+def envelope_conditions(db_step=0.25, rh_step=0.5, press_step=2900.0):
+    """Malla regular de condiciones (temperatura seca, humedad relativa, presión) en FAST_ENVELOPE"""
+    axes = [
+        np.arange(low, high + step / 2, step)
+        for (low, high), step in zip(
+            FAST_ENVELOPE.values(), [db_step, rh_step, press_step]
+        )
+    ]
+    return tuple(values.ravel() for values in np.meshgrid(*axes, indexing="ij"))
+
+
+def timeit(func, repeat=5):
+    """Tiempo mínimo (s) de repeat ejecuciones de func y su último resultado"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_methods(size=8760, repeat=5, seed=0):
+    """Compara los métodos exacto y con tablas para las funciones vectorizadas
+
+    Devuelve una lista de diccionarios con el nombre de la función, el tiempo
+    de cálculo de cada método y el error máximo (relativo o absoluto) del
+    método con tablas.
+    """
+    db_temp, rel_humid, b_press = sample_conditions(size, seed)
+    cases = [
+        (
+            "saturated_vapor_pressure",
+            lambda m: saturated_vapor_pressure_array(db_temp + 273.15, m),
+            "relativo",
+        ),
+        ("_d_ln_p_ws", lambda m: _d_ln_p_ws_array(db_temp, m), "relativo"),
+        (
+            "dew_point_from_db_rh",
+            lambda m: dew_point_from_db_rh_array(db_temp, rel_humid, m),
+            "absoluto (C)",
+        ),
+        (
+            "wet_bulb_from_db_rh",
+            lambda m: wet_bulb_from_db_rh_array(db_temp, rel_humid, b_press, m),
+            "absoluto (C)",
+        ),
+    ]
+    # Construye las tablas antes de medir tiempos
+    saturated_vapor_pressure_array(300.0, "table")
+
+    results = []
+    for name, func, error_type in cases:
+        t_exact, exact = timeit(lambda: func("exact"), repeat)
+        t_table, table = timeit(lambda: func("table"), repeat)
+        if error_type == "relativo":
+            error = np.max(np.abs(table / exact - 1.0))
+        else:
+            error = np.max(np.abs(table - exact))
+        results.append(
+            {
+                "funcion": name,
+                "t_exact": t_exact,
+                "t_table": t_table,
+                "error": error,
+                "tipo_error": error_type,
+            }
+        )
+    return results
+
+
+def bench_fast(repeat=3, scalar_size=2000, small_calls=200):
+    """Compara las funciones exactas con sus variantes rápidas en FAST_ENVELOPE
+
+    Devuelve una lista de diccionarios con el nombre de la función, el error
+    máximo de la variante rápida, las condiciones en las que se produce, la
+    cota de FAST_ERROR_BOUNDS y los valores por segundo de las versiones
+    escalares (con scalar_size condiciones) y vectorizadas de cada variante,
+    estas con todas las condiciones (large) y con small_calls arrays de
+    FAST_SMALL_SIZE condiciones (small), como los de FAST_THROUGHPUT.
+    """
+    db_temp, rel_humid, b_press = envelope_conditions()
+    # Muestra de condiciones para las funciones escalares
+    step = max(1, len(db_temp) // scalar_size)
+    sample = list(zip(db_temp[::step], rel_humid[::step], b_press[::step]))
+    # Arrays pequeños de condiciones repartidas en la envolvente
+    step = len(db_temp) // FAST_SMALL_SIZE
+    small = [a[step // 2 :: step][:FAST_SMALL_SIZE] for a in (db_temp, rel_humid, b_press)]
+    cases = [
+        (
+            "dew_point_from_db_rh",
+            lambda t, rh, p: dew_point_from_db_rh_array(t, rh),
+            lambda t, rh, p: dew_point_from_db_rh_fast_array(t, rh),
+            lambda: [dew_point_from_db_rh(t, rh) for t, rh, _ in sample],
+            lambda: [dew_point_from_db_rh_fast(t, rh) for t, rh, _ in sample],
+        ),
+        (
+            "wet_bulb_from_db_rh",
+            wet_bulb_from_db_rh_array,
+            wet_bulb_from_db_rh_fast_array,
+            lambda: [wet_bulb_from_db_rh(t, rh, p) for t, rh, p in sample],
+            lambda: [wet_bulb_from_db_rh_fast(t, rh, p) for t, rh, p in sample],
+        ),
+    ]
+
+    results = []
+    for name, exact_array, fast_array, exact_scalar, fast_scalar in cases:
+        t_exact, exact = timeit(lambda: exact_array(db_temp, rel_humid, b_press), repeat)
+        t_fast, fast = timeit(lambda: fast_array(db_temp, rel_humid, b_press), repeat)
+        t_exact_small, _ = timeit(
+            lambda: [exact_array(*small) for _ in range(small_calls)], repeat
+        )
+        t_fast_small, _ = timeit(
+            lambda: [fast_array(*small) for _ in range(small_calls)], repeat
+        )
+        t_exact_scalar, _ = timeit(exact_scalar, 1)
+        t_fast_scalar, _ = timeit(fast_scalar, 1)
+        error = np.abs(fast - exact)
+        worst = int(np.argmax(error))
+        results.append(
+            {
+                "funcion": name,
+                "error": error[worst],
+                "cota": FAST_ERROR_BOUNDS[name],
+                "condiciones": (db_temp[worst], rel_humid[worst], b_press[worst]),
+                "exact": len(db_temp) / t_exact,
+                "fast": len(db_temp) / t_fast,
+                "exact_small": small_calls * FAST_SMALL_SIZE / t_exact_small,
+                "fast_small": small_calls * FAST_SMALL_SIZE / t_fast_small,
+                "exact_scalar": len(sample) / t_exact_scalar,
+                "fast_scalar": len(sample) / t_fast_scalar,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="bench_psychrometrics",
+        description="Compara precisión y velocidad de los métodos de cálculo psicrométrico",
+    )
+    parser.add_argument(
+        "-n",
+        "--size",
+        type=int,
+        help="Número de condiciones de la muestra. Valor por defecto 87600 (10 años horarios)",
+        default=87600,
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        help="Número de repeticiones de cada medida. Valor por defecto 5",
+        default=5,
+    )
+    args = parser.parse_args()
+
+    print("Muestra de {} condiciones".format(args.size))
+    print(
+        "{:<26} {:>12} {:>12} {:>9} {:>12}  {}".format(
+            "Función", "exact (ms)", "table (ms)", "speedup", "error máx.", "tipo"
+        )
+    )
+    for res in bench_methods(args.size, args.repeat):
+        print(
+            "{:<26} {:>12.2f} {:>12.2f} {:>9.2f} {:>12.2e}  {}".format(
+                res["funcion"],
+                res["t_exact"] * 1000,
+                res["t_table"] * 1000,
+                res["t_exact"] / res["t_table"],
+                res["error"],
+                res["tipo_error"],
+            )
+        )
+
+    print()
+    print(
+        "Variantes rápidas en T = {} C, HR = {} %, P = {} Pa".format(
+            *FAST_ENVELOPE.values()
+        )
+    )
+    print(
+        "{:<22} {:>10} {:>6}  {:<24} {:>28} {:>28} {:>28}".format(
+            "Función",
+            "error máx.",
+            "cota",
+            "en (T, HR, P)",
+            "escalar exact/fast (val/s)",
+            "array {} exact/fast (val/s)".format(FAST_SMALL_SIZE),
+            "array exact/fast (val/s)",
+        )
+    )
+    for res in bench_fast():
+        print(
+            "{:<22} {:>10.3f} {:>6.2f}  {:<24} {:>13.3g} {:>14.3g} {:>13.3g} {:>14.3g} {:>13.3g} {:>14.3g}".format(
+                res["funcion"],
+                res["error"],
+                res["cota"],
+                "({:.2f}, {:.1f}, {:.0f})".format(*res["condiciones"]),
+                res["exact_scalar"],
+                res["fast_scalar"],
+                res["exact_small"],
+                res["fast_small"],
+                res["exact"],
+                res["fast"],
+            )
+        )
+        if res["error"] > res["cota"]:
+            print("AVISO: el error de {} supera la cota de FAST_ERROR_BOUNDS".format(res["funcion"]))
+        # La elección de select_variant debe coincidir con la medida
+        for kind in ["small", "large"]:
+            exact_speed, fast_speed = FAST_THROUGHPUT[res["funcion"]][kind]
+            measured = res["fast" if kind == "large" else "fast_small"] > res[
+                "exact" if kind == "large" else "exact_small"
+            ]
+            if measured != (fast_speed > exact_speed):
+                print(
+                    "AVISO: la variante más rápida de {} ({}) no coincide con FAST_THROUGHPUT".format(
+                        res["funcion"], kind
+                    )
+                )
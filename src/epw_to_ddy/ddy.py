@@ -29,9 +29,15 @@ Generación de datos de diseño en formato IDF (DDY) a partir de datos climátic
 from __future__ import division
 
 import math
-from psychrometrics import rel_humid_from_db_dpt, wet_bulb_from_db_rh
+
+import numpy as np
+
+from psychrometrics import saturated_vapor_pressure_array, select_variant
 from epw_parse import read_epw
 
+# Columnas del EPW usadas para generar los días de diseño
+DDY_COLUMNS = ["mon", "day", "dbt", "dpt", "pressure", "wind_dir", "wind_speed"]
+
 LOCATION_IDF = """
 Site:Location,
     {city},
@@ -72,13 +78,24 @@ SizingPeriod:DesignDay,
 """
 
 
-def ddy_from_epw(epw_path, percentile=0.4):
-    (location, epw) = read_epw(epw_path)
+def ddy_from_epw(epw_path, percentile=0.4, tolerance=None):
+    """Genera el texto del archivo DDY para los datos del archivo EPW
+
+    percentile: percentil o lista de percentiles (entre 0 y 50) de las
+        condiciones de diseño. Para cada uno se generan los días de diseño de
+        invierno y de verano a partir de una única lectura de los datos. Los
+        percentiles de calefacción de ASHRAE (mayores de 50, como 99.6) se
+        interpretan como 100 - percentil (ver design_conditions).
+    tolerance: error máximo admitido (ºC) en la temperatura húmeda. Si la
+        cota de error de la fórmula aproximada (ver FAST_ERROR_BOUNDS en
+        psychrometrics.py) no lo supera y es más rápida (ver select_variant),
+        se usa esta en lugar del cálculo exacto. Por defecto (None) se usa
+        siempre el cálculo exacto.
+    """
+    (location, epw, _) = read_epw(epw_path, columns=DDY_COLUMNS)
+    percentiles = [percentile] if np.isscalar(percentile) else list(percentile)
     # create the DDY file
-    design_days = (
-        approximate_design_day(location["city"], epw, "WinterDesignDay", percentile),
-        approximate_design_day(location["city"], epw, "SummerDesignDay", percentile),
-    )
+    design_days = design_conditions(location["city"], epw, percentiles, tolerance)
 
     data = (
         LOCATION_IDF.format(
@@ -98,7 +115,7 @@ def ddy_from_epw(epw_path, percentile=0.4):
 
 
 def approximate_design_day(
-    location_city, epw, day_type="SummerDesignDay", percentile=0.4
+    location_city, epw, day_type="SummerDesignDay", percentile=0.4, tolerance=None
 ):
     """Get a DesignDay object derived from percentile analysis of annual EPW data.
 
@@ -112,6 +129,9 @@ def approximate_design_day(
     introduced by using only one year of data to create design days can be
     found in AHSRAE HOF 2013, Chapter 14, pg 14.
 
+    To get the design days for several percentiles or both day types use
+    design_conditions, which computes all of them in a single pass.
+
     Args:
         day_type: Text for the type of design day to be produced. Choose from.
 
@@ -121,92 +141,187 @@ def approximate_design_day(
         percentile: A number between 0 and 50 for the percentile difference
             from the most extreme conditions within the EPW to be used for
             the design day. Typical values are 0.4 and 1.0. (Default: 0.4).
+        tolerance: Maximum error (C) admitted in the wet bulb temperature. See
+            design_conditions. (Default: None, exact computation).
+    """
+    if day_type not in ("WinterDesignDay", "SummerDesignDay"):
+        raise ValueError(
+            'Unrecognized design day type "{}".\nChoose from: "SummerDesignDay", '
+            '"WinterDesignDay"'.format(day_type)
+        )
+    design_days = design_conditions(location_city, epw, [percentile], tolerance)
+    return design_days[0] if day_type == "WinterDesignDay" else design_days[1]
+
+
+def design_conditions(location_city, epw, percentiles=(0.4,), tolerance=None):
+    """Get heating and cooling design days for several percentiles in one pass.
+
+    The dry bulb temperatures are sorted once (ascending for the coldest hours
+    and descending for the hottest ones) and the averages of the coldest and
+    hottest hours for every percentile are taken from cumulative sums along
+    those orderings, so the cost of adding more percentiles is negligible.
+
+    Args:
+        location_city: Name of the location, used for the design day names.
+        epw: DataFrame with the hourly EPW data. It needs the columns in
+            DDY_COLUMNS.
+        percentiles: List of numbers between 0 and 50 for the percentile
+            difference from the most extreme conditions within the EPW to be
+            used for the design days. Typical values are 0.4, 1.0 and 2.0.
+            Values above 50 and below 100 are taken as ASHRAE heating
+            percentiles (e.g. 99.6) and mapped to 100 - percentile on the
+            cold tail (e.g. 0.4). Repeated values after the mapping are
+            computed once.
+        tolerance: Maximum error (C) admitted in the wet bulb temperature. If
+            the error bound of the fast approximation (FAST_ERROR_BOUNDS in
+            psychrometrics) is within it and it is faster (see select_variant),
+            the fast variant is used instead of the exact solver. Default is
+            None, that always uses the exact one.
+
+    Returns:
+        List of design day dicts, with the winter and summer design days for
+        each of the percentiles, in the order of percentiles.
     """
+    percentiles = _extreme_percentiles(percentiles)
+    dbt = epw.dbt.to_numpy(dtype=float)
+    dpt = epw.dpt.to_numpy(dtype=float)
+    wind_speed = epw.wind_speed.to_numpy(dtype=float)
+    wind_rad = np.radians(epw.wind_dir.to_numpy(dtype=float))
+    months = epw.mon.to_numpy()
+
     # get values used for both winter and summer design days
     avg_pres = epw.pressure.mean()
     pressure = round(avg_pres) if avg_pres != 999999 else 101325
-    avg_mon_temp = epw.groupby("mon")["dbt"].mean()
-    hr_count = int(87.6 * percentile * 2)
-    per_name = int(percentile) if int(percentile) == percentile else percentile
-
-    if day_type == "WinterDesignDay":  # create winter design day criteria
-        # get temperature at percentile and indices of coldest hours
-        temp = epw.dbt.quantile(float(percentile) / 100.0)
-        temp_range = 0
-        wb_temp = temp
-        indices = epw.dbt.nsmallest(hr_count).index.values
-
-        # get average wind speed and direction at coldest hours
-        wind_speed = round(epw.wind_speed.iloc[indices].mean(), 1)
-        rel_dirs = epw.wind_dir.iloc[indices].apply(math.radians)
-        avg_dir = circular_mean(rel_dirs)
-        wind_dir = int(math.degrees(avg_dir))
-        wind_dir = wind_dir + 360 if wind_dir < 0 else wind_dir
-
-        # get the date as the 21st of the coldest month
-        d_month = avg_mon_temp.idxmin()
-        d_day = 21
-        # return the design day object
-        day_name = "{} Heating Design Day {}% Condns DB".format(
-            location_city, 100 - per_name
-        )
-        daylight_savings = "No"
-        sky_clearness = 0.0
-    elif day_type == "SummerDesignDay":  # create summer design day criteria
-        # get temperature at percentile and indices of hottest hours
-        temp = epw.dbt.quantile(1.0 - float(percentile) / 100.0)
-        indices = epw.dbt.nlargest(hr_count).index.values
-
-        # get average humidity, wind speed and direction at hottest hours
-        dew_pt = epw.dpt.iloc[indices].mean()
-        rh = rel_humid_from_db_dpt(temp, dew_pt)
-        wb_temp = round(wet_bulb_from_db_rh(temp, rh, pressure), 1)
-        wind_speed = round(epw.wind_speed.iloc[indices].mean(), 1)
-        rel_dirs = epw.wind_dir.iloc[indices].apply(math.radians)
-        avg_dir = circular_mean(rel_dirs)
-        wind_dir = int(math.degrees(avg_dir))
-        wind_dir = wind_dir + 360 if wind_dir < 0 else wind_dir
-
-        # get the date as the 21st of the hottest month
-        d_month = avg_mon_temp.idxmax()
-        d_day = 21
-        # compute the daily range of temperature from the days of the hottest month
-        hot_mon_db = epw[epw.mon == d_month].groupby("day").dbt
-        temp_ranges = hot_mon_db.max() - hot_mon_db.min()
-        temp_range = round(temp_ranges.mean(), 1)
-
-        # return the design day object
-        day_name = "{} Cooling Design Day {}% Condns DB=>MWB".format(
-            location_city, per_name
+    mon_count = np.bincount(months, minlength=13)[1:]
+    with np.errstate(invalid="ignore"):
+        avg_mon_temp = np.bincount(months, weights=dbt, minlength=13)[1:] / mon_count
+    # months are numbered from 1. Missing months are excluded
+    cold_month = int(np.nanargmin(avg_mon_temp)) + 1
+    hot_month = int(np.nanargmax(avg_mon_temp)) + 1
+
+    # sort the dry bulb temperatures once, keeping the first of equal values
+    # as pandas nsmallest/nlargest do, and accumulate the values at those hours
+    order_cold = np.argsort(dbt, kind="stable")
+    order_hot = np.argsort(-dbt, kind="stable")
+    cold = _cumulative_sums(order_cold, wind_speed, np.sin(wind_rad), np.cos(wind_rad))
+    hot = _cumulative_sums(
+        order_hot, wind_speed, np.sin(wind_rad), np.cos(wind_rad), dpt
+    )
+
+    # temperatures at all the percentiles from the sorted data
+    sorted_dbt = dbt[order_cold]
+    winter_temps = np.quantile(sorted_dbt, [p / 100.0 for p in percentiles])
+    summer_temps = np.quantile(sorted_dbt, [1.0 - p / 100.0 for p in percentiles])
+
+    # compute the daily range of temperature from the days of the hottest month
+    hot_mon_db = epw[epw.mon == hot_month].groupby("day").dbt
+    temp_ranges = hot_mon_db.max() - hot_mon_db.min()
+    summer_temp_range = round(temp_ranges.mean(), 1)
+
+    # wet bulb temperatures at the cooling conditions for all the percentiles
+    hr_counts = [int(87.6 * percentile * 2) for percentile in percentiles]
+    dew_pts = np.array([_mean_of_first(hot, 3, hr_count) for hr_count in hr_counts])
+    rhs = 100 * (
+        saturated_vapor_pressure_array(dew_pts + 273.15)
+        / saturated_vapor_pressure_array(summer_temps + 273.15)
+    )
+    wet_bulb = select_variant("wet_bulb_from_db_rh", tolerance, len(percentiles))
+    wb_temps = np.round(wet_bulb(summer_temps, rhs, pressure), 1)
+
+    design_days = []
+    for i, percentile in enumerate(percentiles):
+        hr_count = hr_counts[i]
+        per_name = int(percentile) if int(percentile) == percentile else percentile
+
+        # winter: coldest hours
+        temp = winter_temps[i]
+        design_days.append(
+            {
+                "name": "{} Heating Design Day {}% Condns DB".format(
+                    location_city, 100 - per_name
+                ),
+                # the date is the 21st of the coldest month
+                "month": cold_month,
+                "day": 21,
+                "day_type": "WinterDesignDay",
+                "max_dbt": temp,
+                "dbt_range": 0,
+                "wbt_at_max_dbt": temp,
+                "pressure": pressure,
+                "wind_speed": round(_mean_of_first(cold, 0, hr_count), 1),
+                "wind_dir": _mean_wind_dir(cold, hr_count),
+                "is_daylight_saving_day": "No",
+                "sky_clearness": 0.0,
+            }
         )
-        daylight_savings = "Yes"
-        sky_clearness = 1.0
-    else:
-        raise ValueError(
-            'Unrecognized design day type "{}".\nChoose from: "SummerDesignDay", '
-            '"WinterDesignDay"'.format(day_type)
+
+        # summer: hottest hours
+        design_days.append(
+            {
+                "name": "{} Cooling Design Day {}% Condns DB=>MWB".format(
+                    location_city, per_name
+                ),
+                # the date is the 21st of the hottest month
+                "month": hot_month,
+                "day": 21,
+                "day_type": "SummerDesignDay",
+                "max_dbt": summer_temps[i],
+                "dbt_range": summer_temp_range,
+                "wbt_at_max_dbt": wb_temps[i],
+                "pressure": pressure,
+                "wind_speed": round(_mean_of_first(hot, 0, hr_count), 1),
+                "wind_dir": _mean_wind_dir(hot, hr_count),
+                "is_daylight_saving_day": "Yes",
+                "sky_clearness": 1.0,
+            }
         )
 
-    return {
-        "name": day_name,
-        "month": d_month,
-        "day": d_day,
-        "day_type": day_type,
-        "max_dbt": temp,
-        "dbt_range": temp_range,
-        "wbt_at_max_dbt": wb_temp,
-        "pressure": pressure,
-        "wind_speed": wind_speed,
-        "wind_dir": wind_dir,
-        "is_daylight_saving_day": daylight_savings,
-        "sky_clearness": sky_clearness,
-    }
+    return design_days
+
+
+def _extreme_percentiles(percentiles):
+    """Percentiles (0 to 50) from the most extreme conditions, in order and without repetitions.
+
+    ASHRAE heating percentiles (above 50, e.g. 99.6) are mapped to
+    100 - percentile (e.g. 0.4).
+    """
+    extreme = []
+    for percentile in percentiles:
+        percentile = float(percentile)
+        if not 0 < percentile < 100:
+            raise ValueError(
+                "Percentile {} out of range. Choose a number between 0 and 50 "
+                "(or an ASHRAE heating percentile between 50 and 100)".format(percentile)
+            )
+        if percentile > 50:
+            percentile = round(100.0 - percentile, 10)
+        if percentile not in extreme:
+            extreme.append(percentile)
+    return extreme
+
+
+def _cumulative_sums(order, *values):
+    """Cumulative sums of the values taken in the given order, with a leading 0"""
+    stacked = np.stack([v[order] for v in values])
+    return np.concatenate([np.zeros((len(values), 1)), stacked.cumsum(axis=1)], axis=1)
+
+
+def _mean_of_first(sums, row, count):
+    """Mean of the first count values of a row of cumulative sums"""
+    return sums[row, count] / count if count > 0 else float("nan")
+
+
+def _mean_wind_dir(sums, count):
+    """Circular mean (degrees, 0-360) of the wind directions of the first count hours"""
+    # the sin and cos cumulative sums are in rows 1 and 2
+    avg_dir = math.atan2(sums[1, count], sums[2, count])
+    wind_dir = int(math.degrees(avg_dir))
+    return wind_dir + 360 if wind_dir < 0 else wind_dir
 
 
 # https://en.wikipedia.org/wiki/Circular_mean
 def circular_mean(radians):
     # Calculate the circular mean using arctan2
-    mean_rad = math.atan2(
-        sum([math.sin(rad) for rad in radians]), sum([math.cos(rad) for rad in radians])
-    )
+    radians = np.asarray(radians, dtype=float)
+    mean_rad = math.atan2(np.sin(radians).sum(), np.cos(radians).sum())
     return mean_rad
@@ -21,6 +21,9 @@
 
 """
 Importa archivo EPW como tupla de datos de localización y dataframe de datos horarios
+
+Permite leer solo un subconjunto de columnas, usar tipos compactos y reutilizar
+la posición de inicio de los datos horarios para lecturas repetidas.
 """
 
 import pandas as pd
@@ -65,6 +68,30 @@ EPW_DESC = [
 EPW_NAMES = [name for (name, ctype) in EPW_DESC]
 EPW_DTYPES = {name: ctype for (name, ctype) in EPW_DESC}
 
+# Tipos compactos para las columnas que lo admiten sin pérdida de información
+# (el resto de columnas mantiene el tipo de EPW_DTYPES)
+EPW_COMPACT_DTYPES = {
+    "yr": "int16",
+    "mon": "int8",
+    "day": "int8",
+    "hr": "int8",
+    "min": "int8",
+    "dbt": "float32",
+    "dpt": "float32",
+    "rh": "int16",
+    "pressure": "int32",
+    "et_hor_r": "int16",
+    "et_dir_nr": "int16",
+    "hor_ir_ri": "float32",
+    "tot_hr": "float32",
+    "dir_nr": "float32",
+    "diff_hr": "float32",
+    "wind_dir": "float32",
+    "wind_speed": "float32",
+    "tot_sky_cover": "int16",
+    "opaque_sky_cover": "int16",
+}
+
 
 def parse_loc_line(line):
     location = line.split(",")[1:]
@@ -90,16 +117,69 @@ def parse_loc_line(line):
     return location
 
 
-def read_epw(epw_path):
-    with open(epw_path) as wf:
+def read_epw_header(epw_path):
+    """Lee la cabecera de un archivo EPW
+
+    Devuelve una tupla con el diccionario de localización (línea LOCATION)
+    y la posición (en bytes) en la que comienzan los datos horarios.
+    """
+    loc_line = None
+    with open(epw_path, "rb") as wf:
         while True:
-            line = wf.readline().strip()
+            raw_line = wf.readline()
+            if not raw_line:
+                raise ValueError(
+                    f'No se han encontrado datos horarios en el archivo "{epw_path}"'
+                )
+            line = raw_line.decode("utf-8").strip()
             if line.startswith("LOCATION"):
                 loc_line = line
             if line.startswith("DATA PERIODS,"):
                 break
+        data_offset = wf.tell()
+    location = parse_loc_line(loc_line)
+    return (location, data_offset)
+
+
+def read_epw(epw_path, columns=None, compact=False, header=None):
+    """Lee archivo EPW
+
+    epw_path: ruta al archivo EPW
+    columns: lista opcional de columnas (nombres de EPW_NAMES) a leer. Si no se
+        indica se leen todas las columnas
+    compact: si es True usa tipos compactos (float32, int16, ...) para las
+        columnas que lo admiten (ver EPW_COMPACT_DTYPES)
+    header: tupla opcional (location, data_offset) obtenida previamente con
+        read_epw_header o read_epw, para evitar leer de nuevo la cabecera
+
+    Devuelve una tupla con el diccionario de localización, el dataframe de
+    datos horarios y la posición de comienzo de los datos horarios.
+    """
+    if header is None:
+        header = read_epw_header(epw_path)
+    (location, data_offset) = header
+
+    dtypes = dict(EPW_DTYPES)
+    if compact:
+        dtypes.update(EPW_COMPACT_DTYPES)
+    if columns is not None:
+        unknown = [col for col in columns if col not in dtypes]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas en archivo EPW: {unknown}")
+        dtypes = {col: dtypes[col] for col in columns}
+
+    with open(epw_path, "rb") as wf:
+        wf.seek(data_offset)
         epw = pd.read_csv(
-            wf, sep=",", index_col=False, names=EPW_NAMES, dtype=EPW_DTYPES
+            wf,
+            sep=",",
+            index_col=False,
+            header=None,
+            names=EPW_NAMES,
+            usecols=columns,
+            dtype=dtypes,
         )
-    location = parse_loc_line(loc_line)
-    return (location, epw)
+    if columns is not None:
+        # usecols no respeta el orden indicado
+        epw = epw[list(columns)]
+    return (location, epw, data_offset)
@@ -32,17 +32,23 @@ año de datos para crear los días de diseño.
         epw_path: ruta al .epw que se usará de base para generar el archivo .ddy.
         percentile: número entre 0 y 50 que fijará el percentil de las condiciones
             más extremas utilizadas para el día de diseño. Los valores habituales
-            son 0.4 y 10 (%). Por defecto se usa 0.4.
+            son 0.4 y 10 (%). Por defecto se usa 0.4. Se pueden indicar varios
+            percentiles, y se generan los días de diseño de todos ellos. Los
+            percentiles de calefacción de ASHRAE (p.e. 99.6) equivalen a 100 -
+            percentil (p.e. 0.4).
         output_dir: directorio opcional en el que escribir el archivo .ddy.
             Si no se indica el archivo se guarda en el mismo directorio que el
             archivo .epw.
+        tolerance: error máximo admitido (ºC) en la temperatura húmeda para
+            usar la fórmula aproximada, más rápida. Por defecto se usa el
+            cálculo exacto.
 """
 
 import os
 
 from ddy import ddy_from_epw
 
-def write_ddy_from_epw(epw_file, percentile, output_dir):
+def write_ddy_from_epw(epw_file, percentile, output_dir, tolerance=None):
     """Escribe archivo de días de diseño para los datos climático del archivo EPW"""
 
     weather_path = os.path.realpath(epw_file)
@@ -60,7 +66,7 @@ def write_ddy_from_epw(epw_file, percentile, output_dir):
     ddy_path = os.path.join(ddy_dir, ddy_name)
 
     # create the DDY file
-    file_data = ddy_from_epw(weather_path, percentile)
+    file_data = ddy_from_epw(weather_path, percentile, tolerance)
     with open(ddy_path, "w") as out_f:
         try:
             out_f.write(str(file_data))
@@ -95,12 +101,22 @@ if __name__ == "__main__":
     parser.add_argument(
         "-p",
         "--percentile",
-        type=str,
-        help="Percentil (%%) usado para los días de diseño. (típicos: 1.0, 0.4). Valor por defecto 0.4%%",
-        default=0.4,
+        type=float,
+        nargs="+",
+        help="Percentil o percentiles (%%) usados para los días de diseño. (típicos: 1.0, 0.4, o 99.6 y 99 para calefacción, equivalentes a 0.4 y 1). Valor por defecto 0.4%%",
+        default=[0.4],
+        required=False,
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        help="Error máximo admitido (C) en la temperatura húmeda para usar la fórmula aproximada, más rápida. Por defecto se usa el cálculo exacto",
+        default=None,
         required=False,
     )
 
     args = parser.parse_args()
 
-    write_ddy_from_epw(args.input_file, args.percentile, args.output_dir)
+    write_ddy_from_epw(args.input_file, args.percentile, args.output_dir, args.tolerance)
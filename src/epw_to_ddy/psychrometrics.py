@@ -5,8 +5,11 @@
 # Ladybug-tools
 from __future__ import division
 
+import functools
 import math
 
+import numpy as np
+
 
 def saturated_vapor_pressure(t_kelvin):
     """Saturated vapor pressure (Pa) at a given dry bulb temperature (K).
@@ -469,7 +472,8 @@ def wet_bulb_from_db_rh_fast(db_temp, rel_humid, b_press=101325):
         e_wg = 6.112 * (math.e**((17.67 * t_w) / (t_w + 243.5)))
         eg = e_wg - (b_press / 100) * (db_temp - t_w) * 0.00066 * (1 + (0.00155 * t_w))
         e_d = e - eg
-        if e_d == 0:
+        # stop at the converged value instead of taking one more step
+        if math.fabs(e_d) <= 0.005:
             break
         else:
             if e_d < 0:
@@ -509,3 +513,559 @@ def _d_ln_p_ws(db_temp):
             4.1764768E-05 * T - 3 * 1.4452093E-08 * math.pow(T, 2) + \
             6.5459673 / T
     return d_ln_p_ws
+
+
+# Array variants ==============================================================
+# The functions below mirror the scalar functions above, but operate on NumPy
+# arrays (or anything broadcastable to them) so that whole hourly series, or
+# several of them stacked as a 2D array, can be processed in a single call.
+# Iterative solvers keep a mask of the elements that have not converged yet and
+# only update those, using the same tolerances and iteration limits as the
+# scalar functions.
+#
+# Functions that depend on the saturated vapor pressure accept a `method`
+# argument to choose between the exact equations ("exact", default) and
+# linear interpolation in precomputed tables ("table"), which is faster for
+# bulk processing. See _psychrometric_tables for the table error bounds.
+
+# Methods for the computation of the saturated vapor pressure
+PSYCHROMETRIC_METHODS = ("exact", "table")
+
+# Envelope of conditions (dry bulb temperature in C, relative humidity in %
+# and air pressure in Pa) of the weather data of Spain, used to compute the
+# error bounds of the fast variants
+FAST_ENVELOPE = {
+    "db_temp": (-20.0, 48.0),
+    "rel_humid": (5.0, 100.0),
+    "b_press": (75000.0, 104000.0),
+}
+
+# Maximum absolute error (C) of the fast variants with respect to the exact
+# array functions in FAST_ENVELOPE, as measured by bench_psychrometrics.py
+# (rounded up). Below 0 C, dew_point_from_db_rh gives the frost point (over
+# ice) while the fast formula always uses liquid water, which explains most
+# of its error.
+FAST_ERROR_BOUNDS = {
+    "dew_point_from_db_rh": 3.3,
+    "wet_bulb_from_db_rh": 0.95,
+}
+
+# Maximum size of the arrays computed element by element in
+# wet_bulb_from_db_rh_fast_array
+FAST_SCALAR_SIZE = 64
+
+# Size of the small arrays (e.g. the design percentiles of ddy.py) in the
+# throughput measurements of bench_psychrometrics.py
+FAST_SMALL_SIZE = 8
+
+# Throughput (values/s) of the (exact, fast) array functions for arrays of up
+# to FAST_SMALL_SIZE elements (small) and for the FAST_ENVELOPE conditions
+# (large), as measured by bench_psychrometrics.py. The iterations of the
+# exact wet bulb solver are vectorized, so it is faster than the fast
+# variant for large arrays, but the call overhead makes it slower for small ones.
+FAST_THROUGHPUT = {
+    "dew_point_from_db_rh": {"small": (3.5e4, 5.4e5), "large": (3.6e6, 7.3e7)},
+    "wet_bulb_from_db_rh": {"small": (9.6e3, 5.0e4), "large": (1.1e6, 6.0e5)},
+}
+
+# Temperature range (C) and step (C) of the lookup tables
+TABLE_T_MIN = -100.0
+TABLE_T_MAX = 200.0
+TABLE_STEP = 0.05
+
+
+def saturated_vapor_pressure_array(t_kelvin, method="exact"):
+    """Saturated vapor pressure (Pa) at given dry bulb temperatures (K).
+
+    Array version of saturated_vapor_pressure.
+
+    Args:
+        t_kelvin: Array of dry bulb temperatures (K).
+        method: "exact" to use the equations or "table" to interpolate in the
+            lookup tables. Default is "exact".
+
+    Returns:
+        Array of saturated vapor pressures (Pa).
+    """
+    if method == "table":
+        return np.exp(_table_lookup(np.asarray(t_kelvin, dtype=float) - 273.15, 0))
+    _check_method(method)
+    t = np.asarray(t_kelvin, dtype=float)
+    return np.exp(np.where(t <= 273.15, _ln_p_ws_ice(t), _ln_p_ws_liq(t)))
+
+
+def humid_ratio_from_db_rh_array(db_temp, rel_humid, b_press=101325, method="exact"):
+    """Humidity ratio (kg water/kg air) from air temperature (C) and relative humidity (%).
+
+    Array version of humid_ratio_from_db_rh.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        rel_humid: Array of relative humidities (%).
+        b_press: Air pressure (Pa), scalar or array. Default is pressure at
+            sea level (101325 Pa).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of humidity ratios (kg water/kg air).
+    """
+    p_ws = saturated_vapor_pressure_array(
+        np.asarray(db_temp, dtype=float) + 273.15, method
+    )
+    p_w = p_ws * (np.asarray(rel_humid, dtype=float) / 100)
+    return (p_w * 0.621945) / (b_press - p_w)
+
+
+def humid_ratio_from_db_wb_array(db_temp, wb_temp, b_press=101325, method="exact"):
+    """Humidity ratio from air temperature (C) and wet bulb temperature (C).
+
+    Array version of humid_ratio_from_db_wb.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        wb_temp: Array of wet bulb temperatures (C).
+        b_press: Air pressure (Pa), scalar or array. Default is pressure at
+            sea level (101325 Pa).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of humidity ratios (kg water / kg air).
+    """
+    db_temp = np.asarray(db_temp, dtype=float)
+    wb_temp = np.asarray(wb_temp, dtype=float)
+    p_ws = saturated_vapor_pressure_array(wb_temp + 273.15, method)
+    p_ws_star = 0.621945 * p_ws / (b_press - p_ws)
+    humid_ratio_liq = \
+        ((2501. - 2.326 * wb_temp) * p_ws_star - 1.006 * (db_temp - wb_temp)) \
+        / (2501. + 1.86 * db_temp - 4.186 * wb_temp)
+    humid_ratio_ice = \
+        ((2830. - 0.24 * wb_temp) * p_ws_star - 1.006 * (db_temp - wb_temp)) \
+        / (2830. + 1.86 * db_temp - 2.1 * wb_temp)
+    return np.where(wb_temp >= 0, humid_ratio_liq, humid_ratio_ice)
+
+
+def enthalpy_from_db_hr_array(db_temp, humid_ratio, reference_temp=0):
+    """Enthalpy (kJ/kg) at given humidity ratios (water/air) and dry bulb temperatures (C).
+
+    Array version of enthalpy_from_db_hr.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        humid_ratio: Array of humidity ratios (kg water/kg air).
+        reference_temp: Reference dry air temperature (C). Default is 0C.
+
+    Returns:
+        Array of enthalpies (kJ/kg).
+    """
+    correct_temp = np.asarray(db_temp, dtype=float) - reference_temp
+    enthalpy = 1.006 * correct_temp + humid_ratio * (2501. + 1.86 * correct_temp)
+    return np.maximum(enthalpy, 0)
+
+
+def dew_point_from_db_rh_array(db_temp, rel_humid, method="exact"):
+    """Dew point temperature (C) from air temperature (C) and relative humidity (%).
+
+    Array version of dew_point_from_db_rh. The Newton-Raphson iteration is
+    applied only to the elements that have not converged yet.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        rel_humid: Array of relative humidities (%).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of dew point temperatures (C).
+    """
+    db_temp, rel_humid = np.broadcast_arrays(
+        np.asarray(db_temp, dtype=float), np.asarray(rel_humid, dtype=float)
+    )
+    shape = db_temp.shape
+    db_temp, rel_humid = np.atleast_1d(db_temp, rel_humid)
+    p_ws = saturated_vapor_pressure_array(db_temp + 273.15, method)  # saturation pressure
+    p_w = p_ws * (rel_humid / 100)  # partial pressure
+
+    td = db_temp.copy()  # First guess for dew point temperature
+    dry = p_w <= 0  # relative humidity of 0, return absolute zero
+    active = ~dry
+    ln_vp = np.log(np.where(dry, 1.0, p_w))
+
+    index = 1
+    while active.any():
+        td_iter = td[active]
+        if method == "table":
+            ln_vp_iter = _table_lookup(td_iter, 0)
+        else:
+            ln_vp_iter = np.log(saturated_vapor_pressure_array(td_iter + 273.15))
+        d_ln_vp = _d_ln_p_ws_array(td_iter, method)
+        td_new = td_iter - (ln_vp_iter - ln_vp[active]) / d_ln_vp
+        td[active] = td_new
+
+        converged = np.abs(td_new - td_iter) <= 0.1  # 0.1 is degree C tolerance
+        active[active] = ~converged
+        if index > 100:  # 100 is the max iterations (usually only 3-5 are needed)
+            break
+        index = index + 1
+
+    td = np.minimum(td, db_temp)
+    td[dry] = -273.15
+    return td.reshape(shape)
+
+
+def wet_bulb_from_db_rh_array(db_temp, rel_humid, b_press=101325, method="exact"):
+    """Wet bulb temperature (C) from air temperature (C) and relative humidity (%).
+
+    Array version of wet_bulb_from_db_rh. The bisection is applied only to
+    the elements whose bracket is still wider than the tolerance.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        rel_humid: Array of relative humidities (%).
+        b_press: Air pressure (Pa), scalar or array. Default is pressure at
+            sea level (101325 Pa).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of wet bulb temperatures (C).
+    """
+    db_temp, rel_humid, b_press = np.broadcast_arrays(
+        np.asarray(db_temp, dtype=float),
+        np.asarray(rel_humid, dtype=float),
+        np.asarray(b_press, dtype=float),
+    )
+    shape = db_temp.shape
+    db_temp, rel_humid, b_press = np.atleast_1d(db_temp, rel_humid, b_press)
+    humid_ratio = humid_ratio_from_db_rh_array(db_temp, rel_humid, b_press, method)
+    # Initial guesses
+    wb_temp_sup = db_temp.copy()
+    wb_temp_inf = dew_point_from_db_rh_array(db_temp, rel_humid, method)
+    wb_temp = (wb_temp_inf + wb_temp_sup) / 2
+
+    active = (wb_temp_sup - wb_temp_inf) > 0.1  # 0.1 is degree C tolerance
+    index = 1
+    while active.any():
+        wb_iter = wb_temp[active]
+        w_star = humid_ratio_from_db_wb_array(
+            db_temp[active], wb_iter, b_press[active], method
+        )
+        # Get new bounds
+        above = w_star > humid_ratio[active]
+        sup = np.where(above, wb_iter, wb_temp_sup[active])
+        inf = np.where(above, wb_temp_inf[active], wb_iter)
+        wb_temp_sup[active] = sup
+        wb_temp_inf[active] = inf
+        # New guess of wet bulb temperature
+        wb_temp[active] = (sup + inf) / 2
+
+        active[active] = (sup - inf) > 0.1
+        if index >= 100:
+            break  # 100 is the max iterations (usually only 3-5 are needed)
+        index = index + 1
+    return wb_temp.reshape(shape)
+
+
+def wet_bulb_from_db_hr_array(db_temp, humid_ratio, b_press=101325, method="exact"):
+    """Wet bulb temperature (C) from air temperature (C) and humidity ratio.
+
+    Array version of wet_bulb_from_db_hr. Instead of the bisection between
+    the dew point and the dry bulb temperature of wet_bulb_from_db_rh, the
+    psychrometric equation W*(db, wb) = W is solved with the Newton-Raphson
+    method, starting from the dry bulb temperature. W* is convex in wb, so the
+    iteration decreases monotonically to the solution and usually needs 3-5
+    steps for a tolerance of 0.01 C, which makes it several times faster for
+    large arrays (e.g. hourly data of a full year) and more accurate.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        humid_ratio: Array of humidity ratios (kg water/kg air).
+        b_press: Air pressure (Pa), scalar or array. Default is pressure at
+            sea level (101325 Pa).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of wet bulb temperatures (C).
+    """
+    db_temp, humid_ratio, b_press = np.broadcast_arrays(
+        np.asarray(db_temp, dtype=float),
+        np.asarray(humid_ratio, dtype=float),
+        np.asarray(b_press, dtype=float),
+    )
+    shape = db_temp.shape
+    db_temp, humid_ratio, b_press = np.atleast_1d(db_temp, humid_ratio, b_press)
+
+    wb_temp = db_temp.copy()  # First guess for wet bulb temperature
+    index = 1
+    while True:
+        p_ws = saturated_vapor_pressure_array(wb_temp + 273.15, method)
+        p_ws_star = 0.621945 * p_ws / (b_press - p_ws)
+        d_p_ws_star = p_ws_star * b_press / (b_press - p_ws) \
+            * _d_ln_p_ws_array(wb_temp, method)
+        # coefficients of humid_ratio_from_db_wb over water and over ice
+        liq = wb_temp >= 0
+        h_0 = np.where(liq, 2501., 2830.)
+        h_1 = np.where(liq, 2.326, 0.24)
+        h_2 = np.where(liq, 4.186, 2.1)
+        num = (h_0 - h_1 * wb_temp) * p_ws_star - 1.006 * (db_temp - wb_temp)
+        den = h_0 + 1.86 * db_temp - h_2 * wb_temp
+        d_num = (h_0 - h_1 * wb_temp) * d_p_ws_star - h_1 * p_ws_star + 1.006
+        step = (num / den - humid_ratio) / ((d_num * den + h_2 * num) / den**2)
+        wb_temp = np.minimum(wb_temp - step, db_temp)
+
+        if np.all(np.abs(step) <= 0.01):  # 0.01 is degree C tolerance
+            break
+        if index >= 100:
+            break  # 100 is the max iterations (usually only 3-5 are needed)
+        index = index + 1
+    return wb_temp.reshape(shape)
+
+
+def dew_point_from_db_rh_fast_array(db_temp, rel_humid):
+    """Dew point temperature (C) from air temperature (C) and relative humidity (%).
+
+    Array version of dew_point_from_db_rh_fast. See FAST_ERROR_BOUNDS for its
+    maximum error with respect to dew_point_from_db_rh_array.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        rel_humid: Array of relative humidities (%).
+
+    Returns:
+        Array of dew point temperatures (C).
+    """
+    db_temp = np.asarray(db_temp, dtype=float)
+    rel_humid = np.asarray(rel_humid, dtype=float)
+    es = 6.112 * np.exp((17.67 * db_temp) / (db_temp + 243.5))
+    e = (es * rel_humid) / 100
+    dry = e <= 0  # relative humidity of 0, return absolute zero
+    ln_e = np.log(np.where(dry, 6.112, e) / 6.112)
+    return np.where(dry, -273.15, (243.5 * ln_e) / (17.67 - ln_e))
+
+
+def wet_bulb_from_db_rh_fast_array(db_temp, rel_humid, b_press=101325):
+    """Wet bulb temperature (C) from air temperature (C) and relative humidity (%).
+
+    Array version of wet_bulb_from_db_rh_fast. The incremental search is
+    applied only to the elements that have not converged yet. It needs many
+    more iterations than the exact solvers, so arrays of up to
+    FAST_SCALAR_SIZE elements are computed element by element with the
+    scalar function, which is faster for them. See FAST_ERROR_BOUNDS for its
+    maximum error with respect to wet_bulb_from_db_rh_array.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        rel_humid: Array of relative humidities (%).
+        b_press: Air pressure (Pa), scalar or array. Default is pressure at
+            sea level (101325 Pa).
+
+    Returns:
+        Array of wet bulb temperatures (C).
+    """
+    db_temp, rel_humid, b_press = np.broadcast_arrays(
+        np.asarray(db_temp, dtype=float),
+        np.asarray(rel_humid, dtype=float),
+        np.asarray(b_press, dtype=float),
+    )
+    shape = db_temp.shape
+    db_temp, rel_humid, b_press = np.atleast_1d(db_temp, rel_humid, b_press)
+    if db_temp.size <= FAST_SCALAR_SIZE:
+        wb_temp = [
+            wet_bulb_from_db_rh_fast(db, rh, press)
+            for db, rh, press in zip(db_temp.flat, rel_humid.flat, b_press.flat)
+        ]
+        return np.array(wb_temp, dtype=float).reshape(shape)
+    es = 6.112 * np.exp((17.67 * db_temp) / (db_temp + 243.5))
+    e = (es * rel_humid) / 100
+    t_w = np.zeros(db_temp.shape)
+    increase = np.full(db_temp.shape, 10.0)
+    previoussign = np.ones(db_temp.shape)
+
+    active = np.ones(db_temp.shape, dtype=bool)
+    index = 1
+    while active.any():
+        t_w_iter = t_w[active]
+        e_wg = 6.112 * np.exp((17.67 * t_w_iter) / (t_w_iter + 243.5))
+        eg = e_wg - (b_press[active] / 100) * (db_temp[active] - t_w_iter) \
+            * 0.00066 * (1 + (0.00155 * t_w_iter))
+        e_d = e[active] - eg
+        # the step is divided by 10 when the sign of the difference changes
+        cursign = np.where(e_d < 0, -1.0, 1.0)
+        changed = cursign != previoussign[active]
+        inc = np.where(changed, increase[active] / 10, increase[active])
+        previoussign[active] = cursign
+        increase[active] = inc
+        converged = np.abs(e_d) <= 0.005
+        t_w[active] = np.where(converged, t_w_iter, t_w_iter + inc * cursign)
+        active[active] = ~converged
+        if index >= 1000:
+            break  # the search usually needs less than 100 steps
+        index = index + 1
+    return t_w.reshape(shape)
+
+
+def select_variant(name, tolerance=None, size=None):
+    """Array function for name, the fast variant if it is accurate and faster.
+
+    Args:
+        name: "dew_point_from_db_rh" or "wet_bulb_from_db_rh".
+        tolerance: Maximum absolute error (C) admitted. The fast variant is
+            selected if its error bound in FAST_ERROR_BOUNDS is within the
+            tolerance and its throughput in FAST_THROUGHPUT is higher than
+            that of the exact function. Default is None, that always selects
+            the exact function.
+        size: Size of the arrays, to compare the throughputs of small arrays
+            (up to FAST_SMALL_SIZE elements) or large ones. Default is None,
+            for large arrays.
+
+    Returns:
+        Array function (exact or fast variant). Both accept the dry bulb
+        temperature and relative humidity (and the air pressure for the wet
+        bulb temperature) as first arguments.
+    """
+    variants = {
+        "dew_point_from_db_rh": (
+            dew_point_from_db_rh_array,
+            dew_point_from_db_rh_fast_array,
+        ),
+        "wet_bulb_from_db_rh": (
+            wet_bulb_from_db_rh_array,
+            wet_bulb_from_db_rh_fast_array,
+        ),
+    }
+    if name not in variants:
+        raise ValueError(
+            'Unrecognized psychrometric function "{}".\nChoose from: {}'.format(
+                name, ", ".join(variants)
+            )
+        )
+    exact, fast = variants[name]
+    if tolerance is None or FAST_ERROR_BOUNDS[name] > tolerance:
+        return exact
+    kind = "small" if size is not None and size <= FAST_SMALL_SIZE else "large"
+    exact_speed, fast_speed = FAST_THROUGHPUT[name][kind]
+    return fast if fast_speed > exact_speed else exact
+
+
+def _d_ln_p_ws_array(db_temp, method="exact"):
+    """Array version of _d_ln_p_ws.
+
+    Args:
+        db_temp : Array of dry bulb temperatures (C).
+        method: "exact" or "table". Default is "exact".
+
+    Returns:
+        Array of derivatives of natural log of vapor pressure of saturated air in Pa.
+    """
+    if method == "table":
+        return _table_lookup(np.asarray(db_temp, dtype=float), 1)
+    _check_method(method)
+    db_temp = np.asarray(db_temp, dtype=float)
+    T = db_temp + 273.15  # temperature in kelvin
+    return np.where(db_temp <= 0., _d_ln_p_ws_ice(T), _d_ln_p_ws_liq(T))
+
+
+def _ln_p_ws_ice(t):
+    """Log of saturated vapor pressure (Pa) over ice at temperatures t (K)."""
+    return -5.6745359E+03 / t + 6.3925247 - 9.677843E-03 * t + \
+        6.2215701E-07 * t**2 + 2.0747825E-09 * t**3 - \
+        9.484024E-13 * t**4 + 4.1635019 * np.log(t)
+
+
+def _ln_p_ws_liq(t):
+    """Log of saturated vapor pressure (Pa) over liquid water at temperatures t (K)."""
+    return -5.8002206E+03 / t + 1.3914993 - 4.8640239E-02 * t + \
+        4.1764768E-05 * t**2 - 1.4452093E-08 * t**3 + \
+        6.5459673 * np.log(t)
+
+
+def _d_ln_p_ws_ice(T):
+    """Derivative of _ln_p_ws_ice at temperatures T (K)."""
+    return 5.6745359E+03 / T**2 - 9.677843E-03 + 2 * \
+        6.2215701E-07 * T + 3 * 2.0747825E-09 * T**2 - 4 * \
+        9.484024E-13 * T**3 + 4.1635019 / T
+
+
+def _d_ln_p_ws_liq(T):
+    """Derivative of _ln_p_ws_liq at temperatures T (K)."""
+    return 5.8002206E+03 / T**2 - 4.8640239E-02 + 2 * \
+        4.1764768E-05 * T - 3 * 1.4452093E-08 * T**2 + \
+        6.5459673 / T
+
+
+def _check_method(method):
+    """Raise a ValueError if method is not one of PSYCHROMETRIC_METHODS."""
+    if method not in PSYCHROMETRIC_METHODS:
+        raise ValueError(
+            'Unrecognized psychrometric method "{}".\nChoose from: {}'.format(
+                method, ", ".join(PSYCHROMETRIC_METHODS)
+            )
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _psychrometric_tables():
+    """Lookup tables of ln(p_ws) and its derivative, d ln(p_ws) / dT.
+
+    There is one set of knots for temperatures at or below freezing (ice) and
+    another one for temperatures above freezing (liquid water), both with a
+    knot at 0 C, so that the discontinuity of the equations at the freezing
+    point is kept. The tables are built on first use and cached.
+
+    Linear interpolation in TABLE_STEP (0.05 C) steps, between TABLE_T_MIN and
+    TABLE_T_MAX, has these maximum errors with respect to the exact equations:
+
+        - saturated vapor pressure: relative error below 1e-6
+        - derivative of ln(p_ws): relative error below 1e-7
+
+    Returns:
+        Tuple with the values at the knots and the slopes of the intervals
+        starting at each knot, as 2D arrays with rows for ln(p_ws) and
+        d ln(p_ws) / dT and columns for the ice knots followed by the liquid
+        water knots.
+    """
+    n_ice = int(round(-TABLE_T_MIN / TABLE_STEP)) + 1
+    n_liq = int(round(TABLE_T_MAX / TABLE_STEP)) + 1
+    t_ice = np.arange(1 - n_ice, 1) * TABLE_STEP + 273.15
+    t_liq = np.arange(0, n_liq) * TABLE_STEP + 273.15
+    knots = np.concatenate(
+        [
+            np.stack([_ln_p_ws_ice(t_ice), _d_ln_p_ws_ice(t_ice)]),
+            np.stack([_ln_p_ws_liq(t_liq), _d_ln_p_ws_liq(t_liq)]),
+        ],
+        axis=1,
+    )
+    slopes = np.diff(knots, axis=1, append=knots[:, -1:])
+    # there's no interval between the last ice knot and the first liquid knot
+    slopes[:, n_ice - 1] = 0.0
+    return knots, slopes
+
+
+def _table_lookup(db_temp, row):
+    """Interpolate row 0 (ln p_ws) or 1 (d ln p_ws / dT) of the lookup tables.
+
+    Temperatures out of the table range are computed with the exact equations.
+
+    Args:
+        db_temp: Array of dry bulb temperatures (C).
+        row: 0 for ln(p_ws) and 1 for its derivative.
+
+    Returns:
+        Array of interpolated values.
+    """
+    knots, slopes = _psychrometric_tables()
+    # position of each temperature in the joined ice and liquid tables. The
+    # liquid knots are displaced one position by the duplicated 0 C knot
+    pos = (db_temp - TABLE_T_MIN) * (1.0 / TABLE_STEP) + (db_temp > 0.0)
+    out_of_range = ~((db_temp >= TABLE_T_MIN) & (db_temp <= TABLE_T_MAX))
+    has_out_of_range = out_of_range.any()
+    if has_out_of_range:
+        pos = np.where(out_of_range, 0.0, pos)
+    idx = pos.astype(np.int64)
+    result = knots[row][idx] + slopes[row][idx] * (pos - idx)
+    if has_out_of_range:
+        exact_t = db_temp[out_of_range]
+        if row == 0:
+            exact = np.log(saturated_vapor_pressure_array(exact_t + 273.15))
+        else:
+            exact = _d_ln_p_ws_array(exact_t)
+        result = np.asarray(result)
+        result[out_of_range] = exact
+    return result
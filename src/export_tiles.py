@@ -0,0 +1,283 @@
+# encoding: utf-8
+
+"""Exporta los resultados de zonificación climática como teselas de puntos para visores web
+
+Lee `data/output/Results.csv` y genera, en `data/output/tiles`, teselas JSON
+con el esquema de teselas de Web Mercator (z/x/y, como las de OpenStreetMap):
+
+- `{z}/{x}/{y}.json`: puntos de la tesela y, de cada municipio, solo los
+  atributos que usa el visor (TILE_COLUMNS). Los datos se guardan como una
+  lista de columnas y una lista de filas, para reducir el tamaño.
+- en los niveles de zoom bajos (hasta cluster_zoom) los municipios se agrupan
+  en una malla de CLUSTER_PIXELS píxeles de cada tesela, y cada grupo guarda
+  su posición media, el número de municipios, la población, las zonas más
+  frecuentes y el número de municipios con cambio de zona (CLUSTER_COLUMNS)
+- `index.json`: índice espacial con los límites de los datos, las columnas,
+  los niveles de zoom y, para cada nivel, las teselas existentes con su número
+  de puntos y sus límites, de modo que el visor solo pide las teselas con datos
+  de la zona visible
+
+Uso:
+
+    python3 src/export_tiles.py --input_file data/output/Results.csv --output_dir data/output/tiles
+"""
+
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+RESULTS_FILE = "data/output/Results.csv"
+TILES_DIR = "data/output/tiles"
+
+# Niveles de zoom (España peninsular ocupa 2x2 teselas en el nivel 5)
+MIN_ZOOM = 5
+MAX_ZOOM = 10
+# Último nivel de zoom en el que se agrupan los municipios
+CLUSTER_ZOOM = 7
+# Tamaño (píxeles) de las celdas de agrupación en una tesela de 256 píxeles
+CLUSTER_PIXELS = 32
+TILE_PIXELS = 256
+# Decimales de las coordenadas (~1 m)
+COORD_DECIMALS = 5
+
+# Atributos de los municipios en las teselas de puntos
+TILE_COLUMNS = [
+    "COD_INE",
+    "NOMBRE_ACTUAL",
+    "ZCI_CTE_2019",
+    "ZCV_CTE_2019",
+    "ZCI_TMY",
+    "ZCV_TMY",
+    "ZCI_DIFF",
+    "ZCV_DIFF",
+]
+# Atributos de los grupos de municipios en las teselas agrupadas
+CLUSTER_COLUMNS = [
+    "MUNICIPIOS",
+    "POBLACION",
+    "ZCI_CTE_2019",
+    "ZCV_CTE_2019",
+    "ZCI_TMY",
+    "ZCV_TMY",
+    "N_ZCI_DIFF",
+    "N_ZCV_DIFF",
+]
+
+
+def load_results(results_filename=RESULTS_FILE):
+    """Lee las columnas necesarias para las teselas de un archivo de resultados"""
+    return pd.read_csv(
+        results_filename,
+        usecols=TILE_COLUMNS + ["POBLACION_MUNI", "LONGITUD_ETRS89", "LATITUD_ETRS89"],
+        dtype={
+            "COD_INE": str,
+            "NOMBRE_ACTUAL": str,
+            "POBLACION_MUNI": int,
+            "ZCI_CTE_2019": str,
+            "ZCV_CTE_2019": int,
+            "ZCI_TMY": str,
+            "ZCV_TMY": int,
+            "ZCI_DIFF": int,
+            "ZCV_DIFF": int,
+        },
+    )
+
+
+def mercator(lon, lat):
+    """Coordenadas de Web Mercator normalizadas (entre 0 y 1) de longitudes y latitudes (grados)
+
+    x crece hacia el este e y hacia el sur, como en el esquema de teselas z/x/y
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """Límites (oeste, sur, este, norte) en grados de la tesela z/x/y"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return [x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)]
+
+
+def _mode(values):
+    """Valor más frecuente (el menor en caso de empate)"""
+    return values.value_counts(sort=False).sort_index().idxmax()
+
+
+def point_tiles(df, z):
+    """Teselas de puntos del nivel z
+
+    Devuelve un diccionario {(x, y): lista de filas (TILE_COLUMNS, LON, LAT)}
+    """
+    tiles = {}
+    for (x, y), group in df.groupby(["TX", "TY"], sort=True):
+        rows = group[TILE_COLUMNS].assign(
+            LON=group["LONGITUD_ETRS89"].round(COORD_DECIMALS),
+            LAT=group["LATITUD_ETRS89"].round(COORD_DECIMALS),
+        )
+        tiles[(int(x), int(y))] = rows.values.tolist()
+    return tiles
+
+
+def cluster_tiles(df, z):
+    """Teselas del nivel z con los municipios agrupados en celdas de CLUSTER_PIXELS
+
+    Devuelve un diccionario {(x, y): lista de filas (CLUSTER_COLUMNS, LON, LAT)}
+    """
+    bins = TILE_PIXELS // CLUSTER_PIXELS
+    df = df.assign(
+        BX=np.floor(df["MX"] * 2 ** z * bins).astype(int),
+        BY=np.floor(df["MY"] * 2 ** z * bins).astype(int),
+        CAMBIO_ZCI=(df["ZCI_DIFF"] != 0).astype(int),
+        CAMBIO_ZCV=(df["ZCV_DIFF"] != 0).astype(int),
+    )
+    clusters = (
+        df.groupby(["TX", "TY", "BX", "BY"], sort=True)
+        .agg(
+            MUNICIPIOS=("COD_INE", "size"),
+            POBLACION=("POBLACION_MUNI", "sum"),
+            ZCI_CTE_2019=("ZCI_CTE_2019", _mode),
+            ZCV_CTE_2019=("ZCV_CTE_2019", _mode),
+            ZCI_TMY=("ZCI_TMY", _mode),
+            ZCV_TMY=("ZCV_TMY", _mode),
+            N_ZCI_DIFF=("CAMBIO_ZCI", "sum"),
+            N_ZCV_DIFF=("CAMBIO_ZCV", "sum"),
+            LON=("LONGITUD_ETRS89", "mean"),
+            LAT=("LATITUD_ETRS89", "mean"),
+        )
+        .reset_index()
+    )
+    clusters["LON"] = clusters["LON"].round(COORD_DECIMALS)
+    clusters["LAT"] = clusters["LAT"].round(COORD_DECIMALS)
+    tiles = {}
+    for (x, y), group in clusters.groupby(["TX", "TY"], sort=True):
+        tiles[(int(x), int(y))] = group[CLUSTER_COLUMNS + ["LON", "LAT"]].values.tolist()
+    return tiles
+
+
+def build_tiles(df, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, cluster_zoom=CLUSTER_ZOOM):
+    """Calcula las teselas de todos los niveles de zoom
+
+    Devuelve una tupla con un diccionario {(z, x, y): filas de la tesela} y el
+    índice espacial (ver el formato de index.json en la descripción del módulo)
+    """
+    mx, my = mercator(df["LONGITUD_ETRS89"], df["LATITUD_ETRS89"])
+    df = df.assign(MX=mx, MY=my)
+    tiles = {}
+    index = {
+        "bounds": [
+            round(df["LONGITUD_ETRS89"].min(), COORD_DECIMALS),
+            round(df["LATITUD_ETRS89"].min(), COORD_DECIMALS),
+            round(df["LONGITUD_ETRS89"].max(), COORD_DECIMALS),
+            round(df["LATITUD_ETRS89"].max(), COORD_DECIMALS),
+        ],
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "cluster_zoom": cluster_zoom,
+        "columns": TILE_COLUMNS + ["LON", "LAT"],
+        "cluster_columns": CLUSTER_COLUMNS + ["LON", "LAT"],
+        "municipios": len(df),
+        "zooms": {},
+    }
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2 ** z
+        zdf = df.assign(
+            TX=np.floor(df["MX"] * n).astype(int), TY=np.floor(df["MY"] * n).astype(int)
+        )
+        if z <= cluster_zoom:
+            z_tiles = cluster_tiles(zdf, z)
+        else:
+            z_tiles = point_tiles(zdf, z)
+        index["zooms"][str(z)] = [
+            {"x": x, "y": y, "n": len(rows), "bounds": tile_bounds(z, x, y)}
+            for (x, y), rows in z_tiles.items()
+        ]
+        for (x, y), rows in z_tiles.items():
+            tiles[(z, x, y)] = rows
+    return tiles, index
+
+
+def write_tiles(tiles, index, output_dir=TILES_DIR):
+    """Escribe las teselas y el índice en output_dir
+
+    Se borran antes las teselas de una exportación anterior en output_dir
+    (las carpetas de los niveles de zoom del índice anterior).
+    """
+    index_file = os.path.join(output_dir, "index.json")
+    if os.path.exists(index_file):
+        with open(index_file, "r") as f:
+            old_zooms = json.load(f).get("zooms", {})
+        for z in old_zooms:
+            shutil.rmtree(os.path.join(output_dir, z), ignore_errors=True)
+
+    for (z, x, y), rows in tiles.items():
+        tile_dir = os.path.join(output_dir, str(z), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        with open(os.path.join(tile_dir, "{}.json".format(y)), "w") as f:
+            json.dump({"z": z, "x": x, "y": y, "rows": rows}, f, separators=(",", ":"))
+    with open(index_file, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="export_tiles",
+        description="Exporta los resultados de zonificación como teselas de puntos para visores web",
+    )
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        type=str,
+        help="Archivo de resultados. Valor por defecto {}".format(RESULTS_FILE),
+        default=RESULTS_FILE,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        help="Carpeta de las teselas. Valor por defecto {}".format(TILES_DIR),
+        default=TILES_DIR,
+    )
+    parser.add_argument(
+        "--min_zoom",
+        type=int,
+        help="Nivel de zoom mínimo. Valor por defecto {}".format(MIN_ZOOM),
+        default=MIN_ZOOM,
+    )
+    parser.add_argument(
+        "--max_zoom",
+        type=int,
+        help="Nivel de zoom máximo. Valor por defecto {}".format(MAX_ZOOM),
+        default=MAX_ZOOM,
+    )
+    parser.add_argument(
+        "--cluster_zoom",
+        type=int,
+        help="Último nivel de zoom con municipios agrupados. Valor por defecto {}".format(
+            CLUSTER_ZOOM
+        ),
+        default=CLUSTER_ZOOM,
+    )
+    args = parser.parse_args()
+
+    print("Cargando resultados...")
+    df = load_results(args.input_file)
+    print("Calculando teselas...")
+    tiles, index = build_tiles(df, args.min_zoom, args.max_zoom, args.cluster_zoom)
+    write_tiles(tiles, index, args.output_dir)
+    print(
+        "{} teselas de {} municipios en los niveles de zoom {} a {}".format(
+            len(tiles), len(df), args.min_zoom, args.max_zoom
+        )
+    )
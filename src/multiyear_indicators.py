@@ -0,0 +1,310 @@
+# encoding: utf-8
+
+"""Calcula indicadores de zonificación climática para cada año de series horarias
+
+Un año meteorológico tipo (TMY) oculta la variabilidad entre años. Para
+estudiar la estabilidad de la zonificación, este script calcula SCI, SCV y
+las zonas climáticas de cada año de las series horarias de PV-GIS
+(2005-2020) de cada municipio, leídas de `data/output/series/{ARCHIVO_TMY}`.
+
+Las series se obtienen de la API `seriescalc` de PV-GIS, sobre plano
+horizontal y con componentes de la radiación (ver regla download_series_loc
+del Snakefile). Estos archivos incluyen, tras unas líneas de cabecera, las
+columnas:
+
+- time: fecha y hora (UTC) en formato AAAAMMDD:HHMM
+- Gb(i): radiación directa sobre el plano (horizontal), W/m²
+- Gd(i), Gr(i): radiación difusa y reflejada sobre el plano, W/m²
+- H_sun: altura solar, en grados
+- T2m: temperatura del aire a 2m, ºC
+- WS10m: velocidad del viento a 10m, m/s
+- Int: 1 si la radiación se ha reconstruido
+
+La radiación directa normal se obtiene como Gb(n) = Gb(i) / sin(H_sun). Los
+indicadores de cada año se calculan con `compute_ind` de
+compute_indicators.py, con los periodos de invierno y verano de ese año
+natural (teniendo en cuenta los años bisiestos).
+
+Los archivos se leen por bloques y se procesa cada año en cuanto está
+completo, de modo que la memoria necesaria es la de un año de datos.
+
+Genera los archivos:
+
+- `data/output/ResultsYears.csv`: indicadores de cada municipio y año
+  (COD_INE, AÑO, GD_I, GD_V, n_N, SCI, SCV, ZCI, ZCV)
+- `data/output/ResultsYearsSummary.csv`: resumen por municipio con el número
+  de años, media y desviación típica de SCI y SCV, zonas más frecuentes
+  (ZCI_MODA, ZCV_MODA) y porcentaje de años en cada zona (PCT_ZCI_x, PCT_ZCV_x)
+"""
+
+import multiprocessing as mp
+import os
+
+import numpy as np
+import pandas as pd
+
+from compute_indicators import (
+    MUNICIPIOS_FILE,
+    SUMMER_MONTHS,
+    WINTER_MONTHS,
+    ZCI_NAMES,
+    ZCV_NAMES,
+    compute_ind,
+    load_municipios,
+    season_hours,
+)
+from solar import warm_cache
+
+SERIES_DIR = "data/output/series"
+YEARS_FILE = "data/output/ResultsYears.csv"
+SUMMARY_FILE = "data/output/ResultsYearsSummary.csv"
+
+# Columnas de las series horarias que se usan en el cálculo
+SERIES_DTYPES = {
+    "time": str,
+    "Gb(i)": np.float64,
+    "H_sun": np.float64,
+    "T2m": np.float64,
+}
+# Columnas del archivo de indicadores anuales
+YEARS_COLUMNS = ["COD_INE", "AÑO", "GD_I", "GD_V", "n_N", "SCI", "SCV", "ZCI", "ZCV"]
+
+
+def series_layout(series_filename):
+    """Número de líneas de cabecera y de datos de un archivo de series horarias de PV-GIS
+
+    Los datos empiezan en la línea con los nombres de columnas ("time,...") y
+    terminan en la primera línea vacía.
+    """
+    header_lines = None
+    data_lines = 0
+    with open(series_filename, "r") as f:
+        for i, line in enumerate(f):
+            if header_lines is None:
+                if line.startswith("time,"):
+                    header_lines = i
+            elif line.strip():
+                data_lines += 1
+            else:
+                break
+    if header_lines is None:
+        raise ValueError(
+            "'{}' no es un archivo de series horarias de PV-GIS".format(series_filename)
+        )
+    return header_lines, data_lines
+
+
+def iter_years(series_filename, chunk_size=8784):
+    """Devuelve, año a año, tuplas (año, dataframe) con los datos horarios de la serie
+
+    El dataframe tiene las columnas T2m y Gb(n) (radiación directa normal).
+    Se leen bloques de chunk_size filas y solo se guardan en memoria los datos
+    del año en curso.
+    """
+    header_lines, data_lines = series_layout(series_filename)
+    pending = []
+    with pd.read_csv(
+        series_filename,
+        skiprows=header_lines,
+        nrows=data_lines,
+        usecols=list(SERIES_DTYPES),
+        dtype=SERIES_DTYPES,
+        chunksize=chunk_size,
+    ) as reader:
+        for chunk in reader:
+            years = chunk["time"].str[:4].astype(int).to_numpy()
+            # Límites de los años dentro del bloque
+            bounds = np.flatnonzero(np.diff(years)) + 1
+            for part in np.split(np.arange(len(chunk)), bounds):
+                part_df = chunk.iloc[part]
+                year = years[part[0]]
+                if pending and pending[0][0] != year:
+                    yield _year_data(pending)
+                    pending = []
+                pending.append((year, part_df))
+    if pending:
+        yield _year_data(pending)
+
+
+def _year_data(parts):
+    """Une los bloques de datos de un año y calcula la radiación directa normal"""
+    year = int(parts[0][0])
+    df = pd.concat([part for _, part in parts], ignore_index=True)
+    h_sun = df["H_sun"].to_numpy()
+    sun_up = h_sun > 0.0
+    gbn = np.zeros(len(df))
+    gbn[sun_up] = df["Gb(i)"].to_numpy()[sun_up] / np.sin(np.radians(h_sun[sun_up]))
+    return year, pd.DataFrame({"T2m": df["T2m"].to_numpy(), "Gb(n)": gbn})
+
+
+def hours_in_year(year):
+    """Número de horas del año"""
+    return len(season_hours((1, 12), year))
+
+
+def year_indicators(cod, long, lat, series_filename):
+    """Calcula los indicadores de cada año completo de la serie horaria de un municipio
+
+    Devuelve una lista de diccionarios, uno por año.
+    """
+    results = []
+    for year, df in iter_years(series_filename):
+        if len(df) != hours_in_year(year):
+            print(
+                "AVISO: '{}' año {} incompleto ({} horas), se omite".format(
+                    series_filename, year, len(df)
+                )
+            )
+            continue
+        ind = compute_ind(df, lat, long, year=year)
+        results.append(
+            {
+                "COD_INE": cod,
+                "AÑO": year,
+                "GD_I": ind["GD_I"],
+                "GD_V": ind["GD_V"],
+                "n_N": ind["n_N"],
+                "SCI": ind["SCI"],
+                "SCV": ind["SCV"],
+                "ZCI": ind["ZCI_TMY"],
+                "ZCV": ind["ZCV_TMY"],
+            }
+        )
+    return results
+
+
+def summarize_years(years_df):
+    """Resumen por municipio de los indicadores anuales
+
+    Incluye número de años, media y desviación típica de SCI y SCV, zonas más
+    frecuentes y porcentaje de años en cada zona
+    """
+    grouped = years_df.groupby("COD_INE", sort=False)
+    summary = pd.DataFrame(
+        {
+            "N_AÑOS": grouped.size(),
+            "SCI_MEDIA": grouped["SCI"].mean().round(3),
+            "SCI_DESV": grouped["SCI"].std(ddof=0).round(3),
+            "SCV_MEDIA": grouped["SCV"].mean().round(3),
+            "SCV_DESV": grouped["SCV"].std(ddof=0).round(3),
+        }
+    )
+    for zone, names in [("ZCI", ZCI_NAMES), ("ZCV", ZCV_NAMES)]:
+        counts = pd.crosstab(years_df["COD_INE"], years_df[zone]).reindex(
+            index=summary.index, columns=names, fill_value=0
+        )
+        # A igualdad de años, la moda es la zona más severa
+        summary[zone + "_MODA"] = counts.iloc[:, ::-1].idxmax(axis=1)
+        shares = (100.0 * counts.div(summary["N_AÑOS"], axis=0)).round(1)
+        for name in names:
+            summary["PCT_{}_{}".format(zone, name)] = shares[name]
+    return summary.reset_index()
+
+
+def compute_multiyear(df, series_dir=SERIES_DIR, processes=None):
+    """Calcula indicadores anuales y su resumen para los municipios de df
+
+    Devuelve una tupla con los dataframes de indicadores anuales y de resumen
+    """
+    # Calcula las máscaras de los periodos y la duración de los días antes de
+    # crear los procesos de cálculo
+    years = range(2005, 2021)
+    for year in years:
+        season_hours(WINTER_MONTHS, year)
+        season_hours(SUMMER_MONTHS, year)
+    warm_cache(df["LATITUD_ETRS89"], years=years)
+
+    with mp.Pool(processes) as pool:
+        values = [
+            (
+                data["COD_INE"],
+                data["LONGITUD_ETRS89"],
+                data["LATITUD_ETRS89"],
+                os.path.join(series_dir, data["ARCHIVO_TMY"]),
+            )
+            for data in df.to_dict("records")
+        ]
+        years = [
+            row
+            for rows in pool.starmap(year_indicators, values, chunksize=10)
+            for row in rows
+        ]
+    years_df = pd.DataFrame(years, columns=YEARS_COLUMNS)
+    summary = df[["COD_INE", "PROVINCIA", "NOMBRE_ACTUAL"]].merge(
+        summarize_years(years_df), on="COD_INE"
+    )
+    return years_df, summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="multiyear_indicators",
+        description="Calcula indicadores de zonificación climática de cada año de las series horarias",
+    )
+    parser.add_argument(
+        "-m",
+        "--municipios_file",
+        type=str,
+        help="Archivo de datos de municipios. Valor por defecto {}".format(
+            MUNICIPIOS_FILE
+        ),
+        default=MUNICIPIOS_FILE,
+    )
+    parser.add_argument(
+        "-s",
+        "--series_dir",
+        type=str,
+        help="Carpeta con las series horarias de los municipios. Valor por defecto {}".format(
+            SERIES_DIR
+        ),
+        default=SERIES_DIR,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="Archivo de indicadores anuales. Valor por defecto {}".format(YEARS_FILE),
+        default=YEARS_FILE,
+    )
+    parser.add_argument(
+        "--summary_file",
+        type=str,
+        help="Archivo de resumen por municipio. Valor por defecto {}".format(
+            SUMMARY_FILE
+        ),
+        default=SUMMARY_FILE,
+    )
+    parser.add_argument(
+        "-p",
+        "--cod_prov",
+        type=str,
+        help="Código de provincia (COD_PROV) de los municipios a calcular. Por defecto se calculan todos",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        help="Número de procesos de cálculo. Por defecto, el número de CPUs",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    print("Cargando datos de municipios...")
+    df = load_municipios(args.municipios_file, args.cod_prov)
+    print("Calculando indicadores anuales...")
+    years_df, summary = compute_multiyear(df, args.series_dir, args.processes)
+
+    for filename in [args.output_file, args.summary_file]:
+        output_dir = os.path.dirname(filename)
+        if output_dir and not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+    years_df.to_csv(args.output_file, index=False)
+    summary.to_csv(args.summary_file, index=False)
+    print(
+        "Indicadores de {} años de {} municipios calculados".format(
+            len(years_df), len(summary)
+        )
+    )
@@ -0,0 +1,150 @@
+# encoding: utf-8
+
+"""Planificación de descargas de PV-GIS por celdas de la malla de datos
+
+Los datos de PV-GIS proceden de bases de datos en malla (p.e. PVGIS-SARAH2,
+con resolución de 0.05°), de modo que municipios próximos, especialmente en
+provincias con muchos municipios pequeños como las de Castilla y León o
+Galicia, obtienen datos de la misma celda.
+
+Este script asigna a cada municipio de `data/output/Municipios.csv` la celda
+de la malla (de paso GRID_STEP y origen GRID_ORIGIN) que contiene su
+localización, y genera el archivo `data/output/Celdas.csv` con las columnas:
+
+- ARCHIVO_TMY: archivo TMY del municipio
+- CELDA: identificador de la celda (índices de latitud y longitud en la malla,
+  contados desde el origen)
+- LATITUD_CELDA: latitud del centro de la celda
+- LONGITUD_CELDA: longitud del centro de la celda
+
+De este modo se puede descargar una única vez el archivo TMY de cada celda (en
+el centro de la celda) y enlazar a él los archivos TMY de los municipios, como
+hace el flujo de trabajo de Snakemake con la opción de configuración
+`grid_cells`.
+
+Se hacen tres suposiciones sobre los datos de PV-GIS:
+
+- los bordes de las celdas de la malla están en múltiplos de GRID_STEP desde
+  el origen GRID_ORIGIN (latitud y longitud 0), es decir, la malla está
+  alineada con 0°. Si la malla de la base de datos estuviese desplazada, se
+  debe indicar su origen (opción --origin, o grid_origin_lat y
+  grid_origin_long en la configuración de Snakemake), porque si no los
+  municipios cercanos a los bordes se asignarían a la celda vecina
+- PV-GIS no corrige los datos con la altitud del punto consultado
+
+de modo que el archivo de la celda es equivalente al del municipio salvo por
+las sombras del horizonte. PV-GIS las calcula para el punto exacto consultado
+(usehorizon=1, valor por defecto de la descarga por municipios), de modo que
+las del centro de la celda no serían las del municipio, y el Snakefile pide
+los TMY de las celdas sin ellas (usehorizon=0). Por ello, en los municipios
+con obstrucciones del horizonte (p.e. en valles de montaña), la radiación
+directa Gb(n) del modo por celdas es mayor en las horas con el sol bajo, y con
+ella n/N; el SCI es menor y la zona de invierno puede cambiar. En terreno
+llano ambos modos coinciden.
+
+Las coordenadas de cabecera del archivo serán las del centro de la celda, que
+difieren hasta GRID_STEP / 2 de las del municipio.
+"""
+
+import numpy as np
+import pandas as pd
+
+MUNICIPIOS_FILE = "data/output/Municipios.csv"
+CELLS_FILE = "data/output/Celdas.csv"
+# Paso de la malla, en grados
+GRID_STEP = 0.05
+# Origen (latitud, longitud) de la malla, en grados: esquina de la celda (0, 0)
+GRID_ORIGIN = (0.0, 0.0)
+
+
+def plan_cells(df, step=GRID_STEP, origin=GRID_ORIGIN):
+    """Asigna a cada municipio de df la celda de la malla de paso step y origen origin que lo contiene
+
+    Devuelve un dataframe con las columnas ARCHIVO_TMY, CELDA, LATITUD_CELDA y
+    LONGITUD_CELDA.
+    """
+    lat_0, long_0 = origin
+    # Se redondea antes de truncar para que las localizaciones justo en el
+    # borde de una celda no dependan de errores de representación
+    i_lat = np.floor(
+        np.round((df["LATITUD_ETRS89"].to_numpy() - lat_0) / step, 9)
+    ).astype(int)
+    i_long = np.floor(
+        np.round((df["LONGITUD_ETRS89"].to_numpy() - long_0) / step, 9)
+    ).astype(int)
+    return pd.DataFrame(
+        {
+            "ARCHIVO_TMY": df["ARCHIVO_TMY"].to_numpy(),
+            "CELDA": ["{}_{}".format(i, j) for i, j in zip(i_lat, i_long)],
+            "LATITUD_CELDA": np.round(lat_0 + (i_lat + 0.5) * step, 3),
+            "LONGITUD_CELDA": np.round(long_0 + (i_long + 0.5) * step, 3),
+        }
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(
+        prog="plan_cells",
+        description="Asigna los municipios a celdas de la malla de PV-GIS para descargar una vez cada celda",
+    )
+    parser.add_argument(
+        "-m",
+        "--municipios_file",
+        type=str,
+        help="Archivo de datos de municipios. Valor por defecto {}".format(
+            MUNICIPIOS_FILE
+        ),
+        default=MUNICIPIOS_FILE,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="Archivo de asignación de celdas. Valor por defecto {}".format(CELLS_FILE),
+        default=CELLS_FILE,
+    )
+    parser.add_argument(
+        "-s",
+        "--step",
+        type=float,
+        help="Paso de la malla, en grados. Valor por defecto {}".format(GRID_STEP),
+        default=GRID_STEP,
+    )
+    parser.add_argument(
+        "--origin",
+        type=float,
+        nargs=2,
+        metavar=("LAT", "LONG"),
+        help="Origen de la malla (latitud y longitud de la esquina de una celda), en grados. Valor por defecto {} {}".format(
+            *GRID_ORIGIN
+        ),
+        default=GRID_ORIGIN,
+    )
+    args = parser.parse_args()
+
+    df = pd.read_csv(
+        args.municipios_file,
+        usecols=["LONGITUD_ETRS89", "LATITUD_ETRS89", "ARCHIVO_TMY"],
+        dtype={"LONGITUD_ETRS89": float, "LATITUD_ETRS89": float, "ARCHIVO_TMY": str},
+    )
+    cells = plan_cells(df, args.step, tuple(args.origin))
+
+    output_dir = os.path.dirname(args.output_file)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    cells.to_csv(args.output_file, index=False)
+
+    n_munis = len(cells)
+    n_cells = cells["CELDA"].nunique()
+    print(
+        "{} municipios en {} celdas de {}°: {} descargas evitadas ({:.1f}%)".format(
+            n_munis,
+            n_cells,
+            args.step,
+            n_munis - n_cells,
+            100.0 * (n_munis - n_cells) / max(n_munis, 1),
+        )
+    )
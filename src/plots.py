@@ -0,0 +1,356 @@
+# encoding: utf-8
+
+"""Gráficas de resultados de zonificación climática
+
+Obtiene diversas gráficas a partir de los datos en `data/output/Results.csv`,
+que se lee una sola vez para generar todas ellas:
+
+- Histograma de magnitud de las diferencias entre zonificaciones:
+
+    - `data/output/plots/zci-diff-hist.png`
+    - `data/output/plots/zcv-diff-hist.png`
+
+- mapas de severidades climáticas TMY:
+
+    - `data/output/plots/zc-tmy.png`
+
+- mapas de zonas climáticas TMY y CTE DB-HE 2019:
+
+    - `data/output/plots/zc-tmy-zonas.png`
+    - `data/output/plots/zc-cte-zonas.png`
+
+- mapas de diferencias en zonificación:
+
+    - `data/output/plots/zc-diff.png`
+
+Las gráficas se pueden generar en paralelo, en procesos independientes. Los
+puntos de los mapas se rasterizan para reducir el tamaño y el tiempo de
+generación de las figuras.
+
+Las funciones de este módulo se pueden usar también desde el cuaderno
+`notebooks/graficas.ipynb`.
+"""
+
+import os
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+
+from compute_indicators import ZCI_NAMES, ZCV_NAMES
+
+plt.rcParams.update(
+    {
+        #   "text.usetex": False,
+        "font.family": "Arial"
+    }
+)
+
+RESULTS_FILE = "data/output/Results.csv"
+PLOTS_DIR = "data/output/plots"
+
+# Colores de las zonas climáticas de invierno y verano, de menor a mayor severidad
+ZCI_COLORS = ["#fde0dd", "#c6dbef", "#9ecae1", "#6baed6", "#3182bd", "#08519c"]
+ZCV_COLORS = ["#fee5d9", "#fcae91", "#fb6a4a", "#cb181d"]
+
+
+def load_results(results_filename=RESULTS_FILE):
+    """Lee archivo de resultados"""
+    return pd.read_csv(
+        results_filename,
+        sep=",",
+        decimal=".",
+        dtype={
+            "COD_INE": str,
+            "COD_PROV": str,
+            "PROVINCIA": str,
+            "NOMBRE_ACTUAL": str,
+            "POBLACION_MUNI": int,
+            "LONGITUD_ETRS89": float,
+            "LATITUD_ETRS89": float,
+            "ALTITUD": float,
+            "ARCHIVO_TMY": str,
+            "ZC_CTE_2019": str,
+            "ZCI_CTE_2019": str,
+            "ZCV_CTE_2019": int,
+            "GD_I": float,
+            "GD_V": float,
+            "n_N": float,
+            "SCI": float,
+            "SCV": float,
+            "ZCI_TMY": str,
+            "ZCV_TMY": int,
+            "ZCI_DIFF": int,
+            "ZCV_DIFF": int,
+        },
+    )
+
+
+def _diff_hist(df, column, color, title, filename):
+    """Histograma de diferencias de niveles de zona climática"""
+    # Un intervalo centrado en cada valor entero de la diferencia
+    bins = np.arange(df[column].min(), df[column].max() + 2) - 0.5
+    count = df[column].count()
+
+    fig, ax = plt.subplots()
+    df[column].plot(
+        kind="hist",
+        bins=bins,
+        rwidth=0.9,
+        color=color,
+        figsize=(10, 5),
+        ax=ax,
+    )
+
+    ax.set_title(title)
+    ax.set_xlabel("Niveles de diferencia")
+    ax.set_ylabel("Número de municipios")
+    for bar in ax.patches:
+        ax.text(
+            bar.xy[0] + 0.45,
+            bar.get_height() + 10,
+            "{number:.0f} ({pct:.0f}%)".format(
+                number=int(bar.get_height()), pct=bar.get_height() / count * 100
+            ),
+            ha="center",
+            va="bottom",
+        )
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def plot_zci_diff_hist(df, filename):
+    """Histograma de diferencias de niveles de ZCI entre TMY y CTE"""
+    _diff_hist(
+        df,
+        "ZCI_DIFF",
+        "tab:blue",
+        "Diferencia de niveles en zona climática de invierno (ZCI) - TMY vs. CTE",
+        filename,
+    )
+
+
+def plot_zcv_diff_hist(df, filename):
+    """Histograma de diferencias de niveles de ZCV entre TMY y CTE"""
+    _diff_hist(
+        df,
+        "ZCV_DIFF",
+        "tab:red",
+        "Diferencia de niveles en zona climática de verano (ZCV) - TMY vs. CTE",
+        filename,
+    )
+
+
+def _map_axes(fig, df, titles, suptitle):
+    """Crea ejes de mapas (uno por título) con límites comunes para la península"""
+    peninsula = df[df.LATITUD_ETRS89 > 30]
+    xlim = [-10, 5]
+    ylim = [peninsula.LATITUD_ETRS89.min() - 1, peninsula.LATITUD_ETRS89.max() + 1]
+
+    fig.suptitle(suptitle, size=24)
+    fig.subplots_adjust(top=0.95, hspace=0.1)
+    gs = mpl.gridspec.GridSpec(len(titles), 1)
+    axes = []
+    for i, title in enumerate(titles):
+        if i == 0:
+            ax = fig.add_subplot(gs[i])
+            ax.set_xlim(xlim)
+            ax.set_ylim(ylim)
+        else:
+            ax = fig.add_subplot(gs[i], sharex=axes[0], sharey=axes[0])
+        ax.set_ylabel("Latitud")
+        ax.set_xlabel("Longitud")
+        ax.set_title(title, size=14)
+        axes.append(ax)
+    return axes
+
+
+def _scatter_spain(ax, df, values, **kwargs):
+    """Mapa de puntos de municipios, con Canarias desplazada junto a la península
+
+    El tamaño de los puntos depende de la población del municipio.
+    """
+    canarias = (df.LATITUD_ETRS89 <= 30).to_numpy()
+    lon = df["LONGITUD_ETRS89"].to_numpy() + np.where(canarias, 18, 0)
+    lat = df["LATITUD_ETRS89"].to_numpy() + np.where(canarias, 7, 0)
+    sc = ax.scatter(
+        lon,
+        lat,
+        c=np.asarray(values),
+        s=8.0 + df["POBLACION_MUNI"].to_numpy() / 2000.0,
+        rasterized=True,
+        **kwargs,
+    )
+    ax.add_line(mpl.lines.Line2D([-1, -1], [34, 36], lw=1, color="gray", axes=ax))
+    ax.add_line(mpl.lines.Line2D([-1, 0], [36, 36.5], lw=1, color="gray", axes=ax))
+    ax.add_line(mpl.lines.Line2D([0, 5], [36.5, 36.5], lw=1, color="gray", axes=ax))
+    return sc
+
+
+def _zone_legend(ax, names, colors, title):
+    """Leyenda de zonas climáticas"""
+    handles = [
+        mpl.lines.Line2D([], [], marker="o", ls="", color=color, label=str(name))
+        for (name, color) in zip(names, colors)
+    ]
+    ax.legend(handles=handles, title=title, loc="lower right")
+
+
+def plot_zc_tmy(df, filename):
+    """Mapas de severidades climáticas de invierno y verano TMY"""
+    fig = plt.figure(figsize=(14, 24))
+    ax0, ax1 = _map_axes(
+        fig,
+        df,
+        [
+            "Zona climática de invierno (a, A, B, C, D, E)",
+            "Zona climática de verano (1, 2, 3, 4)",
+        ],
+        "Severidades climáticas TMY",
+    )
+    _scatter_spain(ax0, df, df.SCI, cmap=mpl.cm.Blues)
+    _scatter_spain(ax1, df, df.SCV, cmap=mpl.cm.Reds)
+    fig.tight_layout(rect=(0, 0, 1, 0.97))
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def _plot_zones(df, zci_column, zcv_column, suptitle, filename):
+    """Mapas de zonas climáticas de invierno y verano"""
+    zci_cmap = mpl.colors.ListedColormap(ZCI_COLORS)
+    zcv_cmap = mpl.colors.ListedColormap(ZCV_COLORS)
+    zci_codes = pd.Categorical(df[zci_column], categories=ZCI_NAMES).codes
+    zcv_codes = pd.Categorical(df[zcv_column], categories=ZCV_NAMES).codes
+
+    fig = plt.figure(figsize=(14, 24))
+    ax0, ax1 = _map_axes(
+        fig,
+        df,
+        ["Zona climática de invierno (ZCI)", "Zona climática de verano (ZCV)"],
+        suptitle,
+    )
+    _scatter_spain(
+        ax0, df, zci_codes, cmap=zci_cmap, vmin=-0.5, vmax=len(ZCI_NAMES) - 0.5
+    )
+    _zone_legend(ax0, ZCI_NAMES, ZCI_COLORS, "ZCI")
+    _scatter_spain(
+        ax1, df, zcv_codes, cmap=zcv_cmap, vmin=-0.5, vmax=len(ZCV_NAMES) - 0.5
+    )
+    _zone_legend(ax1, ZCV_NAMES, ZCV_COLORS, "ZCV")
+    fig.tight_layout(rect=(0, 0, 1, 0.97))
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def plot_zones_tmy(df, filename):
+    """Mapas de zonas climáticas obtenidas de datos TMY"""
+    _plot_zones(df, "ZCI_TMY", "ZCV_TMY", "Zonas climáticas TMY", filename)
+
+
+def plot_zones_cte(df, filename):
+    """Mapas de zonas climáticas del CTE DB-HE 2019"""
+    _plot_zones(
+        df, "ZCI_CTE_2019", "ZCV_CTE_2019", "Zonas climáticas CTE DB-HE 2019", filename
+    )
+
+
+def plot_zc_diff(df, filename):
+    """Mapas de diferencias de niveles de ZCI y ZCV entre TMY y CTE"""
+    max_diff = max(df.ZCI_DIFF.abs().max(), df.ZCV_DIFF.abs().max(), 1)
+    levels = np.arange(-max_diff, max_diff + 1)
+    cmap = plt.get_cmap("RdBu_r", len(levels))
+    colors = [cmap(i) for i in range(len(levels))]
+
+    fig = plt.figure(figsize=(14, 24))
+    ax0, ax1 = _map_axes(
+        fig,
+        df,
+        [
+            "Diferencia de niveles de zona climática de invierno (ZCI)",
+            "Diferencia de niveles de zona climática de verano (ZCV)",
+        ],
+        "Diferencias de zonificación TMY vs. CTE",
+    )
+    for ax, column in ((ax0, "ZCI_DIFF"), (ax1, "ZCV_DIFF")):
+        _scatter_spain(
+            ax, df, df[column], cmap=cmap, vmin=-max_diff - 0.5, vmax=max_diff + 0.5
+        )
+        _zone_legend(ax, ["{:+d}".format(level) for level in levels], colors, column)
+    fig.tight_layout(rect=(0, 0, 1, 0.97))
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+# Gráficas disponibles: nombre de archivo y función que la genera
+PLOTS = {
+    "zci-diff-hist.png": plot_zci_diff_hist,
+    "zcv-diff-hist.png": plot_zcv_diff_hist,
+    "zc-tmy.png": plot_zc_tmy,
+    "zc-tmy-zonas.png": plot_zones_tmy,
+    "zc-cte-zonas.png": plot_zones_cte,
+    "zc-diff.png": plot_zc_diff,
+}
+
+
+def _render(plot_name, df, plots_dir):
+    """Genera una gráfica en el directorio plots_dir"""
+    filename = os.path.join(plots_dir, plot_name)
+    PLOTS[plot_name](df, filename)
+    return filename
+
+
+def render_all(df, plots_dir=PLOTS_DIR, processes=1, plot_names=None):
+    """Genera todas las gráficas a partir de los resultados ya cargados en df
+
+    processes: número de procesos para generar las gráficas en paralelo
+    plot_names: lista opcional de las gráficas a generar (claves de PLOTS)
+    """
+    os.makedirs(plots_dir, exist_ok=True)
+    plot_names = list(PLOTS) if plot_names is None else plot_names
+    tasks = [(plot_name, df, plots_dir) for plot_name in plot_names]
+    if processes > 1:
+        with mp.Pool(min(processes, len(tasks))) as pool:
+            return pool.starmap(_render, tasks)
+    return [_render(*task) for task in tasks]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Generación sin entorno gráfico
+    mpl.use("Agg")
+
+    parser = argparse.ArgumentParser(
+        prog="plots",
+        description="Genera las gráficas de resultados de zonificación climática",
+    )
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        type=str,
+        help="Archivo de resultados. Valor por defecto {}".format(RESULTS_FILE),
+        default=RESULTS_FILE,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_dir",
+        type=str,
+        help="Carpeta de salida de las gráficas. Valor por defecto {}".format(PLOTS_DIR),
+        default=PLOTS_DIR,
+    )
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        help="Número de procesos para generar las gráficas en paralelo. Valor por defecto 1",
+        default=1,
+    )
+    args = parser.parse_args()
+
+    print("Cargando resultados...")
+    df = load_results(args.input_file)
+    print("Generando gráficas...")
+    for filename in render_all(df, args.output_dir, args.processes):
+        print("\t{}".format(filename))
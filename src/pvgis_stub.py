@@ -0,0 +1,308 @@
+# encoding: utf-8
+
+"""Servidor local que simula la API de PV-GIS para pruebas de descarga
+
+Atiende peticiones `/api/v5_2/tmy?lat=...&lon=...` (con cualquier versión de
+la API) devolviendo archivos TMY sintéticos con el mismo formato .csv que los
+de PV-GIS (el que lee `read_tmy_data` de compute_indicators.py). El contenido
+es determinista para cada localización, de modo que se puede comprobar la
+corrección de las descargas con `synthetic_tmy`.
+
+Para probar el comportamiento de los clientes permite:
+
+- limitar el número de peticiones por segundo (como PV-GIS, 30 req/s),
+  respondiendo con el error 429 y la cabecera Retry-After a las que lo superan
+- añadir una latencia aleatoria a cada respuesta
+- inyectar errores 5xx con una probabilidad dada
+- truncar con una probabilidad dada el cuerpo de la respuesta, cerrando la
+  conexión antes de enviar todos los bytes anunciados en Content-Length
+
+El servidor lleva la cuenta de las respuestas de cada tipo (ver
+`PVGISStub.stats`).
+
+Uso como script:
+
+    python3 src/pvgis_stub.py --port 8080 --rate 30 --error_rate 0.05
+
+y descarga con:
+
+    python3 src/download_file.py --link "http://127.0.0.1:8080/api/v5_2/tmy?lat=40.409&lon=-3.724&outputformat=csv" --output_file madrid.csv
+"""
+
+import functools
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# Límite de peticiones por segundo de la API de PV-GIS
+PVGIS_RATE_LIMIT = 30
+# Número de series horarias sintéticas distintas (se generan una vez y se reutilizan)
+N_VARIANTS = 64
+
+_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+_FOOTER = [
+    "T2m: 2-m air temperature (degree Celsius)",
+    "RH: relative humidity (%)",
+    "G(h): Global irradiance on the horizontal plane (W/m2)",
+    "Gb(n): Beam/direct irradiance on a plane always normal to sun rays (W/m2)",
+    "Gd(h): Diffuse irradiance on the horizontal plane (W/m2)",
+    "IR(h): Surface infrared (thermal) irradiance on a horizontal plane (W/m2)",
+    "WS10m: 10-m total wind speed (m/s)",
+    "WD10m: 10-m wind direction (0 = N, 90 = E) (degrees)",
+    "SP: Surface (air) pressure (Pa)",
+    "",
+    "PVGIS (c) European Union, 2001-2023",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _synthetic_body(variant):
+    """Elevación y datos (bytes) de la serie sintética variant de un archivo TMY"""
+    rng = np.random.default_rng(variant)
+    elev = round(float(rng.uniform(0.0, 1500.0)), 1)
+    years = rng.integers(2005, 2021, 12)
+
+    hour = np.arange(8760)
+    hour_of_day = hour % 24
+    month = np.repeat(np.arange(1, 13), np.array(_DAYS) * 24)
+    day = np.concatenate([np.repeat(np.arange(1, d + 1), 24) for d in _DAYS])
+    season = np.cos(2 * np.pi * (hour + 240) / 8760)
+    sun = np.maximum(np.sin(2 * np.pi * (hour_of_day - 6) / 24), 0.0) * (1.0 - 0.3 * season)
+    t2m = (
+        16.0
+        - elev / 160.0
+        - 9.0 * season
+        + 5.0 * np.sin(2 * np.pi * (hour_of_day - 9) / 24)
+        + rng.normal(0.0, 2.0, 8760)
+    )
+    rh = np.clip(65.0 + 10.0 * season + rng.normal(0.0, 12.0, 8760), 5.0, 100.0)
+    gbn = np.where(rng.random(8760) < 0.6, 850.0, 60.0) * sun
+    gdh = 120.0 * sun
+    gh = 0.75 * gbn * sun + gdh
+    ir = 280.0 + 3.0 * t2m
+    ws = rng.uniform(0.0, 8.0, 8760)
+    wd = rng.uniform(0.0, 360.0, 8760)
+    sp = np.full(8760, 101325.0 - 11.0 * elev)
+
+    lines = ["month,year"]
+    lines += ["{},{}".format(m, y) for m, y in zip(range(1, 13), years)]
+    lines.append("time(UTC),T2m,RH,G(h),Gb(n),Gd(h),IR(h),WS10m,WD10m,SP")
+    row_years = years[month - 1]
+    lines += [
+        "{}{:02d}{:02d}:{:02d}00,{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f},{:.2f}".format(
+            *row
+        )
+        for row in zip(
+            row_years, month, day, hour_of_day, t2m, rh, gh, gbn, gdh, ir, ws, wd, sp
+        )
+    ]
+    lines += _FOOTER
+    return elev, ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def synthetic_tmy(lat, lon):
+    """Contenido (bytes) de un archivo TMY sintético para la localización (lat, lon)
+
+    Las coordenadas se redondean a 3 decimales, como hace PV-GIS, y el
+    contenido depende solo de ellas: la cabecera incluye las coordenadas y los
+    datos horarios son los de una de las N_VARIANTS series sintéticas.
+    """
+    lat = round(lat, 3)
+    lon = round(lon, 3)
+    i_lat = int(round((lat + 90) * 1000))
+    i_lon = int(round((lon + 180) * 1000))
+    elev, body = _synthetic_body((i_lat * 7919 + i_lon) % N_VARIANTS)
+    header = [
+        "Latitude (decimal degrees): {:.3f}".format(lat),
+        "Longitude (decimal degrees): {:.3f}".format(lon),
+        "Elevation (m): {:.1f}".format(elev),
+        "",
+    ]
+    return "\n".join(header).encode("utf-8") + body
+
+
+class TokenBucket:
+    """Limitador de peticiones por segundo (algoritmo de cubo de fichas)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Consume una ficha si hay disponible. Devuelve True si se admite la petición"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class PVGISStub(ThreadingHTTPServer):
+    """Servidor HTTP que simula la API de descarga de TMY de PV-GIS
+
+    :param address: tupla (host, puerto). Con puerto 0 se elige uno libre
+    :param rate: límite de peticiones por segundo (None, sin límite)
+    :param latency: latencia máxima (s) añadida a cada respuesta (uniforme entre 0 y latency)
+    :param error_rate: probabilidad de responder con un error 5xx
+    :param truncate_rate: probabilidad de truncar el cuerpo de la respuesta
+    :param seed: semilla de la inyección de fallos
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        rate=PVGIS_RATE_LIMIT,
+        latency=0.0,
+        error_rate=0.0,
+        truncate_rate=0.0,
+        seed=None,
+    ):
+        super().__init__(address, _PVGISHandler)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.random = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "truncated": 0, "400": 0}
+
+    @property
+    def url(self):
+        """URL base del servidor"""
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def draw(self):
+        """Número aleatorio para la inyección de fallos"""
+        with self.stats_lock:
+            return self.random.random()
+
+    def start(self):
+        """Atiende peticiones en un hilo en segundo plano y devuelve el servidor"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _PVGISHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, code, body, headers=None, truncate=False):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/csv" if code == 200 else "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if truncate:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if truncate:
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        if server.bucket is not None and not server.bucket.take():
+            server.count("429")
+            self._send(429, b"Too many requests", {"Retry-After": "1"})
+            return
+        if server.latency:
+            time.sleep(server.draw() * server.latency)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if not url.path.endswith("/tmy"):
+                raise ValueError("Unknown tool")
+            lat = float(query["lat"][0])
+            lon = float(query["lon"][0])
+        except (KeyError, ValueError):
+            server.count("400")
+            self._send(400, b"Bad request")
+            return
+
+        if server.draw() < server.error_rate:
+            server.count("5xx")
+            self._send(503, b"Service unavailable")
+            return
+        truncate = server.draw() < server.truncate_rate
+        server.count("truncated" if truncate else "ok")
+        self._send(200, synthetic_tmy(lat, lon), truncate=truncate)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="pvgis_stub",
+        description="Servidor local que simula la API de descarga de TMY de PV-GIS",
+    )
+    parser.add_argument(
+        "-p", "--port", type=int, help="Puerto. Valor por defecto 8080", default=8080
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        help="Límite de peticiones por segundo (0, sin límite). Valor por defecto {}".format(
+            PVGIS_RATE_LIMIT
+        ),
+        default=PVGIS_RATE_LIMIT,
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        type=float,
+        help="Latencia máxima (s) de cada respuesta. Valor por defecto 0",
+        default=0.0,
+    )
+    parser.add_argument(
+        "-e",
+        "--error_rate",
+        type=float,
+        help="Probabilidad de error 5xx. Valor por defecto 0",
+        default=0.0,
+    )
+    parser.add_argument(
+        "-t",
+        "--truncate_rate",
+        type=float,
+        help="Probabilidad de respuesta truncada. Valor por defecto 0",
+        default=0.0,
+    )
+    args = parser.parse_args()
+
+    server = PVGISStub(
+        ("127.0.0.1", args.port),
+        rate=args.rate,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate,
+    )
+    print("Servidor PV-GIS simulado en {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats)
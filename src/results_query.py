@@ -0,0 +1,267 @@
+# encoding: utf-8
+
+"""Consultas agregadas sobre los resultados de zonificación climática
+
+Responde a consultas frecuentes sobre `data/output/Results.csv` (población y
+número de municipios por zona, matrices de cambio de zona, resúmenes por
+provincia...) sin recorrer la tabla completa en cada consulta.
+
+Para ello se construye una sola vez un índice (`build_index`) con:
+
+- un cubo con la población y el número de municipios de cada combinación de
+  valores de las dimensiones DIMENSIONS (provincia, zonas CTE y TMY,
+  diferencias de nivel y su signo), que tiene muchas menos filas que la tabla
+  de municipios
+- para cada dimensión y valor, una máscara booleana de las filas del cubo
+
+y las consultas (`query`) combinan las máscaras de los filtros y suman las
+filas seleccionadas del cubo. Por ejemplo, la población de Madrid (28) cuya
+zona climática de verano aumenta con los datos TMY es:
+
+    index = build_index(load_results())
+    population, municipalities = query(index, COD_PROV="28", ZCV_DIFF_SIGNO=1)
+"""
+
+import numpy as np
+import pandas as pd
+
+from compute_indicators import RESULTS_FILE, ZCI_NAMES, ZCV_NAMES
+
+# Dimensiones del cubo
+DIMENSIONS = [
+    "COD_PROV",
+    "ZCI_CTE_2019",
+    "ZCV_CTE_2019",
+    "ZCI_TMY",
+    "ZCV_TMY",
+    "ZCI_DIFF",
+    "ZCV_DIFF",
+    "ZCI_DIFF_SIGNO",
+    "ZCV_DIFF_SIGNO",
+]
+# Medidas del cubo
+MEASURES = ["POBLACION", "MUNICIPIOS"]
+
+
+def load_results(results_filename=RESULTS_FILE):
+    """Lee las columnas necesarias para las consultas de un archivo de resultados"""
+    return pd.read_csv(
+        results_filename,
+        usecols=[
+            "COD_PROV",
+            "PROVINCIA",
+            "POBLACION_MUNI",
+            "ZCI_CTE_2019",
+            "ZCV_CTE_2019",
+            "ZCI_TMY",
+            "ZCV_TMY",
+            "ZCI_DIFF",
+            "ZCV_DIFF",
+        ],
+        dtype={
+            "COD_PROV": str,
+            "PROVINCIA": str,
+            "POBLACION_MUNI": int,
+            "ZCI_CTE_2019": str,
+            "ZCV_CTE_2019": int,
+            "ZCI_TMY": str,
+            "ZCV_TMY": int,
+            "ZCI_DIFF": int,
+            "ZCV_DIFF": int,
+        },
+    )
+
+
+def build_cube(df):
+    """Agrega población y número de municipios por combinación de valores de DIMENSIONS"""
+    df = df.assign(
+        ZCI_DIFF_SIGNO=np.sign(df["ZCI_DIFF"]),
+        ZCV_DIFF_SIGNO=np.sign(df["ZCV_DIFF"]),
+        POBLACION=df["POBLACION_MUNI"],
+        MUNICIPIOS=1,
+    )
+    return df.groupby(DIMENSIONS, sort=True)[MEASURES].sum().reset_index()
+
+
+def build_index(df):
+    """Construye el índice de consultas de los resultados df
+
+    Devuelve un diccionario con:
+
+    - cube: cubo de población y municipios (ver build_cube)
+    - masks: diccionario {dimensión: {valor: máscara booleana de filas del cubo}}
+    - measures: diccionario {medida: array de valores de las filas del cubo}
+    - provinces: diccionario {COD_PROV: PROVINCIA}
+    """
+    cube = build_cube(df)
+    masks = {}
+    for dim in DIMENSIONS:
+        values = cube[dim].to_numpy()
+        masks[dim] = {value: values == value for value in pd.unique(values)}
+    return {
+        "cube": cube,
+        "masks": masks,
+        "measures": {col: cube[col].to_numpy() for col in MEASURES},
+        "provinces": dict(zip(df["COD_PROV"], df["PROVINCIA"])),
+    }
+
+
+def select(index, **filters):
+    """Máscara booleana de las filas del cubo que cumplen los filtros
+
+    Cada filtro es dimensión=valor o dimensión=lista de valores admitidos.
+    """
+    selected = np.ones(len(index["cube"]), dtype=bool)
+    for dim, value in filters.items():
+        if dim not in index["masks"]:
+            raise ValueError(
+                "Dimensión '{}' no válida. Dimensiones admitidas: {}".format(
+                    dim, ", ".join(DIMENSIONS)
+                )
+            )
+        dim_masks = index["masks"][dim]
+        if isinstance(value, (list, tuple, set)):
+            dim_mask = np.zeros_like(selected)
+            for item in value:
+                if item in dim_masks:
+                    dim_mask |= dim_masks[item]
+        elif value in dim_masks:
+            dim_mask = dim_masks[value]
+        else:
+            return np.zeros_like(selected)
+        selected &= dim_mask
+    return selected
+
+
+def query(index, **filters):
+    """Población y número de municipios que cumplen los filtros (ver select)"""
+    selected = select(index, **filters)
+    measures = index["measures"]
+    return (
+        int(measures["POBLACION"][selected].sum()),
+        int(measures["MUNICIPIOS"][selected].sum()),
+    )
+
+
+def distribution(index, dim, **filters):
+    """Población y municipios para cada valor de la dimensión dim, con los filtros dados
+
+    Devuelve un dataframe con columnas dim, POBLACION, MUNICIPIOS y PCT_POBLACION
+    """
+    selected = index["cube"][select(index, **filters)]
+    result = selected.groupby(dim, sort=True)[MEASURES].sum().reset_index()
+    total = result["POBLACION"].sum()
+    result["PCT_POBLACION"] = (100.0 * result["POBLACION"] / max(total, 1)).round(2)
+    return result
+
+
+def change_matrix(index, zone="ZCV", measure="POBLACION", **filters):
+    """Matriz de cambio de zona (CTE en filas, TMY en columnas) con los filtros dados
+
+    zone es "ZCI" o "ZCV" y measure "POBLACION" o "MUNICIPIOS"
+    """
+    names = ZCI_NAMES if zone == "ZCI" else ZCV_NAMES
+    selected = index["cube"][select(index, **filters)]
+    matrix = selected.pivot_table(
+        index=zone + "_CTE_2019",
+        columns=zone + "_TMY",
+        values=measure,
+        aggfunc="sum",
+        fill_value=0,
+    )
+    return matrix.reindex(index=names, columns=names, fill_value=0)
+
+
+def province_summary(index, **filters):
+    """Resumen por provincia de población y municipios totales y con cambio de zona
+
+    Los filtros no pueden incluir COD_PROV
+    """
+    changes = {
+        "POBLACION_ZCI_SUBE": {"ZCI_DIFF_SIGNO": 1},
+        "POBLACION_ZCI_BAJA": {"ZCI_DIFF_SIGNO": -1},
+        "POBLACION_ZCV_SUBE": {"ZCV_DIFF_SIGNO": 1},
+        "POBLACION_ZCV_BAJA": {"ZCV_DIFF_SIGNO": -1},
+    }
+    rows = []
+    for cod_prov in sorted(index["masks"]["COD_PROV"]):
+        population, municipalities = query(index, COD_PROV=cod_prov, **filters)
+        row = {
+            "COD_PROV": cod_prov,
+            "PROVINCIA": index["provinces"][cod_prov],
+            "POBLACION": population,
+            "MUNICIPIOS": municipalities,
+        }
+        for col, change in changes.items():
+            row[col] = query(index, COD_PROV=cod_prov, **change, **filters)[0]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def parse_filters(index, items):
+    """Convierte una lista de cadenas DIMENSION=VALOR[,VALOR...] en diccionario de filtros
+
+    Los valores se convierten al tipo de los de la dimensión en el índice
+    """
+    filters = {}
+    for item in items or []:
+        dim, _, text = item.partition("=")
+        if dim not in index["masks"]:
+            raise ValueError(
+                "Dimensión '{}' no válida. Dimensiones admitidas: {}".format(
+                    dim, ", ".join(DIMENSIONS)
+                )
+            )
+        by_text = {str(value): value for value in index["masks"][dim]}
+        values = [by_text.get(part, part) for part in text.split(",")]
+        filters[dim] = values if len(values) > 1 else values[0]
+    return filters
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="results_query",
+        description="Consultas agregadas de población y municipios sobre los resultados de zonificación",
+    )
+    parser.add_argument(
+        "filters",
+        type=str,
+        nargs="*",
+        help="Filtros DIMENSION=VALOR[,VALOR...] (p.e. COD_PROV=28 ZCV_DIFF_SIGNO=1). Dimensiones: {}".format(
+            ", ".join(DIMENSIONS)
+        ),
+    )
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        type=str,
+        help="Archivo de resultados. Valor por defecto {}".format(RESULTS_FILE),
+        default=RESULTS_FILE,
+    )
+    parser.add_argument(
+        "-d",
+        "--dimension",
+        type=str,
+        help="Muestra la distribución de población y municipios según esta dimensión",
+        default=None,
+    )
+    parser.add_argument(
+        "-z",
+        "--zone_matrix",
+        choices=["ZCI", "ZCV"],
+        help="Muestra la matriz de cambio de zona CTE - TMY (en población)",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    index = build_index(load_results(args.input_file))
+    filters = parse_filters(index, args.filters)
+    population, municipalities = query(index, **filters)
+    print("Población: {}, municipios: {}".format(population, municipalities))
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        if args.dimension is not None:
+            print(distribution(index, args.dimension, **filters).to_string(index=False))
+        if args.zone_matrix is not None:
+            print(change_matrix(index, args.zone_matrix, **filters).to_string())
@@ -26,15 +26,63 @@ de modo que deben ser corregidas para descargar los datos:
 - 15901000000_Cariño.csv, -7.868424967,43.74035104 -> -7.869, 43.741
 - 17048000000_Castell-Platja d'Aro.csv, 3.06798443,41.81426606 -> 3.067, 41.817
 - 27066000000_Viveiro.csv, -7.5973072639999994,43.66074911 -> -7.595, 43.662
+
+Al generar el archivo de municipios se compara con el de la versión anterior
+del nomenclator (copia en `data/output/MunicipiosAnterior.csv`, que guarda la
+regla snapshot_municipios del Snakefile antes de generar el nuevo) y se genera
+un manifiesto de cambios (`data/output/MunicipiosCambios.csv`, en el Snakefile
+con la regla municipios_changes, con la opción --changes_only) con los
+municipios:
+
+- dados de alta (alta) o de baja (baja)
+- con cambio de nombre (nombre), y por tanto de ARCHIVO_TMY
+- con cambio de localización (localizacion) mayor que COORD_TOLERANCE. Los
+  desplazamientos menores mantienen las coordenadas anteriores, para no
+  invalidar la descarga de sus datos climáticos
+- con cambios en otros datos (datos), como altitud o población
+
+Este programa no modifica los archivos de datos climáticos. Como las
+coordenadas de los municipios sin cambio de localización se mantienen, el
+enlace de descarga (parámetro link de las reglas de descarga del Snakefile)
+solo cambia para los municipios con cambio de localización, y Snakemake solo
+vuelve a descargar esos, además de los de los municipios nuevos o
+renombrados, que no tienen archivo. Los archivos de los municipios dados de
+baja o renombrados (ARCHIVO_TMY_ANTERIOR del manifiesto) dejan de usarse y se
+pueden borrar. Así, una nueva versión del nomenclator solo obliga a descargar
+y calcular los municipios que han cambiado (ver también la regla
+compute_indicators_prov del Snakefile).
 """
 
-import pandas as pd
 import os
 
+import pandas as pd
+
 # from download_TMY import MUNICIPIOS_FILE
 
 MUNICIPIOS_FILE = "data/ign/MUNICIPIOS.csv"
 MUNICIPIOS_FILE_FORMATTED = "data/output/Municipios.csv"
+MUNICIPIOS_PREVIOUS = "data/output/MunicipiosAnterior.csv"
+CHANGES_FILE = "data/output/MunicipiosCambios.csv"
+
+# Diferencia de coordenadas (grados) a partir de la cual cambia la localización (~100 m)
+COORD_TOLERANCE = 0.001
+
+# Tipos de cambio de los municipios
+ADDED = "alta"
+REMOVED = "baja"
+RENAMED = "nombre"
+MOVED = "localizacion"
+UPDATED = "datos"
+# Columnas del manifiesto de cambios. CAMBIO incluye los tipos de cambio separados por +
+CHANGES_COLUMNS = [
+    "COD_INE",
+    "NOMBRE_ACTUAL",
+    "CAMBIO",
+    "ARCHIVO_TMY_ANTERIOR",
+    "ARCHIVO_TMY",
+]
+# Columnas cuyo cambio solo afecta al cálculo de indicadores
+DATA_COLUMNS = ["COD_PROV", "PROVINCIA", "POBLACION_MUNI", "ALTITUD"]
 
 FIX_DATA = {
     "Chipiona": {"LONGITUD_ETRS89": -6.435, "LATITUD_ETRS89": 36.736},
@@ -44,60 +92,329 @@ FIX_DATA = {
     "Viveiro": {"LONGITUD_ETRS89": -7.595, "LATITUD_ETRS89": 43.662},
 }
 
-if __name__ == "__main__":
-    print("Cargando datos de municipios...")
-    df = pd.read_csv(
-        MUNICIPIOS_FILE,
+NOMENCLATOR_DTYPES = {
+    "COD_INE": str,
+    "ID_REL": str,
+    "COD_GEO": str,
+    "COD_PROV": str,
+    "PROVINCIA": str,
+    "NOMBRE_ACTUAL": str,
+    "POBLACION_MUNI": int,
+    "SUPERFICIE": float,
+    "PERIMETRO": float,
+    "COD_INE_CAPITAL": str,
+    "CAPITAL": str,
+    "POBLACION_CAPITAL": int,
+    "HOJA_MTN25_ETRS89": str,
+    "LONGITUD_ETRS89": float,
+    "LATITUD_ETRS89": float,
+    "ORIGENCOOR": str,
+    "ALTITUD": float,
+    "ORIGENALTITUD": str,
+}
+
+COLUMNS = [
+    "COD_INE",
+    "COD_PROV",
+    "PROVINCIA",
+    "NOMBRE_ACTUAL",
+    "POBLACION_MUNI",
+    "LONGITUD_ETRS89",
+    "LATITUD_ETRS89",
+    "ALTITUD",
+]
+
+
+def read_nomenclator(input_file=MUNICIPIOS_FILE, chunk_size=None):
+    """Lee las columnas necesarias del nomenclator del IGN
+
+    Devuelve un iterador de dataframes: uno con todos los datos o, si se indica
+    chunk_size, uno por cada bloque de chunk_size filas.
+    """
+    reader = pd.read_csv(
+        input_file,
         encoding="latin1",
         sep=";",
         decimal=",",
-        dtype={
-            "COD_INE": str,
-            "ID_REL": str,
-            "COD_GEO": str,
-            "COD_PROV": str,
-            "PROVINCIA": str,
-            "NOMBRE_ACTUAL": str,
-            "POBLACION_MUNI": int,
-            "SUPERFICIE": float,
-            "PERIMETRO": float,
-            "COD_INE_CAPITAL": str,
-            "CAPITAL": str,
-            "POBLACION_CAPITAL": int,
-            "HOJA_MTN25_ETRS89": str,
-            "LONGITUD_ETRS89": float,
-            "LATITUD_ETRS89": float,
-            "ORIGENCOOR": str,
-            "ALTITUD": float,
-            "ORIGENALTITUD": str,
-        },
-        usecols=[
-            "COD_INE",
-            "COD_PROV",
-            "PROVINCIA",
-            "NOMBRE_ACTUAL",
-            "POBLACION_MUNI",
-            "LONGITUD_ETRS89",
-            "LATITUD_ETRS89",
-            "ALTITUD",
-        ],
+        dtype=NOMENCLATOR_DTYPES,
+        usecols=COLUMNS,
+        chunksize=chunk_size,
     )
+    if chunk_size is None:
+        yield reader
+    else:
+        with reader:
+            yield from reader
 
+
+def format_municipios(df):
+    """Añade el nombre del archivo TMY y corrige las localizaciones de FIX_DATA"""
     # Sustituimos los nombres con / para generar un nombre de arcivo válido
-    df["ARCHIVO_TMY"] = df[["COD_INE", "NOMBRE_ACTUAL"]].apply(
-        lambda x: "{}_{}.csv".format(x[0], x[1].replace("/", "__")), axis=1
-    )
+    nombre = df["NOMBRE_ACTUAL"].str.replace("/", "__", regex=False)
+    df["ARCHIVO_TMY"] = df["COD_INE"] + "_" + nombre + ".csv"
 
     # Corregimos las coordenadas de los municipios que dan lugar a posiciones sobre el mar
     for muni, value in FIX_DATA.items():
-        print("Corrigiendo localización de municipio: {}...".format(muni))
-        new_long = value["LONGITUD_ETRS89"]
-        new_lat = value["LATITUD_ETRS89"]
-        df.loc[df.NOMBRE_ACTUAL == muni, "LONGITUD_ETRS89"] = new_long
-        df.loc[df.NOMBRE_ACTUAL == muni, "LATITUD_ETRS89"] = new_lat
+        selected = df.NOMBRE_ACTUAL == muni
+        if selected.any():
+            print("Corrigiendo localización de municipio: {}...".format(muni))
+            df.loc[selected, "LONGITUD_ETRS89"] = value["LONGITUD_ETRS89"]
+            df.loc[selected, "LATITUD_ETRS89"] = value["LATITUD_ETRS89"]
+    return df
+
+
+def load_previous(previous_file):
+    """Carga los datos de municipios de la versión anterior, indexados por COD_INE
+
+    Devuelve None si no existe el archivo o está vacío (no hay versión anterior).
+    """
+    if (
+        previous_file is None
+        or not os.path.exists(previous_file)
+        or os.path.getsize(previous_file) == 0
+    ):
+        return None
+    return pd.read_csv(
+        previous_file, dtype={"COD_INE": str, "COD_PROV": str, "ARCHIVO_TMY": str}
+    ).set_index("COD_INE")
+
+
+def compare_municipios(previous, df, tolerance=COORD_TOLERANCE):
+    """Compara los municipios de df con los de la versión anterior previous
+
+    Las coordenadas de los municipios desplazados menos de tolerance grados
+    se sustituyen por las anteriores. Los municipios de previous que no están
+    en df no se tienen en cuenta (ver removed_municipios).
+
+    Devuelve una tupla con df y una lista de diccionarios con los cambios
+    (ver CHANGES_COLUMNS).
+    """
+    old = previous.reindex(df["COD_INE"])
+    is_new = old["NOMBRE_ACTUAL"].isna().to_numpy()
+    coords = ["LONGITUD_ETRS89", "LATITUD_ETRS89"]
+    moved = ~is_new & (
+        abs(df[coords].to_numpy() - old[coords].to_numpy()) > tolerance
+    ).any(axis=1)
+    keep = ~is_new & ~moved
+    df.loc[keep, coords] = old[coords].to_numpy()[keep]
+    renamed = ~is_new & (df["NOMBRE_ACTUAL"].to_numpy() != old["NOMBRE_ACTUAL"].to_numpy())
+    new_data = df[DATA_COLUMNS].reset_index(drop=True)
+    old_data = old[DATA_COLUMNS].reset_index(drop=True)
+    updated = ~is_new & ~(
+        (new_data == old_data) | (new_data.isna() & old_data.isna())
+    ).all(axis=1).to_numpy()
+
+    old_files = old["ARCHIVO_TMY"].to_numpy()
+    changes = []
+    for i, data in enumerate(df.to_dict("records")):
+        kinds = [
+            kind
+            for kind, changed in [
+                (ADDED, is_new[i]),
+                (RENAMED, renamed[i]),
+                (MOVED, moved[i]),
+                (UPDATED, updated[i]),
+            ]
+            if changed
+        ]
+        if kinds:
+            changes.append(
+                {
+                    "COD_INE": data["COD_INE"],
+                    "NOMBRE_ACTUAL": data["NOMBRE_ACTUAL"],
+                    "CAMBIO": "+".join(kinds),
+                    "ARCHIVO_TMY_ANTERIOR": None if is_new[i] else old_files[i],
+                    "ARCHIVO_TMY": data["ARCHIVO_TMY"],
+                }
+            )
+    return df, changes
+
+
+def removed_municipios(previous, cods):
+    """Cambios (bajas) de los municipios de previous que no están en cods"""
+    removed = previous[~previous.index.isin(cods)]
+    return [
+        {
+            "COD_INE": cod,
+            "NOMBRE_ACTUAL": data["NOMBRE_ACTUAL"],
+            "CAMBIO": REMOVED,
+            "ARCHIVO_TMY_ANTERIOR": data["ARCHIVO_TMY"],
+            "ARCHIVO_TMY": None,
+        }
+        for cod, data in removed.iterrows()
+    ]
+
 
-    if not os.path.isdir("data/output"):
-        os.makedirs("data/output")
+def select_input(
+    input_file=MUNICIPIOS_FILE,
+    output_file=MUNICIPIOS_FILE_FORMATTED,
+    chunk_size=None,
+    previous_file=MUNICIPIOS_PREVIOUS,
+    changes_file=CHANGES_FILE,
+    tolerance=COORD_TOLERANCE,
+):
+    """Genera el archivo de datos de municipios a partir del nomenclator del IGN
+
+    Si se indica chunk_size, el nomenclator se procesa por bloques de
+    chunk_size filas que se añaden a output_file, con memoria acotada.
+
+    Los municipios se comparan con los de previous_file, que debe ser una
+    copia de output_file hecha antes de sustituirlo, y, si se indica
+    changes_file, se guarda en él el manifiesto de cambios. Si no hay versión
+    anterior (previous_file no existe o está vacío), el manifiesto no tiene
+    ningún cambio.
+
+    Devuelve una tupla con el número de municipios y la lista de cambios.
+    """
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    previous = load_previous(previous_file)
+
+    count = 0
+    changes = []
+    cods = []
+    for df in read_nomenclator(input_file, chunk_size):
+        df = format_municipios(df)
+        if previous is not None:
+            df, chunk_changes = compare_municipios(previous, df, tolerance)
+            changes.extend(chunk_changes)
+            cods.extend(df["COD_INE"])
+        df.to_csv(
+            output_file,
+            mode="w" if count == 0 else "a",
+            header=count == 0,
+            index=False,
+            encoding="utf-8",
+        )
+        count += len(df)
+
+    if previous is not None:
+        changes.extend(removed_municipios(previous, cods))
+    if changes_file:
+        save_changes(changes, changes_file)
+    return count, changes
+
+
+def save_changes(changes, changes_file=CHANGES_FILE):
+    """Guarda el manifiesto de cambios changes (ver CHANGES_COLUMNS) en changes_file"""
+    pd.DataFrame(changes, columns=CHANGES_COLUMNS).to_csv(
+        changes_file, index=False, encoding="utf-8"
+    )
+    print(
+        "{} municipios con cambios respecto a la versión anterior (ver {})".format(
+            len(changes), changes_file
+        )
+    )
+
+
+def municipios_changes(
+    municipios_file=MUNICIPIOS_FILE_FORMATTED,
+    previous_file=MUNICIPIOS_PREVIOUS,
+    changes_file=CHANGES_FILE,
+    tolerance=COORD_TOLERANCE,
+):
+    """Genera el manifiesto de cambios de un archivo de municipios ya generado
+
+    Compara municipios_file, generado por select_input con la versión
+    anterior previous_file, con esa misma versión. Como los municipios
+    desplazados menos de tolerance grados ya tienen las coordenadas
+    anteriores, el manifiesto es el mismo que el obtenido al generarlo.
+
+    Devuelve la lista de cambios.
+    """
+    previous = load_previous(previous_file)
+    changes = []
+    if previous is not None:
+        df = load_previous(municipios_file).reset_index()
+        _, changes = compare_municipios(previous, df, tolerance)
+        changes.extend(removed_municipios(previous, df["COD_INE"]))
+    save_changes(changes, changes_file)
+    return changes
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="select_input",
+        description="Selecciona los datos de entrada de los municipios del nomenclator del IGN",
+    )
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        type=str,
+        help="Archivo del nomenclator del IGN. Valor por defecto {}".format(
+            MUNICIPIOS_FILE
+        ),
+        default=MUNICIPIOS_FILE,
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="Archivo de datos de municipios. Valor por defecto {}".format(
+            MUNICIPIOS_FILE_FORMATTED
+        ),
+        default=MUNICIPIOS_FILE_FORMATTED,
+    )
+    parser.add_argument(
+        "-k",
+        "--chunk_size",
+        type=int,
+        help="Procesa el nomenclator por bloques de este número de filas, con memoria acotada. Por defecto se procesa todo a la vez",
+        default=None,
+    )
+    parser.add_argument(
+        "-p",
+        "--previous_file",
+        type=str,
+        help="Copia del archivo de datos de municipios de la versión anterior, con la que se comparan los cambios (no se modifica). Valor por defecto {}".format(
+            MUNICIPIOS_PREVIOUS
+        ),
+        default=MUNICIPIOS_PREVIOUS,
+    )
+    parser.add_argument(
+        "-c",
+        "--changes_file",
+        type=str,
+        help="Manifiesto de cambios de los municipios respecto a la versión anterior (vacío para no guardarlo). Valor por defecto {}".format(
+            CHANGES_FILE
+        ),
+        default=CHANGES_FILE,
+    )
+    parser.add_argument(
+        "-t",
+        "--coord_tolerance",
+        type=float,
+        help="Diferencia de coordenadas (grados) a partir de la que un municipio cambia de localización. Valor por defecto {}".format(
+            COORD_TOLERANCE
+        ),
+        default=COORD_TOLERANCE,
+    )
+    parser.add_argument(
+        "--changes_only",
+        action="store_true",
+        help="Solo genera el manifiesto de cambios, comparando el archivo de datos de municipios ya generado con el de la versión anterior",
+    )
+    args = parser.parse_args()
 
-    df.to_csv(MUNICIPIOS_FILE_FORMATTED, index=False, encoding="utf-8")
-    print("Datos de {} municipios cargados.".format(len(df)))
+    if args.changes_only:
+        municipios_changes(
+            args.output_file,
+            args.previous_file,
+            args.changes_file,
+            args.coord_tolerance,
+        )
+    else:
+        print("Cargando datos de municipios...")
+        count, _ = select_input(
+            args.input_file,
+            args.output_file,
+            args.chunk_size,
+            args.previous_file,
+            args.changes_file,
+            args.coord_tolerance,
+        )
+        print("Datos de {} municipios cargados.".format(count))
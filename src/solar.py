@@ -0,0 +1,235 @@
+# encoding: utf-8
+
+"""Geometría solar vectorizada para los cálculos horarios de los archivos TMY
+
+Calcula con operaciones sobre arrays, para todas las horas del año (y, si se
+indican arrays de coordenadas, para varias localizaciones a la vez):
+
+- declinación y ecuación del tiempo de cada día del año
+- duración del día N (horas máximas de sol) de cada día y de cada mes
+- altura y azimut solar de cada hora
+- máscaras de las horas con el sol sobre el horizonte
+- horas de sol n (radiación directa > 120 W/m² con el sol sobre el horizonte)
+  y relación n/N de cada mes
+
+Las tablas que dependen solo de la latitud (duración del día) o de la
+latitud y longitud (posición solar horaria) se guardan en caché por
+coordenadas redondeadas (ver LATITUDE_DECIMALS y POSITION_DECIMALS), de modo
+que los municipios con las mismas coordenadas redondeadas las comparten. Para
+compartirlas entre los procesos de cálculo, se pueden calcular antes de
+crearlos con `warm_cache`.
+
+Las horas de los datos son UTC y la posición solar se calcula en el punto
+medio de cada hora (ver HOUR_OFFSET). Las máscaras de horas con sol, en
+cambio, incluyen las horas con el sol sobre el horizonte en algún momento de
+la hora (ver sun_up_hours), de modo que no excluyen horas con datos de
+radiación directa del amanecer o del atardecer.
+
+Cálculos en base a:
+
+- S.A. Kalogirou, Solar energy engineering: processes and systems (2nd ed.), Elsevier Inc. (2014)
+"""
+
+import calendar
+import functools
+
+import numpy as np
+
+# Instante de cada hora en el que se calcula la posición solar (0.5, punto medio)
+HOUR_OFFSET = 0.5
+# Decimales de las coordenadas en la caché de posiciones solares horarias (~1 km)
+POSITION_DECIMALS = 2
+# Decimales de la latitud en la caché de duración del día (~1 km)
+LATITUDE_DECIMALS = 2
+# Número de localizaciones en la caché de posiciones solares horarias
+POSITION_CACHE_SIZE = 256
+# Radiación directa mínima para considerar una hora de sol (World Meteorological Organization)
+SUNSHINE_LIMIT = 120.0
+
+
+@functools.lru_cache(maxsize=None)
+def day_months(year=None):
+    """Mes (1 a 12) de cada día del año
+
+    Sin year se usa un año de 365 días, como el de los archivos TMY.
+    """
+    year = 2001 if year is None else year
+    days = [calendar.monthrange(year, month)[1] for month in range(1, 13)]
+    months = np.repeat(np.arange(1, 13), days)
+    months.setflags(write=False)
+    return months
+
+
+@functools.lru_cache(maxsize=None)
+def hour_months(year=None):
+    """Mes (1 a 12) de cada hora del año"""
+    months = np.repeat(day_months(year), 24)
+    months.setflags(write=False)
+    return months
+
+
+def declination(nday):
+    """Declinación solar (grados) de los días del año nday (1 a 365)
+
+    delta = 23.45 · sin(360/365 · (284 + día_del_año))
+    """
+    return 23.45 * np.sin(np.radians(360.0 / 365.0 * (284.0 + np.asarray(nday, dtype=float))))
+
+
+def equation_of_time(nday):
+    """Ecuación del tiempo (minutos) de los días del año nday (1 a 365)
+
+    ET = 9.87 · sin(2B) - 7.53 · cos(B) - 1.5 · sin(B), B = 360/364 · (día_del_año - 81)
+    """
+    b = np.radians(360.0 / 364.0 * (np.asarray(nday, dtype=float) - 81.0))
+    return 9.87 * np.sin(2.0 * b) - 7.53 * np.cos(b) - 1.5 * np.sin(b)
+
+
+def day_length(latitude, year=None):
+    """Duración del día N (horas) de cada día del año para la latitud (en grados)
+
+    N = 2/15 · cos^-1(-tan(lat) · tan(delta))
+
+    La latitud se redondea a LATITUDE_DECIMALS y los resultados se guardan en
+    caché y son de solo lectura.
+    """
+    return _cached_day_length(round(latitude, LATITUDE_DECIMALS), year)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_day_length(latitude, year):
+    lat = np.radians(latitude)
+    nday = np.arange(1, len(day_months(year)) + 1)
+    N = np.degrees(
+        2.0 / 15.0 * np.arccos(-np.tan(lat) * np.tan(np.radians(declination(nday))))
+    )
+    N.setflags(write=False)
+    return N
+
+
+def monthly_day_length(latitude, year=None):
+    """Duración total de los días (horas) de cada mes para la latitud (en grados)"""
+    return np.bincount(day_months(year) - 1, weights=day_length(latitude, year), minlength=12)
+
+
+def solar_position(latitude, longitude, year=None, offset=HOUR_OFFSET):
+    """Altura y azimut solar (grados) de cada hora del año, en el instante offset (horas) de cada hora
+
+    latitude y longitude (grados, longitud positiva al este) pueden ser
+    escalares o arrays de forma (n, 1), para calcular a la vez las posiciones
+    de n localizaciones, con resultados de forma (n, horas). Cada localización
+    ocupa 140 kB, por lo que conviene calcular por bloques las de muchas
+    localizaciones.
+
+    El azimut se mide desde el norte, en sentido horario (180, sur).
+
+    Devuelve una tupla con los arrays de alturas y azimuts.
+    """
+    hours = len(day_months(year)) * 24
+    hour = np.arange(hours)
+    nday = hour // 24 + 1
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    delta = np.radians(declination(nday))
+    # Hora solar verdadera y ángulo horario
+    solar_time = (
+        hour % 24
+        + offset
+        + np.asarray(longitude, dtype=float) / 15.0
+        + equation_of_time(nday) / 60.0
+    )
+    omega = np.radians(15.0 * (solar_time - 12.0))
+
+    sin_alt = np.sin(lat) * np.sin(delta) + np.cos(lat) * np.cos(delta) * np.cos(omega)
+    altitude = np.degrees(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+    azimuth = (
+        np.degrees(
+            np.arctan2(
+                np.sin(omega), np.cos(omega) * np.sin(lat) - np.tan(delta) * np.cos(lat)
+            )
+        )
+        + 180.0
+    )
+    return altitude, azimuth
+
+
+@functools.lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _cached_position(latitude, longitude, year):
+    altitude, azimuth = solar_position(latitude, longitude, year)
+    altitude.setflags(write=False)
+    azimuth.setflags(write=False)
+    return altitude, azimuth
+
+
+def hourly_position(latitude, longitude, year=None):
+    """Altura y azimut solar de cada hora del año, con coordenadas redondeadas a POSITION_DECIMALS
+
+    Los resultados se guardan en caché y son de solo lectura.
+    """
+    return _cached_position(
+        round(latitude, POSITION_DECIMALS), round(longitude, POSITION_DECIMALS), year
+    )
+
+
+@functools.lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _cached_sun_up(latitude, longitude, year):
+    # Altura al inicio de cada hora (instante de los datos) y, con la de la hora
+    # siguiente, al final. Dentro de una hora la altura es monótona salvo al
+    # mediodía, con el sol siempre sobre el horizonte
+    altitude, _ = solar_position(latitude, longitude, year, offset=0.0)
+    up = altitude > 0.0
+    up = up | np.roll(up, -1)
+    up.setflags(write=False)
+    return up
+
+
+def sun_up_hours(latitude, longitude, year=None):
+    """Máscara booleana de las horas del año con el sol sobre el horizonte en algún momento de la hora
+
+    La hora de los datos (HH:00 en los TMY, HH:10 en las series horarias de
+    PV-GIS) está dentro de la hora, de modo que solo se excluyen horas en las
+    que el sol está bajo el horizonte durante toda la hora (horas nocturnas),
+    y no las del amanecer o el atardecer con el sol sobre el horizonte en el
+    instante de los datos.
+
+    Las coordenadas se redondean a POSITION_DECIMALS y los resultados se
+    guardan en caché y son de solo lectura.
+    """
+    return _cached_sun_up(
+        round(latitude, POSITION_DECIMALS), round(longitude, POSITION_DECIMALS), year
+    )
+
+
+def monthly_n_N(gbn, latitude, longitude, year=None):
+    """Horas de sol n, horas máximas de sol N y n/N de cada mes
+
+    gbn es el array de radiación directa normal horaria (W/m²). Se cuentan
+    como horas de sol las de radiación directa superior a SUNSHINE_LIMIT con
+    el sol sobre el horizonte.
+
+    Devuelve una tupla con tres arrays de 12 valores (n, N, n/N).
+    """
+    sunshine = (np.asarray(gbn) > SUNSHINE_LIMIT) & sun_up_hours(latitude, longitude, year)
+    n = np.bincount(hour_months(year)[sunshine] - 1, minlength=12).astype(float)
+    N = monthly_day_length(latitude, year)
+    return n, N, n / N
+
+
+def warm_cache(latitudes, longitudes=None, years=(None,)):
+    """Calcula las tablas de duración del día (y, con longitudes, de horas con sol)
+
+    Se usa antes de crear los procesos de cálculo, para que las tablas se
+    calculen una sola vez y se compartan entre todos ellos. Las máscaras de
+    horas con sol ocupan mucha más memoria, así que solo se guardan hasta
+    POSITION_CACHE_SIZE localizaciones.
+    """
+    for year in years:
+        hour_months(year)
+        for lat in set(round(lat, LATITUDE_DECIMALS) for lat in latitudes):
+            day_length(lat, year)
+        if longitudes is not None:
+            coords = set(
+                (round(lat, POSITION_DECIMALS), round(lon, POSITION_DECIMALS))
+                for lat, lon in zip(latitudes, longitudes)
+            )
+            for lat, lon in list(coords)[:POSITION_CACHE_SIZE]:
+                sun_up_hours(lat, lon, year)
@@ -0,0 +1,174 @@
+# encoding: utf-8
+
+"""Almacenamiento de archivos TMY en un único archivo comprimido
+
+Como alternativa a guardar cada archivo TMY como un archivo independiente en
+`data/output/tmy`, se pueden guardar todos en un único archivo ZIP
+(`data/output/tmy.zip`), en el que:
+
+- cada archivo TMY es un miembro, comprimido de forma independiente, cuyo
+  nombre es el del archivo TMY (columna ARCHIVO_TMY de los municipios)
+- el directorio central del ZIP actúa como índice de la posición de cada
+  miembro, de modo que se puede leer cualquier archivo sin descomprimir el resto
+
+Las adiciones al archivo se protegen con un bloqueo sobre un archivo auxiliar
+(`<archivo>.lock`), para permitir descargas en paralelo.
+
+Uso como script:
+
+- `python3 src/tmy_archive.py pack data/output/tmy data/output/tmy.zip`:
+  añade al archivo comprimido los archivos TMY de un directorio
+- `python3 src/tmy_archive.py list data/output/tmy.zip`: lista los miembros
+- `python3 src/tmy_archive.py extract data/output/tmy.zip data/output/tmy`:
+  extrae los archivos TMY en un directorio
+"""
+
+import fcntl
+import functools
+import os
+import zipfile
+
+TMY_ARCHIVE = "data/output/tmy.zip"
+
+
+class _ArchiveLock:
+    """Bloqueo exclusivo de un archivo comprimido para modificarlo"""
+
+    def __init__(self, archive_filename):
+        self.lock_filename = archive_filename + ".lock"
+
+    def __enter__(self):
+        self.lock_file = open(self.lock_filename, "w")
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+@functools.lru_cache(maxsize=8)
+def _open_archive(archive_filename, mtime_ns, pid):
+    """Abre archivo comprimido para lectura
+
+    Se mantiene abierto (por proceso) mientras no se modifique el archivo, para
+    no tener que leer de nuevo el índice en cada lectura.
+
+    El identificador del proceso pid forma parte de la clave de la caché: los
+    procesos creados con fork heredan el descriptor del archivo, con su
+    posición de lectura, y el bloqueo de ZipFile solo sincroniza los hilos de
+    un proceso, de modo que las lecturas simultáneas de varios procesos con el
+    archivo abierto por el proceso principal se mezclarían.
+    """
+    return zipfile.ZipFile(archive_filename, "r")
+
+
+def open_archive(archive_filename):
+    """Devuelve archivo comprimido abierto para lectura, reutilizándolo si no ha cambiado
+
+    Cada proceso abre su propia copia (ver _open_archive).
+    """
+    return _open_archive(
+        archive_filename, os.stat(archive_filename).st_mtime_ns, os.getpid()
+    )
+
+
+def has_member(archive_filename, name):
+    """Comprueba si el archivo comprimido contiene el archivo TMY name"""
+    if not os.path.exists(archive_filename):
+        return False
+    return name in open_archive(archive_filename).NameToInfo
+
+
+def read_member(archive_filename, name):
+    """Lee el contenido (bytes) del archivo TMY name desde el archivo comprimido"""
+    return open_archive(archive_filename).read(name)
+
+
+def append_member(archive_filename, name, content, overwrite=False):
+    """Añade el contenido (bytes) de un archivo TMY al archivo comprimido
+
+    Si ya existe un archivo con ese nombre no se añade, salvo que overwrite
+    sea True, en cuyo caso se añade una nueva versión que sustituye a la
+    anterior en las lecturas (el espacio de la anterior no se recupera).
+
+    Devuelve True si se ha añadido el archivo.
+    """
+    archive_dir = os.path.dirname(archive_filename)
+    if archive_dir and not os.path.isdir(archive_dir):
+        os.makedirs(archive_dir)
+    with _ArchiveLock(archive_filename):
+        with zipfile.ZipFile(archive_filename, "a", zipfile.ZIP_DEFLATED) as zf:
+            if name in zf.NameToInfo and not overwrite:
+                return False
+            zf.writestr(name, content)
+    return True
+
+
+def pack_dir(tmy_dir, archive_filename):
+    """Añade al archivo comprimido los archivos de tmy_dir que no contiene aún
+
+    Devuelve el número de archivos añadidos.
+    """
+    names = sorted(
+        name
+        for name in os.listdir(tmy_dir)
+        if os.path.isfile(os.path.join(tmy_dir, name)) and name != "downloads.done"
+    )
+    count = 0
+    with _ArchiveLock(archive_filename):
+        with zipfile.ZipFile(archive_filename, "a", zipfile.ZIP_DEFLATED) as zf:
+            existing = set(zf.NameToInfo)
+            for name in names:
+                if name not in existing:
+                    zf.write(os.path.join(tmy_dir, name), name)
+                    count += 1
+    return count
+
+
+def extract_all(archive_filename, tmy_dir):
+    """Extrae los archivos TMY del archivo comprimido en tmy_dir"""
+    with zipfile.ZipFile(archive_filename, "r") as zf:
+        zf.extractall(tmy_dir)
+        return len(zf.namelist())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="tmy_archive",
+        description="Gestiona el almacenamiento de archivos TMY en un único archivo comprimido",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser(
+        "pack", help="Añade los archivos TMY de un directorio al archivo comprimido"
+    )
+    pack_parser.add_argument("tmy_dir", type=str, help="Directorio de archivos TMY")
+    pack_parser.add_argument(
+        "archive", type=str, nargs="?", default=TMY_ARCHIVE, help="Archivo comprimido"
+    )
+    list_parser = subparsers.add_parser(
+        "list", help="Lista los archivos TMY del archivo comprimido"
+    )
+    list_parser.add_argument(
+        "archive", type=str, nargs="?", default=TMY_ARCHIVE, help="Archivo comprimido"
+    )
+    extract_parser = subparsers.add_parser(
+        "extract", help="Extrae los archivos TMY del archivo comprimido a un directorio"
+    )
+    extract_parser.add_argument("archive", type=str, help="Archivo comprimido")
+    extract_parser.add_argument("tmy_dir", type=str, help="Directorio de destino")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        count = pack_dir(args.tmy_dir, args.archive)
+        print("Añadidos {} archivos TMY a {}".format(count, args.archive))
+    elif args.command == "list":
+        for info in open_archive(args.archive).infolist():
+            print(
+                "{}\t{}\t{}".format(info.filename, info.file_size, info.compress_size)
+            )
+    elif args.command == "extract":
+        count = extract_all(args.archive, args.tmy_dir)
+        print("Extraídos {} archivos TMY en {}".format(count, args.tmy_dir))
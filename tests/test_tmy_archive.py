@@ -0,0 +1,84 @@
+# encoding: utf-8
+
+"""Lectura de archivos TMY desde un archivo comprimido con varios procesos"""
+
+import multiprocessing as mp
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pandas as pd  # noqa: E402
+
+from compute_indicators import compute_results, scan_tmy_files  # noqa: E402
+from pvgis_stub import synthetic_tmy  # noqa: E402
+from tmy_archive import append_member, open_archive, read_member  # noqa: E402
+
+N_FILES = 120
+PROCESSES = 8
+
+
+def _locations():
+    return [(40.0 + 0.011 * i, -3.0 - 0.017 * i) for i in range(N_FILES)]
+
+
+def _make_archive(archive):
+    contents = {}
+    for i, (lat, lon) in enumerate(_locations()):
+        name = "{:05d}.csv".format(i)
+        contents[name] = synthetic_tmy(lat, lon)
+        append_member(archive, name, contents[name])
+    return contents
+
+
+def _read(args):
+    archive, names = args
+    return [(name, read_member(archive, name)) for name in names]
+
+
+def test_read_member_after_fork(tmp_path):
+    """Los procesos creados tras abrir el archivo en el proceso principal leen bien los miembros"""
+    archive = str(tmp_path / "tmy.zip")
+    contents = _make_archive(archive)
+    # Abre el archivo en el proceso principal antes de crear los procesos
+    open_archive(archive)
+    with mp.get_context("fork").Pool(PROCESSES) as pool:
+        results = pool.map(_read, [(archive, list(contents))] * PROCESSES, chunksize=1)
+    for result in results:
+        for name, content in result:
+            assert content == contents[name]
+
+
+def test_compute_results_archive(tmp_path):
+    """compute_results con archivo comprimido y varios procesos no pone municipios en cuarentena"""
+    archive = str(tmp_path / "tmy.zip")
+    contents = _make_archive(archive)
+    locations = _locations()
+    df = pd.DataFrame(
+        {
+            "COD_INE": ["{:011d}".format(i) for i in range(N_FILES)],
+            "COD_PROV": "28",
+            "PROVINCIA": "Madrid",
+            "NOMBRE_ACTUAL": ["M{}".format(i) for i in range(N_FILES)],
+            "LONGITUD_ETRS89": [round(lon, 3) for _, lon in locations],
+            "LATITUD_ETRS89": [round(lat, 3) for lat, _ in locations],
+            "ALTITUD": 600.0,
+            "ARCHIVO_TMY": list(contents),
+        }
+    )
+    assert scan_tmy_files(df["ARCHIVO_TMY"], archive) == {}
+    quarantine = []
+    results = compute_results(
+        df,
+        PROCESSES,
+        archive,
+        coord_tol=1000.0,
+        compact=False,
+        pool=None,
+        verbose=False,
+        monthly=False,
+        chunksize=1,
+        quarantine=quarantine,
+    )
+    assert quarantine == []
+    assert len(results) == N_FILES